@@ -2,11 +2,27 @@ import os
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
+from sqlalchemy import event
 from config import Config
 
 # Inicializa as extensões sem vincular a uma aplicação específica ainda
 db = SQLAlchemy()
 
+def configure_sqlite(engine, busy_timeout_ms, wal=True):
+    """WAL (leituras não bloqueiam a escrita) e espera pelo bloqueio em vez de 'database is locked'."""
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA busy_timeout = {int(busy_timeout_ms)}")
+        if wal:
+            cursor.execute("PRAGMA journal_mode = WAL")
+            # Em WAL, NORMAL só sincroniza nos checkpoints e continua seguro contra corrupção
+            cursor.execute("PRAGMA synchronous = NORMAL")
+        cursor.close()
+
 def create_app(config_class=Config):
     """
     Cria e configura a aplicação Flask.
@@ -31,12 +47,37 @@ def create_app(config_class=Config):
     # Vincula a instância do banco de dados com a aplicação
     db.init_app(app)
 
+    # Acorda os streams de progresso (SSE) quando o pipeline grava um novo estado
+    from .progress import register_progress_events, configure_status_writer, configure_stream_limit
+    register_progress_events()
+    configure_status_writer(app.config['STATUS_FLUSH_INTERVAL'])
+    configure_stream_limit(app.config['PROGRESS_STREAM_MAX_CLIENTS'])
+
     # Importa e registra os blueprints (nossas rotas)
     from . import routes
     app.register_blueprint(routes.bp)
     
     with app.app_context():
+        configure_sqlite(db.engine, app.config['SQLITE_BUSY_TIMEOUT_MS'], wal=app.config['SQLITE_WAL'])
+
         # Cria as tabelas do banco de dados se não existirem
         db.create_all()
 
+        # Aplica as alterações às tabelas existentes (colunas e índices novos)
+        from .migrations import run_migrations
+        run_migrations()
+
+        # Preenche as estatísticas agregadas a partir de análises anteriores, se necessário
+        from .stats import ensure_batch_stats
+        ensure_batch_stats()
+
+        # Carrega o catálogo de modelos em segundo plano, para a primeira página não esperar pela API
+        from .catalogue import schedule_refresh
+        schedule_refresh()
+
+    # Inicia o pool de workers da fila de processamento neste processo
+    if app.config['WORKER_AUTOSTART']:
+        from .jobs import start_worker_pool
+        start_worker_pool(app)
+
     return app
\ No newline at end of file
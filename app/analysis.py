@@ -0,0 +1,264 @@
+import itertools
+import json
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from config import Config
+from .clients import get_gemini_model
+from .ratelimit import get_scheduler
+
+# Aproximação usada pelo estimador de tokens (caracteres por token em português)
+CHARS_PER_TOKEN = 4
+
+# --- PROMPTS ---
+
+AGENT_TASKS = """
+    **Tarefas dos Agentes:**
+    1.  **Agente de Identificação:** Identifique o "Operador" e o "Aluno". Se não for claro, use "Interveniente 1" e "Interveniente 2".
+    2.  **Agente de Resumo:** Crie um resumo executivo conciso da conversa.
+    3.  **Agente de Sentimento:** Analise o sentimento geral do Aluno ("Positivo", "Negativo", "Neutro").
+    4.  **Agente de Tópicos:** Qual é o tópico principal da conversa em 2-3 palavras?
+    5.  **Agente de Ação:** Identifique até 3 itens de ação claros. Se não houver, retorne uma lista vazia.
+"""
+
+# Versões das instruções dos agentes. Para alterar o prompt, acrescente uma versão nova em
+# vez de editar uma existente: cada análise guarda a versão usada e `/api/reprocess` volta a
+# analisar as transcrições guardadas com outra versão, para comparar os resultados.
+PROMPT_VERSIONS = {
+    'v1': AGENT_TASKS,
+}
+
+OUTPUT_SCHEMA = """{{
+      {id_field}"speaker_identification": {{"operator": "...", "student": "..."}},
+      "summary": "...",
+      "sentiment": "...",
+      "main_topic": "...",
+      "action_items": []
+    }}"""
+
+
+def resolve_prompt_version(prompt_version=None):
+    """Versão pedida (ou ANALYSIS_PROMPT_VERSION); ValueError se não existir."""
+    version = prompt_version or Config.ANALYSIS_PROMPT_VERSION
+    if version not in PROMPT_VERSIONS:
+        raise ValueError(f"Versão do prompt desconhecida: '{version}'. Disponíveis: {', '.join(PROMPT_VERSIONS)}.")
+    return version
+
+def build_single_prompt(transcript_text, prompt_version='v1'):
+    return f"""
+    Você é um sistema de múltiplos agentes de IA para análise de conversas. Analise a seguinte transcrição e retorne um objeto JSON.
+
+    **Transcrição:**
+    ---
+    {transcript_text}
+    ---
+{PROMPT_VERSIONS[prompt_version]}
+    **Formato de Saída Obrigatório (APENAS JSON):**
+    {OUTPUT_SCHEMA.format(id_field='')}
+    """
+
+def build_batch_prompt(items, prompt_version='v1'):
+    """Prompt com várias transcrições curtas; a resposta é um array JSON com um objeto por ID."""
+    transcripts = "\n".join(
+        f"""
+    **Transcrição ID {key}:**
+    ---
+    {text}
+    ---""" for key, text in items
+    )
+    return f"""
+    Você é um sistema de múltiplos agentes de IA para análise de conversas. Analise CADA uma das {len(items)} transcrições abaixo de forma independente.
+    {transcripts}
+{PROMPT_VERSIONS[prompt_version]}
+    **Formato de Saída Obrigatório (APENAS um array JSON, um objeto por transcrição, com o campo "id" igual ao ID da transcrição):**
+    [
+    {OUTPUT_SCHEMA.format(id_field='"id": "...", ')}
+    ]
+    """
+
+def build_chunk_prompt(chunk_text, index, total):
+    """Etapa 'map': notas de um trecho de uma transcrição longa."""
+    return f"""
+    Você está a analisar o trecho {index} de {total} de uma conversa longa entre um Operador e um Aluno.
+    Escreva notas objetivas (máximo de 200 palavras) com: quem fala em cada papel, os assuntos tratados,
+    o tom do Aluno e quaisquer compromissos ou próximos passos mencionados.
+
+    **Trecho:**
+    ---
+    {chunk_text}
+    ---
+    """
+
+def build_reduce_prompt(chunk_notes, prompt_version='v1'):
+    """Etapa 'reduce': combina as notas dos trechos no resultado final."""
+    notes = "\n".join(f"    **Notas do trecho {i}:** {note}" for i, note in enumerate(chunk_notes, 1))
+    return f"""
+    Você é um sistema de múltiplos agentes de IA para análise de conversas. A conversa era longa demais para ser
+    analisada de uma só vez; abaixo estão notas de cada trecho, por ordem. Analise a conversa completa a partir
+    delas e retorne um objeto JSON.
+
+{notes}
+{PROMPT_VERSIONS[prompt_version]}
+    **Formato de Saída Obrigatório (APENAS JSON):**
+    {OUTPUT_SCHEMA.format(id_field='')}
+    """
+
+
+# --- UTILITÁRIOS ---
+
+def estimate_tokens(text):
+    return len(text or "") // CHARS_PER_TOKEN + 1
+
+def _extract_json(text, open_char, close_char):
+    # Limpa o texto para garantir que é um JSON válido
+    json_text = text.strip()
+    start_index = json_text.find(open_char)
+    end_index = json_text.rfind(close_char) + 1
+    if start_index == -1 or end_index == 0:
+        raise ValueError("Nenhum JSON encontrado na resposta da IA.")
+    return json.loads(json_text[start_index:end_index])
+
+def _generate(prompt):
+    return get_scheduler('gemini').call(get_gemini_model().generate_content, prompt).text
+
+def split_transcript(text, max_tokens):
+    """Divide o texto em trechos de até `max_tokens`, preferindo quebras de linha."""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(len(text), start + max_chars)
+        if end < len(text):
+            newline = text.rfind("\n", start + max_chars // 2, end)
+            if newline != -1:
+                end = newline + 1
+        chunks.append(text[start:end])
+        start = end
+    return chunks
+
+
+# --- MODOS DE ANÁLISE ---
+
+def analyze_single(transcript_text, prompt_version='v1'):
+    return _extract_json(_generate(build_single_prompt(transcript_text, prompt_version)), '{', '}')
+
+def analyze_many(items, prompt_version='v1'):
+    """Analisa várias transcrições curtas num único pedido. Devolve {id: resultado}."""
+    if len(items) == 1:
+        key, text = items[0]
+        return {key: analyze_single(text, prompt_version)}
+
+    results = _extract_json(_generate(build_batch_prompt(items, prompt_version)), '[', ']')
+    by_key = {}
+    for result in results:
+        if isinstance(result, dict) and 'id' in result:
+            by_key[str(result.pop('id'))] = result
+    return {key: by_key[str(key)] for key, _ in items if str(key) in by_key}
+
+def analyze_long(transcript_text, chunk_tokens, prompt_version='v1', max_concurrency=4):
+    """Análise map-reduce: notas por trecho (em paralelo) e um pedido final que as combina."""
+    chunks = split_transcript(transcript_text, chunk_tokens)
+    print(f"Transcrição longa (~{estimate_tokens(transcript_text)} tokens) dividida em {len(chunks)} trechos para análise.")
+    prompts = [build_chunk_prompt(chunk, i, len(chunks)) for i, chunk in enumerate(chunks, 1)]
+    with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(prompts)))) as executor:
+        notes = [note.strip() for note in executor.map(_generate, prompts)]
+    return _extract_json(_generate(build_reduce_prompt(notes, prompt_version)), '{', '}')
+
+
+class AnalysisBatcher:
+    """Agrupa transcrições curtas submetidas por vários workers num único prompt.
+
+    Um lote é enviado quando atinge `max_items` ou `max_tokens`, ou `max_wait` segundos
+    depois da primeira submissão. Transcrições que não voltarem na resposta do lote
+    são analisadas individualmente. Há um agrupador por versão do prompt.
+    """
+
+    def __init__(self, max_items, max_tokens, max_wait, prompt_version='v1'):
+        self.prompt_version = prompt_version
+        self.max_items = max_items
+        self.max_tokens = max_tokens
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        self._pending = []
+        self._pending_tokens = 0
+        self._timer = None
+
+    def submit(self, key, text):
+        future = Future()
+        batch = None
+        with self._lock:
+            self._pending.append((str(key), text, future))
+            self._pending_tokens += estimate_tokens(text)
+            if len(self._pending) >= self.max_items or self._pending_tokens >= self.max_tokens:
+                batch = self._take_locked()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.max_wait, self._flush_from_timer)
+                self._timer.daemon = True
+                self._timer.start()
+        if batch:
+            self._run(batch)
+        return future
+
+    def _take_locked(self):
+        batch = self._pending
+        self._pending = []
+        self._pending_tokens = 0
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        return batch
+
+    def _flush_from_timer(self):
+        with self._lock:
+            self._timer = None
+            batch = self._take_locked() if self._pending else None
+        if batch:
+            self._run(batch)
+
+    def _run(self, batch):
+        try:
+            results = analyze_many([(key, text) for key, text, _ in batch], self.prompt_version)
+        except Exception as e:
+            print(f"AVISO: Falha na análise em lote ({len(batch)} transcrições); a analisar individualmente. Erro: {e}")
+            results = {}
+        for key, text, future in batch:
+            if key in results:
+                future.set_result(results[key])
+                continue
+            try:
+                future.set_result(analyze_single(text, self.prompt_version))
+            except Exception as e:
+                future.set_exception(e)
+
+
+_batchers = {} # versão do prompt -> AnalysisBatcher
+_batcher_lock = threading.Lock()
+_anonymous_keys = itertools.count(1)
+
+def get_batcher(prompt_version='v1'):
+    batcher = _batchers.get(prompt_version)
+    if batcher is None:
+        with _batcher_lock:
+            batcher = _batchers.get(prompt_version)
+            if batcher is None:
+                # Cada worker espera pelo seu resultado: um lote nunca junta mais itens
+                # do que há workers, pelo que não vale a pena esperar por mais do que isso
+                batcher = _batchers[prompt_version] = AnalysisBatcher(
+                    max_items=max(1, min(Config.GEMINI_BATCH_MAX_ITEMS, Config.WORKER_THREADS)),
+                    max_tokens=Config.GEMINI_BATCH_MAX_TOKENS,
+                    max_wait=Config.GEMINI_BATCH_MAX_WAIT,
+                    prompt_version=prompt_version
+                )
+    return batcher
+
+def analyze_transcript(transcript_text, key=None, prompt_version=None):
+    """Escolhe o modo de análise pelo tamanho estimado da transcrição."""
+    prompt_version = resolve_prompt_version(prompt_version)
+    tokens = estimate_tokens(transcript_text)
+    if tokens > Config.GEMINI_LONG_THRESHOLD_TOKENS:
+        return analyze_long(transcript_text, Config.GEMINI_CHUNK_TOKENS, prompt_version)
+    if Config.GEMINI_BATCHING and tokens <= Config.GEMINI_BATCH_ITEM_MAX_TOKENS:
+        if key is None:
+            key = f"anon-{next(_anonymous_keys)}"
+        return get_batcher(prompt_version).submit(key, transcript_text).result()
+    return analyze_single(transcript_text, prompt_version)
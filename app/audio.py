@@ -0,0 +1,126 @@
+import json
+import mimetypes
+import os
+import subprocess
+import tempfile
+import time
+
+# Formato alvo para modelos de fala: mono, 16 kHz
+TARGET_SAMPLE_RATE = 16000
+TARGET_CHANNELS = 1
+
+# Formatos de saída suportados: (extensão, codec ffprobe, argumentos ffmpeg, MIME)
+OUTPUT_FORMATS = {
+    'flac': ('.flac', 'flac', ['-c:a', 'flac', '-compression_level', '8'], 'audio/flac'),
+    'opus': ('.ogg', 'opus', ['-c:a', 'libopus', '-b:a', '24k', '-application', 'voip'], 'audio/ogg'),
+}
+
+# Remove o silêncio do início e, invertendo o áudio, também do fim
+TRIM_SILENCE_FILTER = (
+    "silenceremove=start_periods=1:start_threshold=-50dB:start_silence=0.2,"
+    "areverse,"
+    "silenceremove=start_periods=1:start_threshold=-50dB:start_silence=0.2,"
+    "areverse"
+)
+
+# MIME de ficheiros enviados sem conversão (o mimetypes nem sempre conhece todos)
+EXTRA_MIME_TYPES = {'.flac': 'audio/flac', '.ogg': 'audio/ogg', '.wav': 'audio/wav', '.mp3': 'audio/mpeg'}
+
+
+def guess_mime_type(path):
+    ext = os.path.splitext(path)[1].lower()
+    return EXTRA_MIME_TYPES.get(ext) or mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+def probe_audio(path):
+    """Lê codec, taxa de amostragem, canais e duração com o ffprobe. Devolve None se falhar."""
+    try:
+        result = subprocess.run(
+            ['ffprobe', '-v', 'error', '-select_streams', 'a:0',
+             '-show_entries', 'stream=codec_name,sample_rate,channels:format=duration',
+             '-of', 'json', path],
+            capture_output=True, text=True, timeout=30, check=True
+        )
+        info = json.loads(result.stdout)
+        stream = (info.get('streams') or [{}])[0]
+        return {
+            'codec': stream.get('codec_name'),
+            'sample_rate': int(stream.get('sample_rate') or 0),
+            'channels': int(stream.get('channels') or 0),
+            'duration': float(info.get('format', {}).get('duration') or 0)
+        }
+    except (OSError, subprocess.SubprocessError, ValueError) as e:
+        print(f"AVISO: Não foi possível analisar o áudio '{path}' com o ffprobe: {e}")
+        return None
+
+def preprocess_audio(path, content_hash, cache_folder, target_format='flac', trim_silence=False):
+    """Converte o áudio para mono 16 kHz no formato alvo antes do envio.
+
+    O resultado é guardado em `cache_folder` com o hash do conteúdo original no nome,
+    pelo que novas tentativas não voltam a converter (a cache é limpa por
+    `enforce_processed_retention`). Se o ficheiro já estiver no formato alvo, ou se o
+    ffmpeg falhar, devolve o original. Devolve (caminho, MIME).
+    """
+    ext, codec, codec_args, mime_type = OUTPUT_FORMATS[target_format]
+    suffix = '-trim' if trim_silence else ''
+    cached_path = os.path.join(cache_folder, f"{content_hash}-{target_format}{suffix}{ext}")
+    if os.path.exists(cached_path):
+        try:
+            os.utime(cached_path) # A retenção conta a partir do último uso
+            return cached_path, mime_type
+        except FileNotFoundError:
+            pass # Removido pela retenção entretanto: converte de novo
+
+    info = probe_audio(path)
+    if info is None:
+        return path, guess_mime_type(path)
+    if (not trim_silence and info['codec'] == codec and info['channels'] == TARGET_CHANNELS
+            and info['sample_rate'] == TARGET_SAMPLE_RATE):
+        return path, mime_type
+
+    os.makedirs(cache_folder, exist_ok=True)
+    # Temporário único por conversão (várias threads podem converter o mesmo áudio); o ffmpeg
+    # escolhe o formato pela extensão, que fica no fim
+    fd, temp_path = tempfile.mkstemp(dir=cache_folder, prefix=f"{content_hash}-", suffix=f".tmp{ext}")
+    os.close(fd)
+    command = ['ffmpeg', '-y', '-v', 'error', '-i', path, '-vn',
+               '-ac', str(TARGET_CHANNELS), '-ar', str(TARGET_SAMPLE_RATE)]
+    if trim_silence:
+        command += ['-af', TRIM_SILENCE_FILTER]
+    command += codec_args + [temp_path]
+
+    try:
+        subprocess.run(command, capture_output=True, timeout=600, check=True)
+        os.replace(temp_path, cached_path)
+    except (OSError, subprocess.SubprocessError) as e:
+        print(f"AVISO: Falha ao converter '{path}' com o ffmpeg; a enviar o original. Erro: {e}")
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        return path, guess_mime_type(path)
+
+    original_size = os.path.getsize(path)
+    processed_size = os.path.getsize(cached_path)
+    print(f"Áudio convertido para {target_format} mono {TARGET_SAMPLE_RATE} Hz: "
+          f"{original_size / 1024:.0f} KB -> {processed_size / 1024:.0f} KB")
+    return cached_path, mime_type
+
+def enforce_processed_retention(cache_folder, max_age_hours):
+    """Remove da cache o áudio convertido não usado há mais de `max_age_hours` horas (0 = nunca).
+
+    Inclui ficheiros temporários deixados por conversões interrompidas. Devolve
+    (ficheiros removidos, bytes libertados).
+    """
+    if not max_age_hours or not os.path.isdir(cache_folder):
+        return 0, 0
+    cutoff = time.time() - max_age_hours * 3600
+    removed, freed = 0, 0
+    for entry in os.scandir(cache_folder):
+        try:
+            stat = entry.stat()
+            if not entry.is_file() or stat.st_mtime >= cutoff:
+                continue
+            os.remove(entry.path)
+        except FileNotFoundError:
+            continue
+        removed += 1
+        freed += stat.st_size
+    return removed, freed
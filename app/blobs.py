@@ -0,0 +1,193 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+import zlib
+
+from config import Config
+
+# Armazém de conteúdos no disco, endereçado pelo SHA-256 (o mesmo conteúdo é guardado uma
+# só vez) e repartido em subpastas pelos primeiros carateres do hash:
+#   <BLOB_FOLDER>/<espaço>/ab/cd/abcd...<extensão>
+# O banco guarda apenas o hash. Espaços usados:
+#   * `uploads`: ficheiros enviados (áudio ou texto), mantidos para reprocessamento até
+#     BLOB_UPLOADS_MAX_BYTES / BLOB_UPLOADS_MAX_AGE_DAYS (os menos usados saem primeiro);
+#   * `transcripts`: textos das transcrições, comprimidos (zstd se `zstandard` estiver
+#     instalado, senão zlib), sem limite.
+# As escritas são atómicas (ficheiro temporário + rename), pelo que vários processos podem
+# partilhar a mesma pasta. Faça cópia de segurança desta pasta juntamente com o banco.
+
+UPLOADS = 'uploads'
+TRANSCRIPTS = 'transcripts'
+
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+# --- COMPRESSÃO ---
+
+def _zstd():
+    try:
+        import zstandard
+        return zstandard
+    except ImportError:
+        return None
+
+def compress(data):
+    zstandard = _zstd()
+    if zstandard is not None:
+        return zstandard.ZstdCompressor(level=Config.BLOB_ZSTD_LEVEL).compress(data)
+    return zlib.compress(data, 6)
+
+def decompress(data):
+    # O formato é reconhecido pelo cabeçalho: blobs zlib e zstd podem coexistir
+    if data[:4] == ZSTD_MAGIC:
+        zstandard = _zstd()
+        if zstandard is None:
+            raise RuntimeError("Este texto foi comprimido com zstd: instale o pacote `zstandard`.")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+# --- ARMAZÉM ---
+
+def blob_path(space, digest, ext=''):
+    return os.path.join(Config.BLOB_FOLDER, space, digest[:2], digest[2:4], digest + ext)
+
+def is_blob_path(path):
+    root = os.path.abspath(Config.BLOB_FOLDER) + os.sep
+    return os.path.abspath(path).startswith(root)
+
+def touch(path):
+    """Marca o blob como usado agora (a retenção remove primeiro os usados há mais tempo)."""
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        pass
+
+def _write_atomic(path, write):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            write(out)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+def store_file(source_path, digest, ext=''):
+    """Move um ficheiro (com o SHA-256 já calculado) para o espaço `uploads`; devolve o caminho.
+
+    Se o conteúdo já existir, o ficheiro novo é descartado e o existente é reaproveitado.
+    """
+    path = blob_path(UPLOADS, digest, ext.lower())
+    if os.path.exists(path):
+        os.remove(source_path)
+        touch(path)
+        return path
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    try:
+        os.replace(source_path, path)
+    except OSError:
+        # Outro sistema de ficheiros: copia para um temporário ao lado do destino
+        with open(source_path, 'rb') as src:
+            _write_atomic(path, lambda out: shutil.copyfileobj(src, out, COPY_CHUNK_SIZE))
+        os.remove(source_path)
+    return path
+
+def find_upload(digest, filename):
+    """Ficheiro enviado guardado no armazém, ou None (removido pela retenção ou anterior ao armazém)."""
+    if not digest:
+        return None
+    path = blob_path(UPLOADS, digest, os.path.splitext(filename)[1].lower())
+    return path if os.path.exists(path) else None
+
+def put_text(text):
+    """Grava um texto comprimido no espaço `transcripts`; devolve o SHA-256 do texto."""
+    data = text.encode('utf-8')
+    digest = hashlib.sha256(data).hexdigest()
+    path = blob_path(TRANSCRIPTS, digest)
+    if not os.path.exists(path):
+        compressed = compress(data)
+        _write_atomic(path, lambda out: out.write(compressed))
+    return digest
+
+def get_text(digest):
+    with open(blob_path(TRANSCRIPTS, digest), 'rb') as f:
+        return decompress(f.read()).decode('utf-8')
+
+
+# --- TRANSCRIÇÕES ---
+
+def save_transcript(transcription, text):
+    """Guarda o texto de uma transcrição no armazém; a linha fica só com a referência."""
+    transcription.transcript_blob = put_text(text) if text else None
+    transcription.transcript_text = None
+
+def load_transcript(transcription):
+    """Texto de uma transcrição (do armazém ou, em linhas antigas, da coluna `transcript_text`)."""
+    return read_transcript(transcription.transcript_blob, lambda: transcription.transcript_text)
+
+def save_analysis_input(transcription, text):
+    """Guarda o texto simples dado à análise (sem a formatação do diálogo), para a reanálise."""
+    transcription.analysis_input_blob = put_text(text) if text else None
+
+def load_analysis_input(transcription):
+    """Texto simples guardado para a análise; None em linhas anteriores a esta coluna."""
+    return read_transcript(transcription.analysis_input_blob) if transcription.analysis_input_blob else None
+
+def read_transcript(digest, legacy_text=None):
+    if digest:
+        try:
+            return get_text(digest)
+        except FileNotFoundError:
+            print(f"AVISO: Texto {digest} não encontrado no armazém ({Config.BLOB_FOLDER}).")
+            return None
+    return legacy_text() if callable(legacy_text) else legacy_text
+
+
+# --- RETENÇÃO ---
+
+def _list_uploads():
+    root = os.path.join(Config.BLOB_FOLDER, UPLOADS)
+    entries = []
+    for directory, _, names in os.walk(root):
+        for name in names:
+            if name.startswith('.tmp-'):
+                continue
+            path = os.path.join(directory, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+    return entries
+
+def enforce_upload_retention(max_bytes, max_age_days, in_use=()):
+    """Remove ficheiros enviados expirados e, acima de `max_bytes`, os usados há mais tempo.
+
+    `in_use` são caminhos com jobs por terminar, que nunca são removidos. Devolve
+    (ficheiros removidos, bytes libertados).
+    """
+    entries = sorted(_list_uploads())
+    in_use = {os.path.abspath(path) for path in in_use}
+    total = sum(size for _, size, _ in entries)
+    cutoff = time.time() - max_age_days * 86400 if max_age_days else None
+    removed, freed = 0, 0
+    for mtime, size, path in entries:
+        expired = cutoff is not None and mtime < cutoff
+        if not expired and (not max_bytes or total <= max_bytes):
+            break
+        if os.path.abspath(path) in in_use:
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed += 1
+        freed += size
+    return removed, freed
@@ -0,0 +1,99 @@
+import hashlib
+import threading
+
+from .metrics import CACHE_LOOKUPS
+from .models import db, Transcription, Analysis, ActionItem, add_analysis_version
+from .blobs import save_transcript
+from .segments import copy_segments
+
+# Tamanho dos blocos usados ao gravar/calcular o hash dos uploads
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Contadores de acertos/falhas da cache por modelo (por processo)
+_stats_lock = threading.Lock()
+_stats = {}
+
+
+def save_and_hash(file_storage, destination):
+    """Grava um upload em disco calculando o SHA-256 na mesma passagem."""
+    sha256 = hashlib.sha256()
+    file_storage.stream.seek(0)
+    with open(destination, 'wb') as out:
+        while True:
+            chunk = file_storage.stream.read(HASH_CHUNK_SIZE)
+            if not chunk:
+                break
+            sha256.update(chunk)
+            out.write(chunk)
+    return sha256.hexdigest()
+
+def hash_file(path):
+    """Calcula o SHA-256 de um ficheiro já gravado em disco."""
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+def cache_key_model(file_type, model_id):
+    """O resultado de um ficheiro de texto não depende do modelo de transcrição."""
+    return None if file_type == 'text' else model_id
+
+def find_cached_result(audio_hash, model_id, prompt_version, exclude_id=None):
+    """Procura uma transcrição concluída com o mesmo conteúdo, modelo e versão do prompt.
+
+    Com `model_id=None` (ficheiros de texto) a chave é apenas o hash e a versão do prompt.
+    """
+    if not audio_hash:
+        return None
+    query = Transcription.query\
+        .join(Analysis, Transcription.id == Analysis.transcription_id)\
+        .filter(Transcription.audio_hash == audio_hash, Transcription.status == 'Concluído',
+                Analysis.is_current, Analysis.prompt_version == prompt_version)
+    if model_id is not None:
+        query = query.filter(Transcription.model_id == model_id)
+    if exclude_id is not None:
+        query = query.filter(Transcription.id != exclude_id)
+    return query.order_by(Transcription.id.desc()).first()
+
+def copy_cached_result(source, target):
+    """Reaproveita a transcrição e a análise de `source` em `target`, como nova versão (sem commit)."""
+    if source.transcript_blob:
+        target.transcript_blob = source.transcript_blob # O mesmo texto no armazém: só a referência é copiada
+    else:
+        save_transcript(target, source.transcript_text)
+    target.analysis_input_blob = source.analysis_input_blob
+    copy_segments(source.id, target.id)
+    analysis = source.analysis
+    add_analysis_version(target, Analysis(
+        sentiment=analysis.sentiment,
+        topic=analysis.topic,
+        summary=analysis.summary,
+        operator_label=analysis.operator_label,
+        student_label=analysis.student_label,
+        analysis_data=analysis.analysis_data,
+        prompt_version=analysis.prompt_version,
+        model_id=target.model_id, # Texto: a chave ignora o modelo, mas a versão é do pedido atual
+        transcript_blob=target.transcript_blob,
+        action_items=[ActionItem(position=item.position, text=item.text) for item in analysis.action_items]
+    ))
+
+def record_lookup(model_id, hit):
+    CACHE_LOOKUPS.inc(model_id=model_id or 'text', result='hit' if hit else 'miss')
+    with _stats_lock:
+        entry = _stats.setdefault(model_id or 'text', {'hits': 0, 'misses': 0})
+        entry['hits' if hit else 'misses'] += 1
+
+def get_cache_stats():
+    """Devolve os contadores de acertos/falhas (totais e por modelo) deste processo."""
+    with _stats_lock:
+        by_model = {model: dict(counts) for model, counts in _stats.items()}
+    hits = sum(c['hits'] for c in by_model.values())
+    misses = sum(c['misses'] for c in by_model.values())
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / total, 4) if total else 0.0,
+        'by_model': by_model
+    }
@@ -0,0 +1,121 @@
+import threading
+from datetime import datetime, timedelta
+
+import requests
+from flask import current_app
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+
+from config import Config
+from .clients import get_http_session, http_request_max_seconds
+from .models import db, CachedValue
+
+# Catálogo de modelos de transcrição, guardado na tabela `cached_values` e partilhado por
+# todos os processos (workers do gunicorn e `worker.py`).
+#
+# Os pedidos nunca esperam pela API externa: servem o valor guardado, mesmo expirado
+# (stale-while-revalidate), e a renovação corre numa thread em segundo plano. Uma falha
+# da API também fica registada (cache negativa), para que a renovação não seja repetida
+# a cada pedido enquanto a API estiver em baixo.
+
+CATALOGUE_KEY = 'transcription_models'
+# Modelos servidos localmente (sempre disponíveis, mesmo sem a API)
+LOCAL_MODELS = ['google_chirp']
+
+_refresh_lock = threading.Lock()
+_refreshing = False
+
+
+def fetch_models(timeout):
+    """Consulta a API externa (bloqueante) e acrescenta os modelos locais."""
+    response = get_http_session().get(f"{Config.PUBLIC_URL_API}/models", timeout=timeout)
+    response.raise_for_status()
+    # Garante que os modelos locais não sejam duplicados
+    api_models = [m for m in response.json().get('available_models', []) if m not in LOCAL_MODELS]
+    return api_models + LOCAL_MODELS
+
+def get_available_models():
+    """Modelos disponíveis, sem bloquear: o valor em cache ou, se ainda não houver, só os locais."""
+    entry = db.session.get(CachedValue, CATALOGUE_KEY)
+    if entry is None or entry.expires_at <= datetime.utcnow():
+        schedule_refresh()
+    if entry is None or not entry.value:
+        return list(LOCAL_MODELS)
+    return list(entry.value)
+
+
+# --- RENOVAÇÃO ---
+
+def _claim_refresh(now):
+    """Reserva a renovação entre processos; falso se o valor está válido ou outro processo já a faz.
+
+    A reserva dura o máximo que o pedido à API pode demorar (com as tentativas de ligação):
+    antes disso, outro processo não a retoma enquanto a primeira ainda pode gravar.
+    """
+    lease_start = now - timedelta(seconds=http_request_max_seconds(Config.MODEL_CATALOGUE_TIMEOUT))
+    claimed = CachedValue.query.filter(
+        CachedValue.key == CATALOGUE_KEY,
+        CachedValue.expires_at <= now,
+        or_(CachedValue.refresh_started_at.is_(None), CachedValue.refresh_started_at < lease_start)
+    ).update({CachedValue.refresh_started_at: now}, synchronize_session=False)
+    if claimed:
+        db.session.commit()
+        return True
+    if db.session.query(CachedValue.key).filter_by(key=CATALOGUE_KEY).first() is not None:
+        db.session.rollback()
+        return False
+    try:
+        db.session.add(CachedValue(key=CATALOGUE_KEY, expires_at=now, refresh_started_at=now))
+        db.session.commit()
+        return True
+    except IntegrityError:
+        db.session.rollback()
+        return False
+
+def refresh_models():
+    """Consulta a API e grava o resultado (ou a falha). Devolve a lista, ou None se não renovou."""
+    if not _claim_refresh(datetime.utcnow()):
+        return None
+    models, error = None, None
+    try:
+        models = fetch_models(Config.MODEL_CATALOGUE_TIMEOUT)
+    except (requests.exceptions.RequestException, ValueError) as e:
+        error = str(e)
+        print(f"AVISO: Não foi possível contactar a API de transcrição. Erro: {e}")
+
+    now = datetime.utcnow()
+    entry = db.session.get(CachedValue, CATALOGUE_KEY)
+    entry.refresh_started_at = None
+    if models is None:
+        # Mantém a última lista conhecida; só volta a tentar depois do TTL negativo
+        entry.last_error = error
+        entry.expires_at = now + timedelta(seconds=Config.MODEL_CATALOGUE_NEGATIVE_TTL)
+    else:
+        entry.value = models
+        entry.fetched_at = now
+        entry.last_error = None
+        entry.expires_at = now + timedelta(seconds=Config.MODEL_CATALOGUE_TTL)
+    db.session.commit()
+    return models
+
+def _refresh_in_background(app):
+    global _refreshing
+    try:
+        with app.app_context():
+            refresh_models()
+    except Exception as e:
+        print(f"AVISO: Falha ao renovar o catálogo de modelos. Erro: {e}")
+    finally:
+        with _refresh_lock:
+            _refreshing = False
+
+def schedule_refresh():
+    """Renova o catálogo numa thread (no máximo uma por processo). Requer contexto da aplicação."""
+    global _refreshing
+    with _refresh_lock:
+        if _refreshing:
+            return False
+        _refreshing = True
+    app = current_app._get_current_object()
+    threading.Thread(target=_refresh_in_background, args=(app,), name='model-catalogue', daemon=True).start()
+    return True
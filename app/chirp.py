@@ -0,0 +1,262 @@
+import io
+import math
+import time
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from .clients import get_speech_client, get_speech_types
+from .segments import build_segments, format_dialogue
+
+# librosa, soundfile e o SDK Speech só são importados nas funções que tratam áudio real ou
+# falam com o Chirp: a junção dos resultados e o `FakeRecognizer` funcionam sem eles
+
+# Palavra reconhecida; tempos em segundos relativos ao início do bloco enviado
+Word = namedtuple('Word', ['word', 'start', 'end', 'speaker'])
+
+# Resultado de um bloco: palavras com diarização e o texto simples (fallback sem palavras)
+ChunkResult = namedtuple('ChunkResult', ['words', 'transcript'])
+
+# Bloco de áudio: [start, end) em segundos é o trecho enviado; [keep_start, end) é o trecho
+# cujas palavras entram no resultado final (o resto é sobreposição com o bloco anterior)
+Chunk = namedtuple('Chunk', ['index', 'start', 'end', 'keep_start'])
+
+# Taxa de amostragem usada no envio (suficiente para modelos de fala)
+TARGET_SAMPLE_RATE = 16000
+
+
+# --- RECONHECEDORES ---
+
+class ChirpRecognizer:
+    """Envia um bloco de áudio para o Google Chirp (Speech-to-Text v2)."""
+
+    def __init__(self, project_id, client=None, scheduler=None):
+        self.client = client or get_speech_client() # Cliente partilhado pelo processo
+        # Scheduler do provedor (limite de taxa, concorrência adaptativa e retries)
+        self.scheduler = scheduler
+        self.recognizer_path = f"projects/{project_id}/locations/global/recognizers/_"
+        self.speech = get_speech_types() # SDK Speech, ou os tipos simulados com FAKE_PROVIDERS
+        self.config = self.speech.RecognitionConfig(
+            auto_decoding_config={}, model="chirp", language_codes=["pt-BR"],
+            features=self.speech.RecognitionFeatures(
+                enable_automatic_punctuation=True, enable_speaker_diarization=True,
+                min_speaker_count=1, max_speaker_count=2
+            ),
+        )
+
+    def recognize(self, content, chunk):
+        audio = self.speech.RecognitionAudio(content=content)
+        request_chirp = self.speech.RecognizeRequest(config=self.config, audio=audio, recognizer=self.recognizer_path)
+        if self.scheduler is not None:
+            response = self.scheduler.call(self.client.recognize, request=request_chirp)
+        else:
+            response = self.client.recognize(request=request_chirp)
+        if not response.results:
+            return ChunkResult([], "")
+
+        transcript = " ".join(r.alternatives[0].transcript for r in response.results if r.alternatives).strip()
+        word_lists = [list(r.alternatives[0].words) for r in response.results if r.alternatives and r.alternatives[0].words]
+        if not word_lists:
+            return ChunkResult([], transcript)
+        # Cada resultado traz as palavras do seu trecho; em algumas versões da API, com
+        # diarização, o último repete todas as anteriores (começa onde o primeiro começa)
+        if (len(word_lists) > 1 and len(word_lists[-1]) >= sum(len(ws) for ws in word_lists[:-1])
+                and _seconds(word_lists[-1][0].start_offset) <= _seconds(word_lists[0][0].start_offset)):
+            word_lists = word_lists[-1:]
+
+        words = [
+            Word(
+                w.word,
+                _seconds(w.start_offset),
+                _seconds(w.end_offset),
+                getattr(w, 'speaker_label', None) or getattr(w, 'speaker', None)
+            )
+            for ws in word_lists for w in ws
+        ]
+        return ChunkResult(words, transcript)
+
+
+class FakeRecognizer:
+    """Reconhecedor local para testes: gera palavras espaçadas uniformemente em cada bloco.
+
+    O interveniente alterna a cada `words_per_turn` palavras, com base no tempo absoluto,
+    para que a continuidade dos rótulos entre blocos possa ser verificada.
+    """
+
+    def __init__(self, words_per_second=2.0, words_per_turn=10, latency=0.0, relabel=False):
+        self.words_per_second = words_per_second
+        self.words_per_turn = words_per_turn
+        self.latency = latency
+        # Com relabel, os blocos ímpares trocam os rótulos (como a diarização real entre pedidos)
+        self.relabel = relabel
+        self.calls = 0
+
+    def recognize(self, content, chunk):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        words = []
+        step = 1.0 / self.words_per_second
+        n = math.ceil(chunk.start * self.words_per_second)
+        while n * step < chunk.end:
+            turn = (n // self.words_per_turn) % 2
+            if self.relabel and chunk.index % 2 == 1:
+                turn = 1 - turn
+            start = n * step - chunk.start
+            words.append(Word(f"w{n}", start, start + step / 2, str(turn + 1)))
+            n += 1
+        return ChunkResult(words, " ".join(w.word for w in words))
+
+
+def _seconds(offset):
+    if offset is None:
+        return 0.0
+    if hasattr(offset, 'total_seconds'):
+        return offset.total_seconds()
+    return offset.seconds + offset.nanos / 1e9
+
+
+# --- DIVISÃO DO ÁUDIO ---
+
+def plan_chunks(samples, sample_rate, max_chunk_seconds, overlap_seconds, top_db=35, min_chunk_seconds=None):
+    """Divide o áudio em blocos de até `max_chunk_seconds`, cortando preferencialmente em silêncio.
+
+    Cada bloco (exceto o primeiro) começa `overlap_seconds` antes do corte, para que as
+    palavras junto ao limite e os rótulos dos intervenientes possam ser alinhados.
+    """
+    total = len(samples) / sample_rate
+    if total <= max_chunk_seconds:
+        return [Chunk(0, 0.0, total, 0.0)]
+
+    import librosa
+
+    if min_chunk_seconds is None:
+        min_chunk_seconds = max_chunk_seconds / 2
+
+    # Pontos de corte candidatos: o meio de cada trecho de silêncio
+    voiced = librosa.effects.split(samples, top_db=top_db)
+    cut_points = [
+        (voiced[i][1] + voiced[i + 1][0]) / 2 / sample_rate
+        for i in range(len(voiced) - 1)
+    ]
+
+    chunks = []
+    cursor = 0.0
+    next_cut = 0
+    while cursor < total:
+        limit = cursor + max_chunk_seconds
+        if limit >= total:
+            end = total
+        else:
+            end = limit
+            while next_cut < len(cut_points) and cut_points[next_cut] <= limit:
+                if cut_points[next_cut] >= cursor + min_chunk_seconds:
+                    end = cut_points[next_cut]
+                next_cut += 1
+        start = max(0.0, cursor - overlap_seconds) if chunks else 0.0
+        chunks.append(Chunk(len(chunks), start, end, cursor))
+        cursor = end
+    return chunks
+
+def encode_chunk(samples, sample_rate, chunk):
+    """Codifica o trecho do bloco como WAV PCM 16-bit em memória."""
+    import soundfile
+    buffer = io.BytesIO()
+    segment = samples[int(chunk.start * sample_rate):int(chunk.end * sample_rate)]
+    soundfile.write(buffer, segment, sample_rate, format='WAV', subtype='PCM_16')
+    return buffer.getvalue()
+
+
+# --- JUNÇÃO DOS RESULTADOS ---
+
+def _map_speakers(overlap_words, previous_words):
+    """Associa os rótulos locais de um bloco aos rótulos globais pelo alinhamento na sobreposição."""
+    votes = Counter()
+    j = 0
+    for word in overlap_words:
+        # Ambas as listas estão ordenadas por tempo: procura a palavra anterior mais próxima
+        while j + 1 < len(previous_words) and abs(previous_words[j + 1][0] - word[0]) <= abs(previous_words[j][0] - word[0]):
+            j += 1
+        if previous_words and abs(previous_words[j][0] - word[0]) <= 0.5:
+            votes[(word[1], previous_words[j][1])] += 1
+
+    mapping = {}
+    taken = set()
+    for (local, global_label), _ in votes.most_common():
+        if local not in mapping and global_label not in taken:
+            mapping[local] = global_label
+            taken.add(global_label)
+    return mapping
+
+def stitch_chunks(chunks, results):
+    """Junta os resultados dos blocos num único diálogo com rótulos de intervenientes consistentes.
+
+    Devolve (diálogo formatado, texto simples para análise, segmentos com tempos absolutos).
+    """
+    all_words = []       # (início absoluto, rótulo global, palavra, fim absoluto)
+    previous = []        # palavras do bloco anterior, com rótulo global, para alinhamento
+    global_order = []    # rótulos globais por ordem de aparição
+    plain_parts = []
+
+    for chunk, result in zip(chunks, results):
+        if not result.words:
+            if result.transcript:
+                plain_parts.append(result.transcript)
+            previous = []
+            continue
+
+        absolute = [(chunk.start + w.start, w.speaker, w.word, chunk.start + w.end) for w in result.words]
+        overlap = [(t, label) for t, label, _, _ in absolute if t < chunk.keep_start]
+        mapping = _map_speakers(overlap, [(t, label) for t, label, _, _ in previous])
+
+        # Rótulos locais sem correspondência recebem um rótulo global livre, ou um novo
+        for _, label, _, _ in absolute:
+            if label in mapping:
+                continue
+            free = [g for g in global_order if g not in mapping.values()]
+            if free:
+                mapping[label] = free[0]
+            else:
+                mapping[label] = str(len(global_order) + 1)
+            if mapping[label] not in global_order:
+                global_order.append(mapping[label])
+
+        mapped = [(t, mapping[label], word, end) for t, label, word, end in absolute]
+        kept = [w for w in mapped if w[0] >= chunk.keep_start]
+        all_words.extend(kept)
+        plain_parts.append(" ".join(w[2] for w in kept))
+        previous = mapped
+
+    analysis_input = " ".join(p for p in plain_parts if p).strip()
+    if not all_words:
+        return analysis_input, analysis_input, []
+
+    # Segmentos e diálogo montados numa só passagem (sem concatenação repetida de strings)
+    segments = build_segments(Word(word, start, end, speaker) for start, speaker, word, end in all_words)
+    return format_dialogue(segments), analysis_input, segments
+
+
+# --- ORQUESTRAÇÃO ---
+
+def transcribe_long_audio(file_path, recognizer, max_chunk_seconds=50, overlap_seconds=2,
+                          max_concurrency=4, top_db=35, on_progress=None):
+    """Transcreve um ficheiro de áudio em blocos paralelos e junta o resultado.
+
+    `on_progress(concluídos, total)` é chamado na thread que invocou esta função.
+    """
+    import librosa
+    samples, sample_rate = librosa.load(file_path, sr=TARGET_SAMPLE_RATE, mono=True)
+    chunks = plan_chunks(samples, sample_rate, max_chunk_seconds, overlap_seconds, top_db)
+    print(f"Áudio de {len(samples) / sample_rate:.1f}s dividido em {len(chunks)} blocos para o Chirp.")
+
+    def recognize_chunk(chunk):
+        return recognizer.recognize(encode_chunk(samples, sample_rate, chunk), chunk)
+
+    results = [None] * len(chunks)
+    with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(chunks)))) as executor:
+        futures = {executor.submit(recognize_chunk, chunk): i for i, chunk in enumerate(chunks)}
+        for done, future in enumerate(as_completed(futures), 1):
+            results[futures[future]] = future.result()
+            if on_progress:
+                on_progress(done, len(chunks))
+
+    return stitch_chunks(chunks, results)
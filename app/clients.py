@@ -0,0 +1,123 @@
+import atexit
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from config import Config
+
+# Registo dos clientes de serviços externos, criados uma vez por processo e partilhados
+# por todas as threads: a sessão HTTP (keep-alive, pool de ligações) para a API de
+# transcrição e os clientes Google (Speech e Gemini), que são thread-safe.
+# São fechados à saída do processo; depois de um fork, o processo filho cria os seus.
+# Os SDKs da Google são importados apenas quando o respetivo cliente é criado.
+# Com FAKE_PROVIDERS, os clientes Google são substituídos pelos simulados de `fakes.py`.
+
+# Fator de backoff do urllib3 entre tentativas de ligação da sessão HTTP
+HTTP_RETRY_BACKOFF = 0.2
+
+_lock = threading.Lock()
+_clients = {}
+_pid = None
+
+
+def _get_or_create(name, factory):
+    global _pid
+    client = _clients.get(name)
+    if client is not None and _pid == os.getpid():
+        return client
+    with _lock:
+        if _pid != os.getpid():
+            # Ligações herdadas de um fork não podem ser partilhadas com o processo pai
+            _clients.clear()
+            _pid = os.getpid()
+        if name not in _clients:
+            _clients[name] = factory()
+        return _clients[name]
+
+
+# --- FÁBRICAS ---
+
+def http_request_max_seconds(timeout):
+    """Duração máxima de um pedido pela sessão partilhada com `timeout` (tentativas e backoff incluídos).
+
+    Cada tentativa pode esperar `timeout` pela ligação e a última também pela resposta;
+    o urllib3 só espera entre tentativas a partir do segundo erro seguido.
+    """
+    retries = Config.HTTP_CONNECT_RETRIES
+    backoff = sum(HTTP_RETRY_BACKOFF * 2 ** (n - 1) for n in range(2, retries + 1))
+    return timeout * (retries + 2) + backoff
+
+def _create_http_session():
+    # Só se repetem falhas de ligação (o pedido não chegou a sair); erros HTTP e timeouts
+    # de leitura ficam para o scheduler do provedor, que já faz retries com backoff
+    retries = Retry(total=Config.HTTP_CONNECT_RETRIES, connect=Config.HTTP_CONNECT_RETRIES,
+                    read=0, status=0, redirect=3, backoff_factor=HTTP_RETRY_BACKOFF, raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=Config.HTTP_POOL_MAXSIZE, max_retries=retries)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+def _create_speech_client():
+    if Config.FAKE_PROVIDERS:
+        from .fakes import FakeSpeechClient
+        return FakeSpeechClient(latency=Config.FAKE_PROVIDER_LATENCY)
+    from google.cloud import speech
+    return speech.SpeechClient()
+
+def _create_gemini_model():
+    if Config.FAKE_PROVIDERS:
+        from .fakes import FakeGeminiModel
+        return FakeGeminiModel(latency=Config.FAKE_PROVIDER_LATENCY)
+    # A Vertex AI só é inicializada quando a primeira análise precisa dela
+    import vertexai
+    from vertexai.generative_models import GenerativeModel
+    try:
+        vertexai.init(project=Config.PROJECT_ID, location=Config.LOCATION)
+        print("Vertex AI inicializado com sucesso.")
+    except Exception as e:
+        print(f"AVISO: Não foi possível inicializar a Vertex AI. Verifique a autenticação gcloud. Erro: {e}")
+    return GenerativeModel(Config.GEMINI_MODEL)
+
+
+# --- ACESSO ---
+
+def get_http_session():
+    """`requests.Session` partilhada (keep-alive) para a API de transcrição externa."""
+    return _get_or_create('http', _create_http_session)
+
+def get_speech_types():
+    """Tipos dos pedidos Speech: `google.cloud.speech` ou, com FAKE_PROVIDERS, os simulados (sem o SDK)."""
+    if Config.FAKE_PROVIDERS:
+        from .fakes import FAKE_SPEECH_TYPES
+        return FAKE_SPEECH_TYPES
+    from google.cloud import speech
+    return speech
+
+def get_speech_client():
+    """Cliente Speech-to-Text partilhado (gRPC, com o seu próprio canal persistente)."""
+    return _get_or_create('speech', _create_speech_client)
+
+def get_gemini_model():
+    """Instância única do modelo Gemini, reutilizada entre chamadas e threads."""
+    return _get_or_create('gemini', _create_gemini_model)
+
+def close_clients():
+    """Fecha as ligações abertas por este processo (chamado à saída)."""
+    with _lock:
+        clients = dict(_clients) if _pid == os.getpid() else {}
+        _clients.clear()
+    session = clients.get('http')
+    if session is not None:
+        session.close()
+    speech_client = clients.get('speech')
+    if speech_client is not None:
+        try:
+            speech_client.transport.close()
+        except Exception as e:
+            print(f"AVISO: Falha ao fechar o cliente Speech. Erro: {e}")
+
+atexit.register(close_clients)
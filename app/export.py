@@ -0,0 +1,183 @@
+import csv
+import io
+import json
+import os
+import tempfile
+from datetime import datetime, timedelta
+
+from .models import db, Batch, Transcription, Analysis, ActionItem
+
+# Exportação das análises concluídas em streaming: as linhas são lidas do banco por blocos de ID
+# e escritas à medida que chegam, pelo que a memória usada não depende do número de análises
+# exportadas.
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'jsonl': ('application/x-ndjson; charset=utf-8', 'jsonl'),
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx'),
+}
+
+# O prompt pede até 3 itens de ação; itens a mais são juntados na última coluna
+MAX_ACTION_ITEMS = 3
+
+COLUMNS = [
+    'id', 'batch_id', 'batch_name', 'filename', 'upload_date', 'model_id',
+    'sentiment', 'topic', 'summary', 'operator', 'student',
+] + [f'action_item_{i}' for i in range(1, MAX_ACTION_ITEMS + 1)]
+
+# Limite de linhas de uma folha do Excel (incluindo o cabeçalho)
+XLSX_MAX_ROWS = 1048576
+FILE_CHUNK_SIZE = 64 * 1024
+
+
+def parse_date(value, field):
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        raise ValueError(f"Data inválida em '{field}' (use AAAA-MM-DD).")
+
+
+# --- LEITURA E ACHATAMENTO ---
+
+def flatten_analysis(row, action_items):
+    """Converte uma linha (transcrição + análise) e os seus itens de ação nas colunas de `COLUMNS`."""
+    action_items = list(action_items)
+    if len(action_items) > MAX_ACTION_ITEMS:
+        action_items[MAX_ACTION_ITEMS - 1:] = ["; ".join(action_items[MAX_ACTION_ITEMS - 1:])]
+
+    flat = {
+        'id': row.id,
+        'batch_id': row.batch_id,
+        'batch_name': row.batch_name,
+        'filename': row.filename,
+        'upload_date': row.upload_date.isoformat() + 'Z' if row.upload_date else None,
+        'model_id': row.model_id,
+        'sentiment': row.sentiment,
+        'topic': row.topic,
+        'summary': row.summary,
+        'operator': row.operator_label,
+        'student': row.student_label,
+    }
+    for i in range(MAX_ACTION_ITEMS):
+        flat[f'action_item_{i + 1}'] = action_items[i] if i < len(action_items) else None
+    return flat
+
+def iter_analyses(batch_id=None, date_from=None, date_to=None, chunk_size=1000):
+    """Percorre as análises concluídas por ordem de ID, `chunk_size` linhas de cada vez.
+
+    Os blocos são lidos por ID (keyset); os itens de ação de cada bloco vêm numa única consulta.
+    """
+    query = db.session.query(
+        Transcription.id,
+        Transcription.batch_id,
+        Batch.name.label('batch_name'),
+        Transcription.filename,
+        Transcription.upload_date,
+        Transcription.model_id,
+        Analysis.id.label('analysis_id'),
+        Analysis.sentiment,
+        Analysis.topic,
+        Analysis.summary,
+        Analysis.operator_label,
+        Analysis.student_label
+    ).join(Analysis, Transcription.id == Analysis.transcription_id)\
+     .join(Batch, Transcription.batch_id == Batch.id)\
+     .filter(Transcription.status == 'Concluído', Analysis.is_current)
+
+    if batch_id is not None:
+        query = query.filter(Transcription.batch_id == batch_id)
+    if date_from is not None:
+        query = query.filter(Transcription.upload_date >= date_from)
+    if date_to is not None:
+        # Data final inclusiva
+        query = query.filter(Transcription.upload_date < date_to + timedelta(days=1))
+
+    try:
+        last_id = 0
+        while True:
+            rows = query.filter(Transcription.id > last_id).order_by(Transcription.id).limit(chunk_size).all()
+            if not rows:
+                break
+            action_items = {}
+            for analysis_id, item_text in db.session.query(ActionItem.analysis_id, ActionItem.text)\
+                    .filter(ActionItem.analysis_id.in_([row.analysis_id for row in rows]))\
+                    .order_by(ActionItem.analysis_id, ActionItem.position):
+                action_items.setdefault(analysis_id, []).append(item_text)
+            for row in rows:
+                yield flatten_analysis(row, action_items.get(row.analysis_id, []))
+            last_id = rows[-1].id
+    finally:
+        db.session.remove()
+
+
+# --- ESCRITORES ---
+
+def stream_csv(rows, flush_every=500):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=COLUMNS, extrasaction='ignore')
+    # BOM: o Excel só reconhece UTF-8 (acentos) num CSV com ele
+    buffer.write('\ufeff')
+    writer.writeheader()
+    for count, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if count % flush_every == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+def stream_jsonl(rows, flush_every=500):
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(row, ensure_ascii=False))
+        if len(lines) >= flush_every:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+def stream_xlsx(rows):
+    """Escreve o XLSX em modo `constant_memory` num ficheiro temporário e envia-o por blocos.
+
+    O formato é um ZIP que só fica completo no fim, por isso não pode ser enviado antes
+    de escrito; em `constant_memory` o XlsxWriter mantém em memória apenas a linha atual.
+    """
+    import xlsxwriter
+
+    fd, path = tempfile.mkstemp(suffix='.xlsx')
+    os.close(fd)
+    try:
+        workbook = xlsxwriter.Workbook(path, {'constant_memory': True, 'strings_to_urls': False})
+        header_format = workbook.add_format({'bold': True})
+        sheet, row_index, sheet_count = None, XLSX_MAX_ROWS, 0
+        for row in rows:
+            if row_index >= XLSX_MAX_ROWS:
+                sheet_count += 1
+                sheet = workbook.add_worksheet(f"Análises {sheet_count}" if sheet_count > 1 else "Análises")
+                sheet.write_row(0, 0, COLUMNS, header_format)
+                row_index = 1
+            sheet.write_row(row_index, 0, [row[column] for column in COLUMNS])
+            row_index += 1
+        if sheet is None:
+            workbook.add_worksheet("Análises").write_row(0, 0, COLUMNS, header_format)
+        workbook.close()
+
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(FILE_CHUNK_SIZE), b''):
+                yield chunk
+    finally:
+        os.remove(path)
+
+WRITERS = {'csv': stream_csv, 'jsonl': stream_jsonl, 'xlsx': stream_xlsx}
+
+def export_analyses(export_format, batch_id=None, date_from=None, date_to=None, chunk_size=1000):
+    """Devolve (gerador de blocos, mimetype, nome do ficheiro) para a exportação pedida."""
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Formato de exportação inválido. Use: {', '.join(EXPORT_FORMATS)}.")
+    mimetype, extension = EXPORT_FORMATS[export_format]
+    scope = f"lote-{batch_id}" if batch_id is not None else "todas"
+    filename = f"analises-{scope}-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.{extension}"
+    rows = iter_analyses(batch_id, date_from, date_to, chunk_size)
+    return WRITERS[export_format](rows), mimetype, filename
@@ -0,0 +1,234 @@
+import argparse
+import hashlib
+import json
+import threading
+import time
+import uuid
+from datetime import timedelta
+from email import policy
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from urllib.parse import urlparse, parse_qs
+
+# Substitutos locais dos provedores externos, para benchmarks e desenvolvimento sem
+# credenciais: a API de transcrição (servidor HTTP com /models e /jobs), o cliente
+# Speech (Chirp) e o modelo Gemini. Com FAKE_PROVIDERS=true, `clients.py` devolve os
+# clientes daqui; a API é apontada por PUBLIC_URL_API (`python -m app.fakes --port 8000`).
+# As respostas são determinísticas (derivadas do conteúdo recebido) e cada pedido
+# demora a latência configurada.
+
+SENTIMENTS = ['Positivo', 'Negativo', 'Neutro']
+TOPICS = ['Pagamento', 'Matrícula', 'Acesso à plataforma', 'Certificado', 'Cancelamento']
+OPERATORS = ['Ana', 'Bruno', 'Carla', 'Diogo']
+
+# Bytes por segundo do áudio enviado pelo Chirp (WAV PCM 16 bits, mono, 16 kHz)
+WAV_BYTES_PER_SECOND = 16000 * 2
+WAV_HEADER_BYTES = 44
+
+
+def _digest(text):
+    return int(hashlib.sha256(text.encode('utf-8', 'replace')).hexdigest()[:8], 16)
+
+def fake_analysis(text):
+    """Resultado de análise (esquema do prompt) derivado do texto recebido."""
+    n = _digest(text)
+    return {
+        'speaker_identification': {'operator': OPERATORS[n % len(OPERATORS)], 'student': 'Aluno'},
+        'summary': f"Resumo simulado ({len(text)} caracteres).",
+        'sentiment': SENTIMENTS[n % len(SENTIMENTS)],
+        'main_topic': TOPICS[n % len(TOPICS)],
+        'action_items': [f"Ação simulada {i + 1}" for i in range(n % 4)]
+    }
+
+
+# --- GEMINI ---
+
+class FakeGeminiModel:
+    """Imita `GenerativeModel.generate_content` para os prompts de `analysis.py`."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def generate_content(self, prompt):
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if 'Você está a analisar o trecho' in prompt:
+            text = f"Notas simuladas do trecho ({len(prompt)} caracteres)."
+        elif '**Transcrição ID ' in prompt:
+            items = []
+            for part in prompt.split('**Transcrição ID ')[1:]:
+                key, _, body = part.partition(':**')
+                items.append(dict(fake_analysis(body.split('---')[1] if '---' in body else body), id=key))
+            text = json.dumps(items, ensure_ascii=False)
+        else:
+            text = json.dumps(fake_analysis(prompt), ensure_ascii=False)
+        return SimpleNamespace(text=text)
+
+
+# --- SPEECH (CHIRP) ---
+
+# Substitutos dos tipos de `google.cloud.speech` usados em `ChirpRecognizer` (só argumentos nomeados)
+FAKE_SPEECH_TYPES = SimpleNamespace(
+    RecognitionConfig=SimpleNamespace,
+    RecognitionFeatures=SimpleNamespace,
+    RecognitionAudio=SimpleNamespace,
+    RecognizeRequest=SimpleNamespace,
+)
+
+class FakeSpeechClient:
+    """Imita `SpeechClient.recognize`: palavras espaçadas uniformemente, com diarização.
+
+    A duração do bloco é calculada pelo tamanho do WAV enviado; o interveniente alterna
+    a cada `words_per_turn` palavras.
+    """
+
+    def __init__(self, latency=0.0, words_per_second=2.0, words_per_turn=10):
+        self.latency = latency
+        self.words_per_second = words_per_second
+        self.words_per_turn = words_per_turn
+        self.transport = SimpleNamespace(close=lambda: None)
+
+    def recognize(self, request=None):
+        if self.latency:
+            time.sleep(self.latency)
+        content = request.audio.content
+        seconds = max(0, len(content) - WAV_HEADER_BYTES) / WAV_BYTES_PER_SECOND
+        step = 1.0 / self.words_per_second
+        words = []
+        for n in range(int(seconds * self.words_per_second)):
+            speaker = str((n // self.words_per_turn) % 2 + 1)
+            words.append(SimpleNamespace(word=f"palavra{n}", start_offset=timedelta(seconds=n * step),
+                                         end_offset=timedelta(seconds=n * step + step / 2), speaker_label=speaker))
+        if not words:
+            return SimpleNamespace(results=[])
+        alternative = SimpleNamespace(transcript=" ".join(w.word for w in words), words=words)
+        return SimpleNamespace(results=[SimpleNamespace(alternatives=[alternative])])
+
+
+# --- API DE TRANSCRIÇÃO ---
+
+class FakeJobsApi(ThreadingHTTPServer):
+    """Servidor HTTP com os endpoints da API de transcrição usados pela aplicação.
+
+    Cada job fica concluído `job_seconds` depois de criado (o progresso cresce de forma
+    linear) e todos os pedidos demoram `latency` segundos.
+    """
+    daemon_threads = True
+
+    def __init__(self, port=0, latency=0.0, job_seconds=1.0, models=('whisper-large-v3', 'whisper-medium')):
+        super().__init__(('127.0.0.1', port), FakeJobsApiHandler)
+        self.latency = latency
+        self.job_seconds = job_seconds
+        self.models = list(models)
+        self.jobs = {}
+        self.jobs_lock = threading.Lock()
+        self.requests = 0
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True, name='fake-jobs-api').start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def _parse_multipart(content_type, body):
+    """Campos de um corpo multipart/form-data: {nome: (nome do ficheiro, bytes)}."""
+    message = BytesParser(policy=policy.HTTP).parsebytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode('latin-1') + body)
+    fields = {}
+    for part in message.iter_parts():
+        name = part.get_param('name', header='content-disposition')
+        fields[name] = (part.get_filename(), part.get_payload(decode=True) or b'')
+    return fields
+
+
+class FakeJobsApiHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1' # Keep-alive, como a API real
+    disable_nagle_algorithm = True # Sem isto, as respostas em keep-alive esperam ~40 ms pelo ACK atrasado
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type='application/json'):
+        data = (json.dumps(body, ensure_ascii=False) if content_type == 'application/json' else body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', f"{content_type}; charset=utf-8")
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _begin(self):
+        with self.server.jobs_lock:
+            self.server.requests += 1
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        return urlparse(self.path)
+
+    def do_GET(self):
+        url = self._begin()
+        parts = url.path.strip('/').split('/')
+        if parts == ['models']:
+            return self._send(200, {'available_models': self.server.models})
+        if len(parts) >= 2 and parts[0] == 'jobs':
+            with self.server.jobs_lock:
+                job = self.server.jobs.get(parts[1])
+            if job is None:
+                return self._send(404, {'detail': 'Job not found'})
+            elapsed = time.monotonic() - job['created']
+            done = elapsed >= self.server.job_seconds
+            if len(parts) == 2:
+                progress = 100 if done else int(elapsed * 100 / self.server.job_seconds)
+                return self._send(200, {'job_id': parts[1], 'status': 'completed' if done else 'processing', 'progress': progress})
+            if parts[2:] == ['download'] and done:
+                text_type = parse_qs(url.query).get('text_type', ['transcription_raw'])[0]
+                text = f"Transcrição simulada de {job['filename']} ({job['size']} bytes, modelo {job['model_id']})."
+                if text_type == 'transcription_dialogue_markdown':
+                    text = f"**Interveniente 1:** {text}\n\n**Interveniente 2:** Obrigado."
+                return self._send(200, text, 'text/plain')
+        self._send(404, {'detail': 'Not found'})
+
+    def do_POST(self):
+        url = self._begin()
+        if url.path.rstrip('/') != '/jobs':
+            return self._send(404, {'detail': 'Not found'})
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        fields = _parse_multipart(self.headers.get('Content-Type', ''), body)
+        filename, content = fields.get('files', (None, b''))
+        job_id = uuid.uuid4().hex
+        with self.server.jobs_lock:
+            self.server.jobs[job_id] = {
+                'created': time.monotonic(),
+                'filename': filename,
+                'size': len(content),
+                'model_id': (fields.get('model_id', (None, b''))[1] or b'').decode('utf-8')
+            }
+        self._send(200, {'jobs_created': [{'job_id': job_id}]})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="API de transcrição simulada (para benchmarks e desenvolvimento).")
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--job-seconds', type=float, default=2.0)
+    args = parser.parse_args()
+    server = FakeJobsApi(args.port, args.latency, args.job_seconds)
+    print(f"API de transcrição simulada em {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
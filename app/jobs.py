@@ -0,0 +1,341 @@
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+
+from .models import db, Job, Transcription, Upload
+from .poller import ApiJobPoller
+from .progress import set_status, flush_status_updates
+from .search import remove_from_index
+from .blobs import enforce_upload_retention
+from .uploads import upload_write_lock, discard_upload
+from .audio import enforce_processed_retention
+
+# Identificador deste processo na tabela de jobs (host:pid)
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+# Pool ativo neste processo (se existir), usado para acordar os workers após um enqueue
+_pool = None
+
+
+# --- OPERAÇÕES SOBRE A FILA ---
+
+def enqueue_job(transcription_id, file_path, filename, file_type, model_id, force=False, profile=False,
+                stage=Job.STAGE_PROCESS, prompt_version=None, reprocess=False):
+    """Adiciona um job à sessão atual. O commit fica a cargo de quem chama."""
+    job = Job(
+        transcription_id=transcription_id,
+        file_path=file_path,
+        filename=filename,
+        file_type=file_type,
+        model_id=model_id,
+        force=force,
+        profile=profile,
+        stage=stage,
+        prompt_version=prompt_version,
+        reprocess=reprocess
+    )
+    db.session.add(job)
+    return job
+
+def notify_workers():
+    """Acorda os workers locais (chamar depois do commit dos novos jobs)."""
+    if _pool is not None:
+        _pool.wake()
+
+def claim_next_job(worker_id=WORKER_ID, reprocess_limit=0):
+    """Reserva atomicamente o próximo job pendente. Seguro entre processos.
+
+    Com `reprocess_limit`, jobs de reprocessamento só são reservados enquanto houver menos
+    do que isso em execução (limite aproximado: dois workers podem passá-lo ao mesmo tempo).
+    """
+    for _ in range(5):
+        candidates = db.session.query(Job.id).filter(Job.status == Job.PENDING)
+        if reprocess_limit:
+            running = db.session.query(Job.id).filter(Job.status == Job.RUNNING, Job.reprocess).count()
+            if running >= reprocess_limit:
+                candidates = candidates.filter(Job.reprocess.is_(False))
+        candidate_id = candidates.order_by(Job.id).limit(1).scalar()
+        if candidate_id is None:
+            return None
+
+        now = datetime.utcnow()
+        claimed = Job.query.filter(Job.id == candidate_id, Job.status == Job.PENDING).update({
+            Job.status: Job.RUNNING,
+            Job.worker_id: worker_id,
+            Job.attempts: Job.attempts + 1,
+            Job.started_at: now,
+            Job.heartbeat_at: now
+        }, synchronize_session=False)
+        db.session.commit()
+        if claimed:
+            return db.session.get(Job, candidate_id)
+        # Outro worker ganhou a corrida; tenta o seguinte
+    return None
+
+def mark_job_waiting(job_id, transcription_id, external_job_id):
+    """Liberta o worker: o job fica à espera da API externa, acompanhado pelo poller."""
+    Job.query.filter_by(id=job_id).update({
+        Job.status: Job.WAITING,
+        Job.heartbeat_at: datetime.utcnow()
+    }, synchronize_session=False)
+    db.session.commit()
+    if _pool is not None:
+        _pool.poller.track(job_id, transcription_id, external_job_id)
+
+def finish_job(job_id, error=None):
+    """Marca o job como concluído ou falhado."""
+    job = db.session.get(Job, job_id)
+    if not job:
+        return
+    job.status = Job.FAILED if error else Job.DONE
+    job.last_error = error
+    job.finished_at = datetime.utcnow()
+    db.session.commit()
+
+def heartbeat(worker_id=WORKER_ID):
+    """Renova a posse dos jobs em execução ou em espera por este processo."""
+    Job.query.filter(Job.status.in_([Job.RUNNING, Job.WAITING]), Job.worker_id == worker_id)\
+        .update({Job.heartbeat_at: datetime.utcnow()}, synchronize_session=False)
+    db.session.commit()
+
+def requeue_stale_jobs(lease_seconds, max_attempts):
+    """Devolve à fila jobs cujo worker deixou de dar sinal (ex.: reinício do servidor)."""
+    cutoff = datetime.utcnow() - timedelta(seconds=lease_seconds)
+    stale_jobs = Job.query.filter(Job.status == Job.RUNNING, Job.heartbeat_at < cutoff).all()
+    requeued = 0
+    for job in stale_jobs:
+        if job.attempts >= max_attempts:
+            job.status = Job.FAILED
+            job.finished_at = datetime.utcnow()
+            job.last_error = "Número máximo de tentativas excedido."
+            transcription = db.session.get(Transcription, job.transcription_id)
+            if transcription and job.reprocess and _restore_current_version(transcription):
+                continue
+            if transcription:
+                set_status(transcription, "Erro no pipeline: número máximo de tentativas excedido.")
+                remove_from_index(transcription.id)
+        else:
+            job.status = Job.PENDING
+            job.worker_id = None
+            requeued += 1
+    db.session.commit()
+    return requeued
+
+def _restore_current_version(transcription):
+    # Import local para evitar import circular (services importa este módulo)
+    from .services import restore_current_version
+    return restore_current_version(transcription)
+
+def adopt_waiting_jobs(lease_seconds, worker_id=WORKER_ID):
+    """Assume jobs em espera na API externa cujo processo dono deixou de dar sinal.
+
+    Devolve tuplos (job_id, transcription_id, external_job_id) para o poller local.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=lease_seconds)
+    stale_ids = [row.id for row in db.session.query(Job.id)
+                 .filter(Job.status == Job.WAITING, Job.heartbeat_at < cutoff)]
+    adopted = []
+    for job_id in stale_ids:
+        claimed = Job.query.filter(Job.id == job_id, Job.status == Job.WAITING, Job.heartbeat_at < cutoff)\
+            .update({Job.worker_id: worker_id, Job.heartbeat_at: datetime.utcnow()}, synchronize_session=False)
+        if claimed:
+            adopted.append(job_id)
+    db.session.commit()
+
+    if not adopted:
+        return []
+    rows = db.session.query(Job.id, Job.transcription_id, Transcription.external_job_id)\
+        .join(Transcription, Job.transcription_id == Transcription.id)\
+        .filter(Job.id.in_(adopted)).all()
+    return [tuple(row) for row in rows if row.external_job_id]
+
+def recover_orphan_transcriptions():
+    """Marca como erro transcrições pendentes que não têm nenhum job ativo associado.
+
+    Cobre linhas criadas antes da existência da fila persistente, para as quais
+    não há informação suficiente (modelo, tipo de ficheiro) para retomar. Uploads por
+    blocos ainda em curso não têm job até à finalização e ficam de fora.
+    """
+    active_jobs = db.session.query(Job.transcription_id)\
+        .filter(Job.status.in_([Job.PENDING, Job.RUNNING, Job.WAITING]))
+    open_uploads = db.session.query(Upload.transcription_id).filter(Upload.completed_at.is_(None))
+    orphans = Transcription.query.filter(
+        Transcription.status != 'Concluído',
+        ~Transcription.status.startswith('Erro'),
+        ~Transcription.id.in_(active_jobs),
+        ~Transcription.id.in_(open_uploads)
+    ).all()
+    for transcription in orphans:
+        set_status(transcription, "Erro no pipeline: processamento interrompido. Reenvie o ficheiro.")
+    db.session.commit()
+    return len(orphans)
+
+def expire_abandoned_uploads(ttl_hours):
+    """Descarta uploads por blocos sem blocos novos há mais de `ttl_hours` horas (0 = nunca).
+
+    A transcrição passa a erro (o stream do lote chega ao fim) e o ficheiro parcial é apagado.
+    """
+    if not ttl_hours:
+        return 0
+    cutoff = datetime.utcnow() - timedelta(hours=ttl_hours)
+    stale_ids = [row.id for row in db.session.query(Upload.id)
+                 .filter(Upload.completed_at.is_(None), Upload.updated_at < cutoff)]
+    db.session.commit()
+    expired = 0
+    for upload_id in stale_ids:
+        # Com o lock da gravação: um bloco pode estar a chegar agora
+        with upload_write_lock(upload_id):
+            upload = db.session.get(Upload, upload_id, populate_existing=True)
+            if upload is None or upload.completed_at is not None or upload.updated_at >= cutoff:
+                continue
+            set_status(upload.transcription, "Erro no upload: envio interrompido. Reenvie o ficheiro.")
+            discard_upload(upload)
+            db.session.commit()
+        expired += 1
+    if expired:
+        print(f"Uploads abandonados: {expired} descartados (sem blocos há mais de {ttl_hours:g} h).")
+    return expired
+
+def enforce_blob_retention(max_bytes, max_age_days):
+    """Aplica a retenção dos ficheiros enviados, sem tocar nos de jobs por terminar."""
+    in_use = [row.file_path for row in db.session.query(Job.file_path)
+              .filter(Job.status.in_([Job.PENDING, Job.RUNNING, Job.WAITING]))]
+    db.session.commit()
+    removed, freed = enforce_upload_retention(max_bytes, max_age_days, in_use)
+    if removed:
+        print(f"Retenção do armazém: {removed} ficheiros enviados removidos ({freed / 1024 ** 2:.1f} MB).")
+    return removed
+
+def enforce_processed_audio_retention(cache_folder, max_age_hours):
+    """Limpa a cache de áudio pré-processado (ver `audio.py`)."""
+    removed, freed = enforce_processed_retention(cache_folder, max_age_hours)
+    if removed:
+        print(f"Retenção do áudio pré-processado: {removed} ficheiros removidos ({freed / 1024 ** 2:.1f} MB).")
+    return removed
+
+
+# --- POOL DE WORKERS ---
+
+class WorkerPool:
+    """Pool limitado de threads que consome a tabela `jobs`."""
+
+    def __init__(self, app, num_threads, poll_interval, lease_seconds, max_attempts, reprocess_limit=0):
+        self.app = app
+        self.num_threads = max(1, num_threads)
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.reprocess_limit = reprocess_limit
+        self._wake_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._threads = []
+        self.poller = ApiJobPoller(
+            app,
+            min_interval=app.config['API_POLL_MIN_INTERVAL'],
+            max_interval=app.config['API_POLL_MAX_INTERVAL'],
+            backoff=app.config['API_POLL_BACKOFF'],
+            max_errors=app.config['API_POLL_MAX_ERRORS'],
+            on_completed=self.wake
+        )
+
+    def start(self):
+        self.poller.start()
+        with self.app.app_context():
+            requeued = requeue_stale_jobs(self.lease_seconds, self.max_attempts)
+            orphans = recover_orphan_transcriptions()
+            self._adopt_waiting_jobs()
+        if requeued or orphans:
+            print(f"Recuperação da fila: {requeued} jobs devolvidos à fila, {orphans} transcrições órfãs marcadas com erro.")
+
+        for i in range(self.num_threads):
+            thread = threading.Thread(target=self._run_worker, name=f"pipeline-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+        monitor = threading.Thread(target=self._run_monitor, name="pipeline-monitor", daemon=True)
+        monitor.start()
+        self._threads.append(monitor)
+        print(f"Pool de workers iniciado com {self.num_threads} threads ({WORKER_ID}).")
+
+    def stop(self, timeout=5):
+        self._stop_event.set()
+        self._wake_event.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self.poller.stop(timeout)
+
+    def wake(self):
+        self._wake_event.set()
+
+    def _run_worker(self):
+        # Import local para evitar import circular (services importa este módulo)
+        from .services import run_job
+
+        while not self._stop_event.is_set():
+            try:
+                with self.app.app_context():
+                    job = claim_next_job(reprocess_limit=self.reprocess_limit)
+                    if job is None:
+                        job_id = None
+                    else:
+                        job_id = job.id
+                        run_job(job)
+            except Exception as e:
+                print(f"ERRO no worker da fila: {e}")
+                job_id = None
+
+            if job_id is None:
+                # Fila vazia: espera por uma notificação local ou pelo próximo ciclo de polling
+                self._wake_event.wait(self.poll_interval)
+                self._wake_event.clear()
+
+    def _adopt_waiting_jobs(self):
+        for job_id, transcription_id, external_job_id in adopt_waiting_jobs(self.lease_seconds):
+            self.poller.track(job_id, transcription_id, external_job_id)
+
+    def _run_monitor(self):
+        interval = max(1, self.lease_seconds // 3)
+        next_retention = time.monotonic()
+        while not self._stop_event.wait(interval):
+            try:
+                with self.app.app_context():
+                    heartbeat()
+                    if requeue_stale_jobs(self.lease_seconds, self.max_attempts):
+                        self.wake()
+                    self._adopt_waiting_jobs()
+                    if time.monotonic() >= next_retention:
+                        next_retention = time.monotonic() + self.app.config['BLOB_RETENTION_INTERVAL']
+                        enforce_blob_retention(self.app.config['BLOB_UPLOADS_MAX_BYTES'],
+                                               self.app.config['BLOB_UPLOADS_MAX_AGE_DAYS'])
+                        enforce_processed_audio_retention(self.app.config['PROCESSED_AUDIO_FOLDER'],
+                                                          self.app.config['PROCESSED_AUDIO_MAX_AGE_HOURS'])
+                        expire_abandoned_uploads(self.app.config['UPLOAD_TTL_HOURS'])
+            except Exception as e:
+                print(f"ERRO no monitor da fila: {e}")
+
+
+def start_worker_pool(app):
+    """Inicia o pool de workers deste processo (idempotente)."""
+    global _pool
+    if _pool is not None:
+        return _pool
+    _pool = WorkerPool(
+        app,
+        num_threads=app.config['WORKER_THREADS'],
+        poll_interval=app.config['WORKER_POLL_INTERVAL'],
+        lease_seconds=app.config['JOB_LEASE_SECONDS'],
+        max_attempts=app.config['JOB_MAX_ATTEMPTS'],
+        reprocess_limit=app.config['REPROCESS_MAX_CONCURRENCY']
+    )
+    _pool.start()
+    return _pool
+
+def stop_worker_pool():
+    global _pool
+    if _pool is not None:
+        _pool.stop()
+        with _pool.app.app_context():
+            flush_status_updates() # Progresso ainda em memória
+        _pool = None
@@ -0,0 +1,140 @@
+import bisect
+import threading
+
+# Métricas do processo (contadores, histogramas e gauges com etiquetas), expostas em
+# formato de texto do Prometheus em `/metrics`. Cada processo tem as suas: com vários
+# workers do gunicorn ou processos `worker.py`, o Prometheus deve recolher cada um
+# (ver WORKER_METRICS_PORT) e somar no servidor.
+
+# Limites (segundos) dos histogramas de latência: de chamadas rápidas a transcrições longas
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + (list(extra.items()) if extra else [])
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+def _format_number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.label_names)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+            lines.extend(self._render_items(items))
+        return lines
+
+    def _render_items(self, items):
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_number(value)}" for key, value in items]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def replace(self, values):
+        """Substitui todos os valores (lista de (etiquetas, valor)); usado nas leituras feitas na recolha."""
+        with self._lock:
+            self._values = {self._key(labels): value for labels, value in values}
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def _render_items(self, items):
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.label_names, key, {'le': _format_number(bound)})
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {round(total, 6)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+# --- MÉTRICAS DA APLICAÇÃO ---
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    'pipeline_stage_seconds', "Duração de cada etapa do pipeline.", ['stage', 'provider', 'model_id']))
+STAGE_TOTAL = REGISTRY.register(Counter(
+    'pipeline_stage_total', "Etapas do pipeline executadas, por resultado.", ['stage', 'provider', 'model_id', 'outcome']))
+PROVIDER_REQUEST_SECONDS = REGISTRY.register(Histogram(
+    'provider_request_seconds', "Latência de cada chamada a um provedor externo (por tentativa).", ['provider']))
+PROVIDER_REQUESTS = REGISTRY.register(Counter(
+    'provider_requests_total', "Chamadas a provedores externos, por resultado (ok, throttled, transient, permanent).", ['provider', 'outcome']))
+CACHE_LOOKUPS = REGISTRY.register(Counter(
+    'content_cache_lookups_total', "Consultas à cache por conteúdo, por modelo e resultado.", ['model_id', 'result']))
+JOBS = REGISTRY.register(Gauge(
+    'pipeline_jobs', "Jobs na fila persistente por estado (lidos do banco na recolha).", ['status']))
+PROVIDER_CONCURRENCY = REGISTRY.register(Gauge(
+    'provider_concurrency_limit', "Limite atual de pedidos simultâneos (AIMD) por provedor.", ['provider']))
+PROVIDER_IN_FLIGHT = REGISTRY.register(Gauge(
+    'provider_in_flight', "Pedidos em curso por provedor.", ['provider']))
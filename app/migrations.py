@@ -0,0 +1,256 @@
+import json
+from datetime import datetime
+
+from sqlalchemy import MetaData, bindparam, inspect, text
+from sqlalchemy.schema import CreateTable
+from sqlalchemy.exc import IntegrityError
+
+from .models import db, SchemaMigration, Transcription, Analysis, ActionItem, analysis_columns
+from .search import create_search_index, rebuild_search_index, make_search_index_contentless
+from .blobs import put_text
+
+# Migrações do esquema, aplicadas por ordem em `create_app` depois de `db.create_all()`.
+#
+# `create_all` cria as tabelas novas já com todas as colunas e índices, mas não altera
+# tabelas existentes; as migrações cobrem essas alterações. Cada operação verifica o
+# estado atual antes de agir, pelo que uma base de dados nova (ou uma em que o SQL foi
+# aplicado à mão, como no antigo SQLite.sql) apenas regista a versão.
+#
+# Os tipos usados são aceites tanto pelo SQLite como pelo PostgreSQL.
+
+
+# --- OPERAÇÕES ---
+
+def add_column(table, column, ddl):
+    """ALTER TABLE ... ADD COLUMN, se a coluna ainda não existir.
+
+    `ddl` pode ser um dicionário por dialeto, com 'default' para os restantes.
+    """
+    def run(conn):
+        if column in {c['name'] for c in inspect(conn).get_columns(table)}:
+            return
+        preparer = conn.dialect.identifier_preparer
+        column_ddl = ddl.get(conn.dialect.name, ddl['default']) if isinstance(ddl, dict) else ddl
+        conn.execute(text(f"ALTER TABLE {preparer.quote(table)} ADD COLUMN {preparer.quote(column)} {column_ddl}"))
+    return run
+
+def create_index(name, table, columns, unique=False, where=None):
+    """CREATE INDEX IF NOT EXISTS; `where` cria um índice parcial (SQLite e PostgreSQL)."""
+    def run(conn):
+        preparer = conn.dialect.identifier_preparer
+        cols = ", ".join(preparer.quote(c) for c in columns)
+        kind = "UNIQUE INDEX" if unique else "INDEX"
+        condition = f" WHERE {where}" if where else ""
+        conn.execute(text(f"CREATE {kind} IF NOT EXISTS {preparer.quote(name)} ON {preparer.quote(table)} ({cols}){condition}"))
+    return run
+
+def drop_unique(table, column):
+    """Remove a restrição UNIQUE de uma coluna, se existir.
+
+    O SQLite não permite remover restrições: a tabela é recriada a partir do modelo (com as
+    chaves estrangeiras desligadas, o padrão do SQLite, as tabelas que a referenciam não são
+    afetadas) e os índices do modelo são criados de novo.
+    """
+    def run(conn):
+        inspector = inspect(conn)
+        constraints = [c for c in inspector.get_unique_constraints(table) if c['column_names'] == [column]]
+        if conn.dialect.name != 'sqlite':
+            for constraint in constraints:
+                conn.execute(text(f"ALTER TABLE {conn.dialect.identifier_preparer.quote(table)} "
+                                  f"DROP CONSTRAINT {conn.dialect.identifier_preparer.quote(constraint['name'])}"))
+            return
+        if not constraints:
+            return
+        model = db.metadata.tables[table]
+        metadata = MetaData()
+        for foreign_key in model.foreign_keys:
+            foreign_key.column.table.to_metadata(metadata) # Tabelas referenciadas, para compilar as FKs
+        rebuilt = model.to_metadata(metadata, name=f"{table}_rebuild")
+        for index in list(rebuilt.indexes):
+            rebuilt.indexes.discard(index) # Os nomes dos índices ainda estão em uso na tabela antiga
+        existing = {c['name'] for c in inspector.get_columns(table)}
+        columns = ", ".join(c.name for c in model.columns if c.name in existing)
+        conn.execute(CreateTable(rebuilt))
+        conn.execute(text(f"INSERT INTO {table}_rebuild ({columns}) SELECT {columns} FROM {table}"))
+        conn.execute(text(f"DROP TABLE {table}"))
+        conn.execute(text(f"ALTER TABLE {table}_rebuild RENAME TO {table}"))
+        for index in model.indexes:
+            index.create(conn, checkfirst=True)
+    return run
+
+def drop_index(name):
+    def run(conn):
+        conn.execute(text(f"DROP INDEX IF EXISTS {conn.dialect.identifier_preparer.quote(name)}"))
+    return run
+
+def execute(sql):
+    """SQL arbitrário; deve poder ser repetido sem efeitos (ex.: UPDATE ... WHERE ... IS NULL)."""
+    def run(conn):
+        conn.execute(text(sql))
+    return run
+
+
+# --- MIGRAÇÕES DE DADOS ---
+
+def backfill_analysis_columns(conn, chunk_size=1000):
+    """Preenche as colunas estruturadas e os itens de ação a partir de `full_analysis_json`."""
+    analyses, action_items = Analysis.__table__, ActionItem.__table__
+    update = analyses.update().where(analyses.c.id == bindparam('b_id')).values(
+        operator_label=bindparam('b_operator_label'),
+        student_label=bindparam('b_student_label'),
+        analysis_data=bindparam('b_analysis_data', type_=analyses.c.analysis_data.type)
+    )
+    last_id = 0
+    while True:
+        rows = conn.execute(text("""
+            SELECT id, full_analysis_json FROM analyses
+            WHERE id > :last_id AND analysis_data IS NULL AND full_analysis_json IS NOT NULL
+            ORDER BY id LIMIT :limit"""), {'last_id': last_id, 'limit': chunk_size}).all()
+        if not rows:
+            break
+        updates, items = [], []
+        for analysis_id, raw in rows:
+            try:
+                result = json.loads(raw)
+            except ValueError:
+                continue
+            if not isinstance(result, dict):
+                continue
+            columns, texts = analysis_columns(result)
+            updates.append({'b_id': analysis_id, 'b_operator_label': columns['operator_label'],
+                            'b_student_label': columns['student_label'], 'b_analysis_data': result})
+            items.extend({'analysis_id': analysis_id, 'position': i, 'text': item} for i, item in enumerate(texts))
+        if updates:
+            conn.execute(action_items.delete().where(action_items.c.analysis_id.in_([u['b_id'] for u in updates])))
+            conn.execute(update, updates)
+        if items:
+            conn.execute(action_items.insert(), items)
+        last_id = rows[-1][0]
+
+
+def move_transcripts_to_blobs(conn, chunk_size=500):
+    """Move os textos das transcrições para o armazém comprimido, deixando só a referência."""
+    transcriptions = Transcription.__table__
+    update = transcriptions.update().where(transcriptions.c.id == bindparam('b_id'))\
+        .values(transcript_blob=bindparam('b_blob'), transcript_text=None)
+    last_id = 0
+    while True:
+        rows = conn.execute(text("""
+            SELECT id, transcript_text FROM transcriptions
+            WHERE id > :last_id AND transcript_blob IS NULL AND transcript_text IS NOT NULL
+            ORDER BY id LIMIT :limit"""), {'last_id': last_id, 'limit': chunk_size}).all()
+        if not rows:
+            break
+        conn.execute(update, [{'b_id': row_id, 'b_blob': put_text(body)} for row_id, body in rows])
+        last_id = rows[-1][0]
+
+
+# --- HISTÓRICO ---
+
+MIGRATIONS = [
+    (1, "Hash SHA-256 do conteúdo", [
+        add_column('transcriptions', 'audio_hash', 'VARCHAR(64)'),
+    ]),
+    (2, "ID do job na API de transcrição externa", [
+        add_column('transcriptions', 'external_job_id', 'VARCHAR(100)'),
+    ]),
+    (3, "Etapa de (re)entrada dos jobs", [
+        add_column('jobs', 'stage', "VARCHAR(20) NOT NULL DEFAULT 'process'"),
+    ]),
+    (4, "Modelo de transcrição na chave da cache", [
+        add_column('transcriptions', 'model_id', 'VARCHAR(100)'),
+    ]),
+    (5, "Reprocessamento forçado", [
+        add_column('jobs', 'force', 'BOOLEAN NOT NULL DEFAULT FALSE'),
+    ]),
+    (6, "O mesmo áudio pode repetir-se entre lotes: índice da cache deixa de ser único", [
+        drop_index('idx_audio_hash'),
+        create_index('idx_transcriptions_hash_model', 'transcriptions', ['audio_hash', 'model_id']),
+    ]),
+    (7, "Progresso inteiro e instante da última alteração (stream SSE)", [
+        add_column('transcriptions', 'progress', 'INTEGER NOT NULL DEFAULT 0'),
+        add_column('transcriptions', 'updated_at', 'TIMESTAMP'),
+        execute("UPDATE transcriptions SET updated_at = upload_date WHERE updated_at IS NULL"),
+        execute("UPDATE transcriptions SET progress = 100 WHERE status = 'Concluído' AND progress = 0"),
+        create_index('idx_transcriptions_batch_updated', 'transcriptions', ['batch_id', 'updated_at']),
+    ]),
+    (8, "Índices das leituras do dashboard e dos lotes", [
+        create_index('idx_transcriptions_status_date', 'transcriptions', ['status', 'upload_date', 'id']),
+        create_index('idx_transcriptions_batch_status_date', 'transcriptions', ['batch_id', 'status', 'upload_date', 'id']),
+    ]),
+    (9, "Índice de pesquisa de texto integral (FTS5 no SQLite, tsvector/GIN no PostgreSQL)", [
+        create_search_index,
+        rebuild_search_index,
+    ]),
+    (10, "Colunas estruturadas da análise (operador/aluno, JSON nativo) e tabela action_items", [
+        add_column('analyses', 'operator_label', 'VARCHAR(200)'),
+        add_column('analyses', 'student_label', 'VARCHAR(200)'),
+        add_column('analyses', 'analysis_data', {'postgresql': 'JSONB', 'default': 'JSON'}),
+        create_index('idx_analyses_operator_sentiment', 'analyses', ['operator_label', 'sentiment']),
+        backfill_analysis_columns,
+    ]),
+    (11, "Perfilamento por job", [
+        add_column('jobs', 'profile', 'BOOLEAN NOT NULL DEFAULT FALSE'),
+        add_column('uploads', 'profile', 'BOOLEAN NOT NULL DEFAULT FALSE'),
+    ]),
+    (12, "Textos das transcrições no armazém comprimido (blobs); a tabela guarda só o hash", [
+        add_column('transcriptions', 'transcript_blob', 'VARCHAR(64)'),
+        move_transcripts_to_blobs,
+    ]),
+    (13, "Análises versionadas (reprocessamento com outro modelo ou versão do prompt)", [
+        add_column('analyses', 'version', 'INTEGER NOT NULL DEFAULT 1'),
+        add_column('analyses', 'is_current', 'BOOLEAN NOT NULL DEFAULT TRUE'),
+        add_column('analyses', 'prompt_version', 'VARCHAR(50)'),
+        add_column('analyses', 'model_id', 'VARCHAR(100)'),
+        add_column('analyses', 'transcript_blob', 'VARCHAR(64)'),
+        add_column('analyses', 'created_at', 'TIMESTAMP'),
+        execute("""
+            UPDATE analyses SET
+                prompt_version = 'v1',
+                model_id = (SELECT t.model_id FROM transcriptions t WHERE t.id = analyses.transcription_id),
+                transcript_blob = (SELECT t.transcript_blob FROM transcriptions t WHERE t.id = analyses.transcription_id),
+                created_at = (SELECT t.updated_at FROM transcriptions t WHERE t.id = analyses.transcription_id)
+            WHERE prompt_version IS NULL"""),
+        drop_unique('analyses', 'transcription_id'),
+        create_index('idx_analyses_transcription_version', 'analyses', ['transcription_id', 'version'], unique=True),
+        create_index('idx_analyses_current', 'analyses', ['transcription_id'], unique=True, where='is_current'),
+        add_column('jobs', 'prompt_version', 'VARCHAR(50)'),
+        add_column('jobs', 'reprocess', 'BOOLEAN NOT NULL DEFAULT FALSE'),
+    ]),
+    (14, "Texto simples dado à análise, guardado no armazém para a reanálise", [
+        add_column('transcriptions', 'analysis_input_blob', 'VARCHAR(64)'),
+    ]),
+    (15, "Índice de pesquisa FTS5 sem conteúdo (sem cópia dos textos)", [
+        make_search_index_contentless,
+    ]),
+]
+
+
+def _applied_versions():
+    return {row.version for row in db.session.query(SchemaMigration.version)}
+
+def run_migrations():
+    """Aplica as migrações em falta; cada uma corre na sua própria transação.
+
+    Vários processos podem arrancar ao mesmo tempo (servidor e `worker.py`): as
+    operações são idempotentes e a versão só é registada uma vez.
+    """
+    applied = _applied_versions()
+    db.session.remove()
+    count = 0
+    for version, description, operations in MIGRATIONS:
+        if version in applied:
+            continue
+        try:
+            with db.engine.begin() as conn:
+                for operation in operations:
+                    operation(conn)
+                conn.execute(SchemaMigration.__table__.insert().values(
+                    version=version, description=description, applied_at=datetime.utcnow()
+                ))
+        except IntegrityError:
+            # Outro processo registou a mesma versão entretanto
+            continue
+        print(f"Migração {version} aplicada: {description}")
+        count += 1
+    return count
@@ -1,6 +1,6 @@
 from . import db
 from datetime import datetime
-import json
+from sqlalchemy.dialects.postgresql import JSONB
 
 class Batch(db.Model):
     __tablename__ = 'batches'
@@ -9,12 +9,15 @@ class Batch(db.Model):
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     transcriptions = db.relationship('Transcription', backref='batch', lazy=True, cascade="all, delete-orphan")
 
-    def to_dict(self):
+    def to_dict(self, file_count=None):
+        # Passe `file_count` quando já vier de uma contagem agrupada: evita carregar as transcrições
+        if file_count is None:
+            file_count = Transcription.query.filter_by(batch_id=self.id).count()
         return {
             'id': self.id,
             'name': self.name,
             'created_at': self.created_at.isoformat() + 'Z', # Padrão ISO 8601
-            'file_count': len(self.transcriptions)
+            'file_count': file_count
         }
 
 class Transcription(db.Model):
@@ -23,38 +26,275 @@ class Transcription(db.Model):
     filename = db.Column(db.String(255), nullable=False)
     upload_date = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     status = db.Column(db.String(255), nullable=False, default='Na Fila')
-    transcript_text = db.Column(db.Text, nullable=True)
+    progress = db.Column(db.Integer, nullable=False, default=0) # Progresso da etapa atual (0-100)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow) # Lido pelo stream SSE
+    transcript_text = db.deferred(db.Column(db.Text, nullable=True)) # Só em linhas antigas; o texto vive no armazém (ver `blobs.py`)
+    transcript_blob = db.Column(db.String(64), nullable=True) # SHA-256 do texto comprimido no armazém
+    analysis_input_blob = db.Column(db.String(64), nullable=True) # Texto simples dado à análise (reutilizado na reanálise)
     audio_hash = db.Column(db.String(64), nullable=True) # Hash SHA-256
+    model_id = db.Column(db.String(100), nullable=True) # Modelo usado; faz parte da chave da cache
+    external_job_id = db.Column(db.String(100), nullable=True) # ID do job na API de transcrição externa
     batch_id = db.Column(db.Integer, db.ForeignKey('batches.id'), nullable=False)
-    analysis = db.relationship('Analysis', backref='transcription', uselist=False, cascade="all, delete-orphan")
+    # Todas as versões da análise (reprocessamentos) e a atual, usada no dashboard e nas exportações
+    analyses = db.relationship('Analysis', backref='transcription', order_by='Analysis.version', cascade="all, delete-orphan")
+    analysis = db.relationship('Analysis', primaryjoin='and_(Transcription.id == Analysis.transcription_id, Analysis.is_current)',
+                               uselist=False, viewonly=True)
+
+    # Cache por conteúdo; alterações de um lote (stream SSE); páginas do dashboard, com e sem filtro de lote
+    __table_args__ = (
+        db.Index('idx_transcriptions_hash_model', 'audio_hash', 'model_id'),
+        db.Index('idx_transcriptions_batch_updated', 'batch_id', 'updated_at'),
+        db.Index('idx_transcriptions_status_date', 'status', 'upload_date', 'id'),
+        db.Index('idx_transcriptions_batch_status_date', 'batch_id', 'status', 'upload_date', 'id'),
+    )
 
     def to_dict_details(self):
-        # Extrai o progresso do status, se houver
-        progress = None
-        if self.status == 'Concluído':
-            progress = 100
-        elif '(API):' in self.status and '%' in self.status:
-            try:
-                progress_str = self.status.split('(API):')[1].strip().replace('%', '')
-                progress = int(progress_str)
-            except (ValueError, IndexError):
-                progress = 0
-                
         return {
             'id': self.id,
             'filename': self.filename,
             'status': self.status,
-            'progress': progress
+            'progress': self.progress
         }
 
+def analysis_columns(result):
+    """Separa o resultado da análise (esquema do prompt) em colunas e itens de ação."""
+    speakers = result.get('speaker_identification') or {}
+    if not isinstance(speakers, dict):
+        speakers = {}
+    action_items = result.get('action_items') or []
+    if not isinstance(action_items, list):
+        action_items = [action_items]
+    columns = {
+        'sentiment': result.get('sentiment'),
+        'topic': result.get('main_topic'),
+        'summary': result.get('summary'),
+        'operator_label': speakers.get('operator'),
+        'student_label': speakers.get('student'),
+        'analysis_data': result
+    }
+    return columns, [str(item) for item in action_items if item]
+
 class Analysis(db.Model):
+    """Uma versão da análise de uma transcrição; só uma por transcrição é a atual (`is_current`)."""
     __tablename__ = 'analyses'
     id = db.Column(db.Integer, primary_key=True)
     sentiment = db.Column(db.String(50))
     topic = db.Column(db.String(100))
     summary = db.Column(db.Text)
-    full_analysis_json = db.Column(db.Text) # Armazena o JSON completo como texto
-    transcription_id = db.Column(db.Integer, db.ForeignKey('transcriptions.id', ondelete='CASCADE'), unique=True, nullable=False)
+    operator_label = db.Column(db.String(200)) # Nome/papel identificado para o operador
+    student_label = db.Column(db.String(200)) # Nome/papel identificado para o aluno
+    analysis_data = db.deferred(db.Column(db.JSON().with_variant(JSONB(), 'postgresql'))) # Resultado completo do modelo (JSON nativo)
+    full_analysis_json = db.deferred(db.Column(db.Text)) # Legado: JSON como texto, substituído por `analysis_data` (migração 10)
+    transcription_id = db.Column(db.Integer, db.ForeignKey('transcriptions.id', ondelete='CASCADE'), nullable=False)
+    version = db.Column(db.Integer, nullable=False, default=1) # 1, 2, ... por transcrição
+    is_current = db.Column(db.Boolean, nullable=False, default=True)
+    prompt_version = db.Column(db.String(50), nullable=True) # Versão das instruções (PROMPT_VERSIONS em `analysis.py`)
+    model_id = db.Column(db.String(100), nullable=True) # Modelo de transcrição do texto analisado
+    transcript_blob = db.Column(db.String(64), nullable=True) # Texto analisado (no armazém, ver `blobs.py`)
+    created_at = db.Column(db.DateTime, nullable=True, default=datetime.utcnow)
+    action_items = db.relationship('ActionItem', backref='analysis', order_by='ActionItem.position',
+                                   cascade="all, delete-orphan", passive_deletes=True)
+
+    # Agregados por operador (ex.: sentimento negativo por operador); versões de cada
+    # transcrição; no máximo uma análise atual por transcrição (índice parcial)
+    __table_args__ = (
+        db.Index('idx_analyses_operator_sentiment', 'operator_label', 'sentiment'),
+        db.Index('idx_analyses_transcription_version', 'transcription_id', 'version', unique=True),
+        db.Index('idx_analyses_current', 'transcription_id', unique=True,
+                 sqlite_where=db.text('is_current'), postgresql_where=db.text('is_current')),
+    )
+
+    @classmethod
+    def from_result(cls, transcription_id, result, **metadata):
+        """`metadata`: prompt_version, model_id e transcript_blob da versão."""
+        columns, action_items = analysis_columns(result)
+        analysis = cls(transcription_id=transcription_id, **columns, **metadata)
+        analysis.action_items = [ActionItem(position=i, text=text) for i, text in enumerate(action_items)]
+        return analysis
+
+    def to_dict(self):
+        # Montado a partir das colunas, no formato de saída do prompt
+        return {
+            'speaker_identification': {'operator': self.operator_label, 'student': self.student_label},
+            'summary': self.summary,
+            'sentiment': self.sentiment,
+            'main_topic': self.topic,
+            'action_items': [item.text for item in self.action_items]
+        }
+
+    def to_version_dict(self):
+        return {
+            'version': self.version,
+            'is_current': self.is_current,
+            'prompt_version': self.prompt_version,
+            'model_id': self.model_id,
+            'created_at': self.created_at.isoformat() + 'Z' if self.created_at else None,
+            'analysis': self.to_dict()
+        }
+
+def add_analysis_version(transcription, analysis):
+    """Grava `analysis` como a nova versão atual da transcrição (sem commit).
+
+    A versão anterior deixa de ser a atual, mas é mantida para comparação.
+    """
+    latest = db.session.query(db.func.max(Analysis.version)).filter(Analysis.transcription_id == transcription.id).scalar()
+    # Antes do INSERT: o índice parcial só admite uma versão atual por transcrição
+    Analysis.query.filter(Analysis.transcription_id == transcription.id, Analysis.is_current)\
+        .update({Analysis.is_current: False}, synchronize_session=False)
+    analysis.transcription_id = transcription.id
+    analysis.version = (latest or 0) + 1
+    analysis.is_current = True
+    db.session.add(analysis)
+    return analysis
+
+class ActionItem(db.Model):
+    """Itens de ação de uma análise, pela ordem devolvida pelo modelo."""
+    __tablename__ = 'action_items'
+    id = db.Column(db.Integer, primary_key=True)
+    analysis_id = db.Column(db.Integer, db.ForeignKey('analyses.id', ondelete='CASCADE'), nullable=False, index=True)
+    position = db.Column(db.Integer, nullable=False, default=0)
+    text = db.Column(db.Text, nullable=False)
+
+class Job(db.Model):
+    """Fila persistente de trabalhos do pipeline, partilhada por todos os processos."""
+    __tablename__ = 'jobs'
+
+    # Estados possíveis de um job
+    PENDING = 'pending'
+    RUNNING = 'running'
+    WAITING = 'waiting' # Submetido à API externa; acompanhado pelo poller
+    DONE = 'done'
+    FAILED = 'failed'
+
+    # Etapas do pipeline em que um job pode (re)entrar
+    STAGE_PROCESS = 'process'
+    STAGE_RESUME_API = 'resume_api'
+    STAGE_REANALYZE = 'reanalyze' # Só a análise, sobre a transcrição guardada
+
+    id = db.Column(db.Integer, primary_key=True)
+    transcription_id = db.Column(db.Integer, db.ForeignKey('transcriptions.id', ondelete='CASCADE'), nullable=False, index=True)
+    file_path = db.Column(db.String(500), nullable=False)
+    filename = db.Column(db.String(255), nullable=False)
+    file_type = db.Column(db.String(10), nullable=False)
+    model_id = db.Column(db.String(100), nullable=False)
+    force = db.Column(db.Boolean, nullable=False, default=False) # Ignora a cache por conteúdo
+    profile = db.Column(db.Boolean, nullable=False, default=False) # Amostra a pilha durante a execução (ver `profiling.py`)
+    prompt_version = db.Column(db.String(50), nullable=True) # Versão do prompt da análise (padrão: ANALYSIS_PROMPT_VERSION)
+    reprocess = db.Column(db.Boolean, nullable=False, default=False) # Criado por `/api/reprocess` (concorrência limitada)
+    status = db.Column(db.String(20), nullable=False, default=PENDING, index=True)
+    stage = db.Column(db.String(20), nullable=False, default=STAGE_PROCESS)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    worker_id = db.Column(db.String(100), nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+
+class Upload(db.Model):
+    """Upload por blocos de um ficheiro (ver `uploads.py`); o job é criado na finalização."""
+    __tablename__ = 'uploads'
+    id = db.Column(db.String(32), primary_key=True) # Token aleatório: quem o conhece pode enviar blocos
+    transcription_id = db.Column(db.Integer, db.ForeignKey('transcriptions.id', ondelete='CASCADE'), nullable=False, index=True)
+    file_path = db.Column(db.String(500), nullable=False)
+    file_type = db.Column(db.String(10), nullable=False)
+    size = db.Column(db.BigInteger, nullable=False) # Tamanho total anunciado pelo cliente
+    received = db.Column(db.BigInteger, nullable=False, default=0) # Bytes já gravados (offset do próximo bloco)
+    force = db.Column(db.Boolean, nullable=False, default=False)
+    profile = db.Column(db.Boolean, nullable=False, default=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+    completed_at = db.Column(db.DateTime, nullable=True)
+    transcription = db.relationship('Transcription')
 
     def to_dict(self):
-        return json.loads(self.full_analysis_json) if self.full_analysis_json else {}
\ No newline at end of file
+        return {
+            'upload_id': self.id,
+            'transcription_id': self.transcription_id,
+            'size': self.size,
+            'offset': self.received,
+            'completed': self.completed_at is not None
+        }
+
+
+class PipelineStage(db.Model):
+    """Duração de uma etapa do pipeline de uma transcrição (ver `timings.py`)."""
+    __tablename__ = 'pipeline_stages'
+    id = db.Column(db.Integer, primary_key=True)
+    transcription_id = db.Column(db.Integer, db.ForeignKey('transcriptions.id', ondelete='CASCADE'), nullable=False)
+    stage = db.Column(db.String(30), nullable=False)
+    provider = db.Column(db.String(50), nullable=True)
+    model_id = db.Column(db.String(100), nullable=True)
+    outcome = db.Column(db.String(20), nullable=False, default='ok') # 'ok' ou 'error'
+    started_at = db.Column(db.DateTime, nullable=False)
+    duration_ms = db.Column(db.Integer, nullable=False)
+
+    __table_args__ = (db.Index('idx_pipeline_stages_transcription', 'transcription_id', 'stage'),)
+
+    def to_dict(self):
+        return {
+            'stage': self.stage,
+            'provider': self.provider,
+            'outcome': self.outcome,
+            'started_at': self.started_at.isoformat() + 'Z',
+            'seconds': round(self.duration_ms / 1000, 3)
+        }
+
+
+class Segment(db.Model):
+    """Uma fala de uma transcrição, com interveniente e tempos (ver `segments.py`)."""
+    __tablename__ = 'segments'
+    id = db.Column(db.Integer, primary_key=True)
+    transcription_id = db.Column(db.Integer, db.ForeignKey('transcriptions.id', ondelete='CASCADE'), nullable=False)
+    position = db.Column(db.Integer, nullable=False) # Ordem no diálogo (0, 1, ...)
+    speaker = db.Column(db.String(50), nullable=True) # Rótulo da diarização ('1', '2', ...)
+    start_seconds = db.Column(db.Float, nullable=False) # Desde o início do áudio
+    end_seconds = db.Column(db.Float, nullable=False)
+    text = db.Column(db.Text, nullable=False)
+
+    # Páginas por transcrição (keyset pela posição)
+    __table_args__ = (db.Index('idx_segments_transcription_position', 'transcription_id', 'position', unique=True),)
+
+    def to_dict(self):
+        return {
+            'position': self.position,
+            'speaker': self.speaker,
+            'start': round(self.start_seconds, 2),
+            'end': round(self.end_seconds, 2),
+            'text': self.text
+        }
+
+class BatchStat(db.Model):
+    """Contagem de análises por lote, sentimento e tópico, mantida incrementalmente.
+
+    Sentimento/tópico ausentes são guardados como '' para que a restrição de unicidade
+    funcione (NULLs são sempre distintos).
+    """
+    __tablename__ = 'batch_stats'
+    id = db.Column(db.Integer, primary_key=True)
+    batch_id = db.Column(db.Integer, db.ForeignKey('batches.id', ondelete='CASCADE'), nullable=False)
+    sentiment = db.Column(db.String(50), nullable=False, default='')
+    topic = db.Column(db.String(100), nullable=False, default='')
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (db.UniqueConstraint('batch_id', 'sentiment', 'topic', name='uq_batch_stats_key'),)
+
+
+class CachedValue(db.Model):
+    """Valores obtidos de serviços externos, partilhados entre processos (ver `catalogue.py`)."""
+    __tablename__ = 'cached_values'
+    key = db.Column(db.String(100), primary_key=True)
+    value = db.Column(db.JSON, nullable=True)
+    fetched_at = db.Column(db.DateTime, nullable=True) # Última obtenção com sucesso
+    expires_at = db.Column(db.DateTime, nullable=False) # A partir daqui o valor é servido, mas renovado
+    refresh_started_at = db.Column(db.DateTime, nullable=True) # Renovação em curso (num dos processos)
+    last_error = db.Column(db.Text, nullable=True)
+
+
+class SchemaMigration(db.Model):
+    """Versões do esquema já aplicadas (ver `migrations.py`)."""
+    __tablename__ = 'schema_migrations'
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    description = db.Column(db.String(255), nullable=False)
+    applied_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
@@ -0,0 +1,205 @@
+import heapq
+import itertools
+import threading
+import time
+from datetime import datetime
+
+import requests
+
+from .clients import get_http_session
+from .models import db, Job, Transcription
+from .progress import notify_progress, set_status
+from .search import remove_from_index
+from .ratelimit import get_scheduler
+
+
+class ApiJobPoller:
+    """Poller único por processo para todos os jobs submetidos à API de transcrição externa.
+
+    Mantém um heap ordenado pelo instante da próxima verificação. Cada job começa a ser
+    verificado com intervalo curto, que cresce geometricamente até ao máximo configurado.
+    As verificações usam a `requests.Session` partilhada (keep-alive) e as alterações de
+    progresso de um ciclo são gravadas numa só transação.
+    """
+
+    def __init__(self, app, min_interval, max_interval, backoff, max_errors, on_completed):
+        self.app = app
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.max_errors = max_errors
+        self.on_completed = on_completed
+        self.session = get_http_session()
+        self._heap = []
+        self._tracked = {}
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self._wake_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="api-job-poller", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        self._stop_event.set()
+        self._wake_event.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def track(self, job_row_id, transcription_id, external_job_id):
+        """Passa a acompanhar um job externo (idempotente)."""
+        with self._lock:
+            if job_row_id in self._tracked:
+                return
+            self._tracked[job_row_id] = {
+                'transcription_id': transcription_id,
+                'external_job_id': external_job_id,
+                'interval': self.min_interval,
+                'progress': None,
+                'errors': 0
+            }
+            heapq.heappush(self._heap, (time.monotonic() + self.min_interval, next(self._counter), job_row_id))
+        self._wake_event.set()
+
+    def tracked_count(self):
+        with self._lock:
+            return len(self._tracked)
+
+    def _pop_due(self):
+        now = time.monotonic()
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                _, _, job_row_id = heapq.heappop(self._heap)
+                if job_row_id in self._tracked:
+                    due.append(job_row_id)
+            next_at = self._heap[0][0] if self._heap else None
+        return due, next_at
+
+    def _reschedule(self, job_row_id):
+        with self._lock:
+            entry = self._tracked.get(job_row_id)
+            if entry is None:
+                return
+            entry['interval'] = min(self.max_interval, entry['interval'] * self.backoff)
+            heapq.heappush(self._heap, (time.monotonic() + entry['interval'], next(self._counter), job_row_id))
+
+    def _untrack(self, job_row_id):
+        with self._lock:
+            self._tracked.pop(job_row_id, None)
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            due, next_at = self._pop_due()
+            if due:
+                try:
+                    self._check_jobs(due)
+                except Exception as e:
+                    print(f"ERRO no poller da API externa: {e}")
+                    for job_row_id in due:
+                        self._reschedule(job_row_id)
+                continue
+
+            timeout = self.max_interval if next_at is None else max(0, next_at - time.monotonic())
+            self._wake_event.wait(timeout)
+            self._wake_event.clear()
+
+    def _restore_current_version(self, transcription_id):
+        # Import local para evitar import circular (services importa este módulo via jobs)
+        from .services import restore_current_version
+        transcription = db.session.get(Transcription, transcription_id)
+        return transcription is not None and restore_current_version(transcription)
+
+    def _fetch_status(self, external_job_id):
+        def fetch():
+            response = self.session.get(f"{self.app.config['PUBLIC_URL_API']}/jobs/{external_job_id}", timeout=10)
+            response.raise_for_status()
+            return response.json()
+        # Sem retries aqui: uma falha apenas adia a verificação seguinte do job
+        return get_scheduler('jobs_api').call(fetch, retries=0)
+
+    def _check_jobs(self, job_row_ids):
+        progress_updates = {}
+        completed = []
+        failed = {}
+
+        for job_row_id in job_row_ids:
+            with self._lock:
+                entry = dict(self._tracked.get(job_row_id) or {})
+            if not entry:
+                continue
+
+            try:
+                job_status = self._fetch_status(entry['external_job_id'])
+            except requests.exceptions.RequestException as e:
+                with self._lock:
+                    self._tracked[job_row_id]['errors'] += 1
+                    errors = self._tracked[job_row_id]['errors']
+                if errors >= self.max_errors:
+                    failed[job_row_id] = f"Falha ao verificar status do job na API: {e}"
+                else:
+                    self._reschedule(job_row_id)
+                continue
+
+            status = job_status.get('status')
+            progress = job_status.get('progress', 0)
+            with self._lock:
+                self._tracked[job_row_id]['errors'] = 0
+                changed = self._tracked[job_row_id]['progress'] != progress
+                self._tracked[job_row_id]['progress'] = progress
+
+            if status == 'completed':
+                print(f"Job {entry['external_job_id']} concluído na API.")
+                completed.append(job_row_id)
+            elif status in ['failed', 'cancelled']:
+                error_details = job_status.get('debug_log', ['Erro desconhecido na API.'])[-1]
+                failed[job_row_id] = f"Job na API falhou ou foi cancelado. Detalhe: {error_details}"
+            else:
+                # Só grava no banco quando o progresso mudou
+                if changed:
+                    progress_updates[entry['transcription_id']] = progress
+                self._reschedule(job_row_id)
+
+        if not (progress_updates or completed or failed):
+            return
+
+        with self.app.app_context():
+            for transcription_id, progress in progress_updates.items():
+                Transcription.query.filter_by(id=transcription_id).update({
+                    Transcription.status: f"A transcrever (API): {progress}%",
+                    Transcription.progress: max(0, min(100, int(progress))),
+                    Transcription.updated_at: datetime.utcnow()
+                }, synchronize_session=False)
+
+            for job_row_id, error_message in failed.items():
+                job = db.session.get(Job, job_row_id)
+                if job:
+                    job.status = Job.FAILED
+                    job.last_error = error_message
+                    job.finished_at = datetime.utcnow()
+                    if job.reprocess and self._restore_current_version(job.transcription_id):
+                        continue
+                    transcription = db.session.get(Transcription, job.transcription_id)
+                    if transcription:
+                        # Como em `mark_pipeline_error`: descarta o progresso por gravar e sai da pesquisa
+                        set_status(transcription, f"Erro no pipeline: {error_message}")
+                        remove_from_index(transcription.id)
+
+            for job_row_id in completed:
+                # Devolve o job à fila para que um worker descarregue o resultado e continue o pipeline
+                Job.query.filter(Job.id == job_row_id, Job.status == Job.WAITING).update({
+                    Job.status: Job.PENDING,
+                    Job.stage: Job.STAGE_RESUME_API,
+                    Job.worker_id: None
+                }, synchronize_session=False)
+
+            db.session.commit()
+        if progress_updates or failed:
+            notify_progress()
+
+        for job_row_id in list(completed) + list(failed):
+            self._untrack(job_row_id)
+        if completed:
+            self.on_completed()
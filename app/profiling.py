@@ -0,0 +1,93 @@
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from config import Config
+
+# Perfilamento por amostragem de um job: uma thread lê a pilha da thread do worker a
+# cada PROFILE_INTERVAL segundos (`sys._current_frames`, sem instrumentar o código) e
+# grava as pilhas no formato "folded" (uma linha `f1;f2;f3 contagem`), que pode ser
+# convertido num flame graph (ex.: `flamegraph.pl` ou speedscope).
+# É ativado por job (campo `profile` do upload) ou para uma fração dos jobs (PROFILE_SAMPLE_RATE).
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+class SamplingProfiler(threading.Thread):
+    """Amostra a pilha de `thread_id` até `stop()` ser chamado."""
+
+    def __init__(self, thread_id, interval):
+        super().__init__(daemon=True, name=f'profiler-{thread_id}')
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame))
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def write(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def should_profile(job):
+    return bool(job.profile) or (Config.PROFILE_SAMPLE_RATE > 0 and random.random() < Config.PROFILE_SAMPLE_RATE)
+
+def profile_path(transcription_id, job_id, stage):
+    return os.path.join(Config.PROFILE_FOLDER, f"transcription-{transcription_id}-job-{job_id}-{stage}.folded")
+
+@contextmanager
+def profile_job(job, enabled):
+    """Amostra a thread atual durante o bloco, se `enabled`, e grava o perfil no fim."""
+    if not enabled:
+        yield
+        return
+    job_id, path = job.id, profile_path(job.transcription_id, job.id, job.stage)
+    profiler = SamplingProfiler(threading.get_ident(), Config.PROFILE_INTERVAL)
+    started = time.perf_counter()
+    profiler.start()
+    try:
+        yield
+    finally:
+        profiler.stop()
+        try:
+            os.makedirs(Config.PROFILE_FOLDER, exist_ok=True)
+            profiler.write(path)
+            print(f"Perfil do job {job_id} gravado em {path} ({profiler.samples} amostras em {time.perf_counter() - started:.1f}s).")
+        except OSError as e:
+            print(f"AVISO: Não foi possível gravar o perfil do job {job_id}. Erro: {e}")
+
+def find_latest_profile(transcription_id):
+    """Caminho do perfil mais recente de uma transcrição, ou None."""
+    prefix = f"transcription-{transcription_id}-job-"
+    try:
+        names = [name for name in os.listdir(Config.PROFILE_FOLDER) if name.startswith(prefix) and name.endswith('.folded')]
+    except FileNotFoundError:
+        return None
+    if not names:
+        return None
+    paths = [os.path.join(Config.PROFILE_FOLDER, name) for name in names]
+    return max(paths, key=os.path.getmtime)
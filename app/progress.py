@@ -0,0 +1,276 @@
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import bindparam, event
+
+from .models import db, Transcription
+
+# Estados finais de uma transcrição (o stream do lote termina quando todas chegam a um deles)
+STATUS_DONE = 'Concluído'
+ERROR_PREFIX = 'Erro'
+
+# Margem ao reler alterações: uma transação pode gravar `updated_at` antes de outra
+# e só fazer commit depois dela
+STREAM_LOOKBACK = timedelta(seconds=5)
+
+
+def is_final_status(status):
+    return status == STATUS_DONE or (status or '').startswith(ERROR_PREFIX)
+
+def set_status(transcription, status, progress=None):
+    """Atualiza o estado (e, opcionalmente, o progresso 0-100) de uma transcrição (sem commit).
+
+    Use para transições que têm de ser gravadas já (estados finais, ou com outros dados na
+    mesma transação); o progresso intermédio vai por `report_progress`.
+    """
+    if transcription.id is not None:
+        _writer.discard(transcription.id) # Um progresso ainda por gravar não pode sobrepor-se a este estado
+    transcription.status = status
+    if progress is not None:
+        transcription.progress = max(0, min(100, int(progress)))
+    elif status == STATUS_DONE:
+        transcription.progress = 100
+    transcription.updated_at = datetime.utcnow()
+
+
+# --- GRAVAÇÃO AGRUPADA DO PROGRESSO ---
+
+class StatusWriter:
+    """Acumula em memória os estados intermédios e grava-os em lote a um ritmo limitado.
+
+    Cada transcrição guarda só o último valor por gravar e valores iguais ao último gravado
+    são ignorados. Uma thread grava tudo o que estiver pendente numa só transação, no
+    máximo uma vez a cada `flush_interval` segundos, em vez de um commit por atualização
+    em cada worker (com SQLite, todos disputariam o bloqueio de escrita). Uma linha
+    alterada entretanto por outra via (ex.: estado final) não é sobreposta.
+    """
+
+    def __init__(self, flush_interval):
+        self.flush_interval = flush_interval
+        self._app = None
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._written = {}
+        self._wake_event = threading.Event()
+        self._thread = None
+
+    def update(self, app, transcription_id, status, progress):
+        value = (status, progress)
+        with self._lock:
+            pending = self._pending.get(transcription_id)
+            if (pending[:2] if pending else self._written.get(transcription_id)) == value:
+                return
+            self._pending[transcription_id] = (status, progress, datetime.utcnow())
+            if self._thread is None:
+                self._app = app
+                self._thread = threading.Thread(target=self._run, name='status-writer', daemon=True)
+                self._thread.start()
+        self._wake_event.set()
+
+    def discard(self, transcription_id):
+        with self._lock:
+            self._pending.pop(transcription_id, None)
+            self._written.pop(transcription_id, None)
+
+    def _run(self):
+        while True:
+            self._wake_event.wait()
+            self._wake_event.clear()
+            try:
+                with self._app.app_context():
+                    self.flush()
+                    db.session.remove()
+            except Exception as e:
+                print(f"ERRO ao gravar o progresso das transcrições: {e}")
+            time.sleep(self.flush_interval)
+
+    def flush(self):
+        """Grava numa transação os estados pendentes (requer contexto da aplicação)."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        now = datetime.utcnow()
+        table = Transcription.__table__
+        statement = table.update()\
+            .where(table.c.id == bindparam('row_id'), table.c.updated_at <= bindparam('reported_at'))\
+            .values(status=bindparam('new_status'), progress=bindparam('new_progress'), updated_at=now)
+        try:
+            db.session.execute(statement, [
+                {'row_id': transcription_id, 'new_status': status, 'new_progress': progress, 'reported_at': reported_at}
+                for transcription_id, (status, progress, reported_at) in pending.items()
+            ])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            with self._lock:
+                # Devolve os valores não gravados, sem sobrepor os que entretanto chegaram
+                for transcription_id, value in pending.items():
+                    self._pending.setdefault(transcription_id, value)
+            raise
+        with self._lock:
+            for transcription_id, (status, progress, _) in pending.items():
+                if transcription_id not in self._pending:
+                    self._written[transcription_id] = (status, progress)
+        notify_progress()
+        return len(pending)
+
+
+_writer = StatusWriter(flush_interval=1.0)
+
+def configure_status_writer(flush_interval):
+    _writer.flush_interval = flush_interval
+
+def report_progress(transcription, status, progress=None):
+    """Regista um estado intermédio (ex.: blocos transcritos); gravado em lote, sem commit aqui."""
+    if progress is not None:
+        progress = max(0, min(100, int(progress)))
+    _writer.update(current_app._get_current_object(), transcription.id, status,
+                   progress if progress is not None else transcription.progress)
+
+def flush_status_updates():
+    """Grava já os estados pendentes (ex.: antes de o processo terminar)."""
+    _writer.flush()
+
+
+# --- NOTIFICAÇÃO ENTRE THREADS ---
+
+class ProgressNotifier:
+    """Acorda os streams SSE deste processo quando o pipeline grava uma mudança de estado.
+
+    Workers noutros processos não chegam aqui; para esses, os streams voltam a consultar
+    a base de dados ao fim de `timeout` segundos.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._version = 0
+
+    @property
+    def version(self):
+        with self._condition:
+            return self._version
+
+    def notify(self):
+        with self._condition:
+            self._version += 1
+            self._condition.notify_all()
+
+    def wait(self, version, timeout):
+        """Espera por uma notificação posterior a `version`; devolve a versão atual."""
+        with self._condition:
+            if self._version == version:
+                self._condition.wait(timeout)
+            return self._version
+
+
+_notifier = ProgressNotifier()
+
+def notify_progress():
+    _notifier.notify()
+
+def _track_status_changes(session, flush_context, instances):
+    if any(isinstance(obj, Transcription) for obj in list(session.new) + list(session.dirty)):
+        session.info['progress_changed'] = True
+
+def _notify_after_commit(session):
+    if session.info.pop('progress_changed', False):
+        notify_progress()
+
+def register_progress_events():
+    """Liga a notificação dos streams aos commits que alteram transcrições."""
+    if not event.contains(db.session, 'after_commit', _notify_after_commit):
+        event.listen(db.session, 'before_flush', _track_status_changes)
+        event.listen(db.session, 'after_commit', _notify_after_commit)
+
+
+# --- LIMITE DE STREAMS ---
+# Cada stream SSE ocupa uma thread do servidor durante toda a ligação (gunicorn com
+# threads síncronas, ver Dockerfile). Acima do limite, o pedido recebe 503 e a interface
+# passa a polling, para que os uploads e os restantes pedidos tenham sempre threads livres.
+
+_stream_lock = threading.Lock()
+_open_streams = 0
+_max_streams = 4
+
+def configure_stream_limit(max_streams):
+    global _max_streams
+    _max_streams = max_streams
+
+def acquire_stream_slot():
+    """Reserva uma vaga para um stream SSE neste processo; False se o limite foi atingido."""
+    global _open_streams
+    with _stream_lock:
+        if _open_streams >= _max_streams:
+            return False
+        _open_streams += 1
+        return True
+
+def release_stream_slot():
+    global _open_streams
+    with _stream_lock:
+        _open_streams = max(0, _open_streams - 1)
+
+
+# --- STREAM SSE ---
+
+def _sse(name, data):
+    return f"event: {name}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def _file_state(row):
+    return {'id': row.id, 'filename': row.filename, 'status': row.status, 'progress': row.progress}
+
+def stream_batch_progress(batch_id, poll_interval, keepalive_interval, max_duration):
+    """Gera os eventos SSE de um lote: um `snapshot` inicial e depois apenas as alterações.
+
+    Cada verificação lê só as linhas do lote alteradas desde a última vista
+    (índice por lote e `updated_at`) e devolve a ligação ao pool antes de esperar.
+    O stream fecha com `done` quando todos os ficheiros terminam, ou ao fim de
+    `max_duration` segundos (o EventSource volta a ligar-se sozinho).
+    """
+    def load_rows(since=None):
+        query = db.session.query(
+            Transcription.id, Transcription.filename, Transcription.status,
+            Transcription.progress, Transcription.updated_at
+        ).filter(Transcription.batch_id == batch_id)
+        if since is not None:
+            # Linhas já enviadas que voltem a aparecer (margem, mesmo instante) são filtradas
+            query = query.filter(Transcription.updated_at >= since - STREAM_LOOKBACK)
+        rows = query.order_by(Transcription.id).all()
+        db.session.remove()
+        return rows
+
+    rows = load_rows()
+    known = {row.id: _file_state(row) for row in rows}
+    since = max((row.updated_at for row in rows if row.updated_at), default=datetime.utcnow())
+    yield _sse('snapshot', list(known.values()))
+
+    started = last_sent = time.monotonic()
+    version = _notifier.version
+    while known and not all(is_final_status(f['status']) for f in known.values()):
+        if time.monotonic() - started > max_duration:
+            return
+        version = _notifier.wait(version, poll_interval)
+
+        rows = load_rows(since)
+        changes = []
+        for row in rows:
+            state = _file_state(row)
+            if known.get(row.id) != state:
+                known[row.id] = state
+                changes.append(state)
+            if row.updated_at and row.updated_at > since:
+                since = row.updated_at
+
+        if changes:
+            yield _sse('progress', changes)
+            last_sent = time.monotonic()
+        elif time.monotonic() - last_sent >= keepalive_interval:
+            # Comentário SSE: mantém a ligação viva atrás de proxies
+            yield ": keep-alive\n\n"
+            last_sent = time.monotonic()
+
+    yield _sse('done', {'batch_id': batch_id})
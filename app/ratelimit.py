@@ -0,0 +1,207 @@
+import random
+import threading
+import time
+
+import requests
+
+from config import Config
+from .metrics import PROVIDER_REQUEST_SECONDS, PROVIDER_REQUESTS
+
+# Exceções do google-api-core identificadas pelo nome, para não exigir o import aqui
+THROTTLE_ERROR_NAMES = {'ResourceExhausted', 'TooManyRequests'}
+TRANSIENT_ERROR_NAMES = {'ServiceUnavailable', 'InternalServerError', 'DeadlineExceeded',
+                         'GatewayTimeout', 'BadGateway', 'Aborted'}
+THROTTLE_STATUS_CODES = {429}
+TRANSIENT_STATUS_CODES = {500, 502, 503, 504}
+
+# Classificação de um erro de chamada a um provedor
+THROTTLED = 'throttled'
+TRANSIENT = 'transient'
+PERMANENT = 'permanent'
+
+
+def classify_error(error):
+    """Indica se um erro é de quota (throttled), transitório ou permanente."""
+    if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+        status = error.response.status_code
+        if status in THROTTLE_STATUS_CODES:
+            return THROTTLED
+        if status in TRANSIENT_STATUS_CODES:
+            return TRANSIENT
+        return PERMANENT
+    if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+        return TRANSIENT
+
+    name = type(error).__name__
+    if name in THROTTLE_ERROR_NAMES or getattr(error, 'code', None) == 429 or 'RESOURCE_EXHAUSTED' in str(error):
+        return THROTTLED
+    if name in TRANSIENT_ERROR_NAMES:
+        return TRANSIENT
+    return PERMANENT
+
+def _retry_after(error):
+    """Lê o cabeçalho Retry-After (em segundos) de uma resposta HTTP, se existir."""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    try:
+        return float(headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Limita a taxa de pedidos: `rate` por segundo com rajadas de até `burst`."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class AdaptiveConcurrencyLimit:
+    """Limite de pedidos simultâneos com ajuste AIMD.
+
+    Cada sucesso aumenta o limite em ~1 por "janela" (1/limite por pedido); um erro de
+    quota multiplica-o por `decrease_factor`, no máximo uma vez por janela: `acquire`
+    devolve a geração do limite e os erros de pedidos iniciados antes da última descida
+    (a mesma rajada de 429) são ignorados.
+    """
+
+    def __init__(self, initial, min_limit, max_limit, decrease_factor=0.5):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self.decrease_factor = decrease_factor
+        self.in_flight = 0
+        self.generation = 0 # Incrementada a cada descida do limite
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        """Ocupa um lugar; devolve a geração a passar a `release`."""
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+            return self.generation
+
+    def release(self, generation, outcome):
+        with self._condition:
+            self.in_flight -= 1
+            if outcome == THROTTLED:
+                if generation == self.generation:
+                    self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+                    self.generation += 1
+            elif outcome is None:
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            self._condition.notify_all()
+
+
+class ProviderScheduler:
+    """Envolve as chamadas a um provedor com limite de taxa, concorrência adaptativa e retries."""
+
+    def __init__(self, name, rate, burst, initial_concurrency, max_concurrency,
+                 max_retries, base_delay, max_delay):
+        self.name = name
+        self.bucket = TokenBucket(rate, burst)
+        self.concurrency = AdaptiveConcurrencyLimit(initial_concurrency, 1, max_concurrency)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._stats_lock = threading.Lock()
+        self.stats = {'calls': 0, 'throttled': 0, 'retries': 0, 'failures': 0}
+
+    def _count(self, key):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def call(self, fn, *args, retries=None, retry_transient=True, **kwargs):
+        """Executa `fn` respeitando os limites do provedor.
+
+        Erros de quota são sempre repetidos (com backoff exponencial e jitter). Erros
+        transitórios só são repetidos com `retry_transient` (use False em pedidos não
+        idempotentes, em que uma falha de rede pode ter chegado ao servidor).
+        """
+        max_retries = self.max_retries if retries is None else retries
+        attempt = 0
+        while True:
+            self.bucket.acquire()
+            generation = self.concurrency.acquire()
+            outcome = None
+            started = time.perf_counter()
+            try:
+                self._count('calls')
+                return fn(*args, **kwargs)
+            except Exception as e:
+                outcome = classify_error(e)
+                retryable = outcome == THROTTLED or (outcome == TRANSIENT and retry_transient)
+                if outcome == THROTTLED:
+                    self._count('throttled')
+                if not retryable or attempt >= max_retries:
+                    self._count('failures')
+                    raise
+                delay = _retry_after(e) or random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                error_name = type(e).__name__
+            finally:
+                self.concurrency.release(generation, outcome)
+                PROVIDER_REQUEST_SECONDS.observe(time.perf_counter() - started, provider=self.name)
+                PROVIDER_REQUESTS.inc(provider=self.name, outcome=outcome or 'ok')
+
+            attempt += 1
+            self._count('retries')
+            print(f"AVISO: {self.name}: erro {outcome} ({error_name}); nova tentativa {attempt}/{max_retries} em {delay:.1f}s.")
+            time.sleep(delay)
+
+    def snapshot(self):
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats.update({
+            'concurrency_limit': round(self.concurrency.limit, 2),
+            'in_flight': self.concurrency.in_flight,
+            'rate_limit': self.bucket.rate
+        })
+        return stats
+
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+def get_scheduler(name):
+    """Devolve o scheduler (único por processo) do provedor configurado em `Config.PROVIDER_LIMITS`."""
+    scheduler = _schedulers.get(name)
+    if scheduler is None:
+        with _schedulers_lock:
+            scheduler = _schedulers.get(name)
+            if scheduler is None:
+                limits = Config.PROVIDER_LIMITS[name]
+                scheduler = ProviderScheduler(
+                    name,
+                    rate=limits['rate'],
+                    burst=limits['burst'],
+                    initial_concurrency=limits['initial_concurrency'],
+                    max_concurrency=limits['max_concurrency'],
+                    max_retries=Config.PROVIDER_MAX_RETRIES,
+                    base_delay=Config.PROVIDER_RETRY_BASE_DELAY,
+                    max_delay=Config.PROVIDER_RETRY_MAX_DELAY
+                )
+                _schedulers[name] = scheduler
+    return scheduler
+
+def get_scheduler_stats():
+    with _schedulers_lock:
+        return {name: scheduler.snapshot() for name, scheduler in _schedulers.items()}
@@ -1,10 +1,13 @@
-from flask import Blueprint, jsonify, request, render_template, current_app
+from flask import Blueprint, Response, jsonify, request, render_template, current_app, stream_with_context, send_file
 from werkzeug.utils import secure_filename
 from datetime import datetime
 import os
 
-from . import services
+from . import services, cache
 from .models import db, Batch, Transcription
+from .uploads import UploadOffsetMismatch
+from .blobs import load_transcript
+from .progress import acquire_stream_slot, release_stream_slot
 
 # Cria um 'Blueprint', que é como um mini-aplicativo para agrupar nossas rotas
 bp = Blueprint('main', __name__)
@@ -29,10 +32,12 @@ def upload_files_route():
     files = request.files.getlist('files[]')
     batch_name = request.form.get('batchName') or f"Lote de {datetime.now().strftime('%d/%m/%Y %H:%M')}"
     model_id = request.form.get('modelId') # O serviço vai lidar com o default
+    force_reprocess = request.form.get('forceReprocess') in ('1', 'true', 'on')
+    profile = request.form.get('profile') in ('1', 'true', 'on')
 
     try:
         # A lógica pesada foi movida para o service
-        message, batch_id = services.create_and_process_batch(files, batch_name, model_id)
+        message, batch_id = services.create_and_process_batch(files, batch_name, model_id, force_reprocess, profile)
         return jsonify({"message": message, "batch_id": batch_id}), 202
     except ValueError as e:
         return jsonify({"error": str(e)}), 400
@@ -41,18 +46,168 @@ def upload_files_route():
         return jsonify({"error": f"Erro interno do servidor: {e}"}), 500
 
 
+@bp.route('/api/uploads', methods=['POST'])
+def init_upload_route():
+    """Inicia um upload por blocos: cria o lote e devolve uma sessão por ficheiro."""
+    data = request.get_json(silent=True) or {}
+    batch_name = data.get('batchName') or f"Lote de {datetime.now().strftime('%d/%m/%Y %H:%M')}"
+    try:
+        result = services.init_chunked_upload(batch_name, data.get('modelId'), data.get('files'),
+                                              bool(data.get('forceReprocess')), bool(data.get('profile')))
+        return jsonify(result), 201
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+@bp.route('/api/uploads/<upload_id>', methods=['GET'])
+def get_upload_route(upload_id):
+    """Estado de um upload; o cliente retoma a partir do `offset` devolvido."""
+    status = services.get_upload_status(upload_id)
+    if status is None:
+        return jsonify({"error": "Upload não encontrado."}), 404
+    return jsonify(status)
+
+@bp.route('/api/uploads/<upload_id>', methods=['PUT'])
+def put_upload_chunk_route(upload_id):
+    """Recebe um bloco do ficheiro (corpo binário) a gravar a partir de `?offset=`."""
+    offset = request.args.get('offset', type=int)
+    if offset is None or offset < 0:
+        return jsonify({"error": "Indique o offset do bloco."}), 400
+    if request.content_length and request.content_length > current_app.config['UPLOAD_CHUNK_SIZE']:
+        return jsonify({"error": "Bloco maior do que o permitido."}), 413
+    try:
+        status = services.write_upload_chunk(upload_id, offset, request.stream)
+    except UploadOffsetMismatch as e:
+        return jsonify({"error": str(e), "offset": e.offset}), 409
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if status is None:
+        return jsonify({"error": "Upload não encontrado."}), 404
+    return jsonify(status)
+
+@bp.route('/api/uploads/<upload_id>/finalize', methods=['POST'])
+def finalize_upload_route(upload_id):
+    """Conclui o upload de um ficheiro e enfileira o seu processamento."""
+    try:
+        status = services.finalize_upload(upload_id)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if status is None:
+        return jsonify({"error": "Upload não encontrado."}), 404
+    return jsonify(status), 202
+
+
+@bp.route('/api/reprocess', methods=['POST'])
+def reprocess_route():
+    """Reprocessa um lote (`batchId`) ou transcrições (`transcriptionIds`) sem novo upload.
+
+    `stage`: 'transcription' (com `modelId`) ou 'analysis'; `promptVersion` e `force` são opcionais.
+    """
+    data = request.get_json(silent=True) or {}
+    batch_id = data.get('batchId')
+    if batch_id is not None and not isinstance(batch_id, int):
+        return jsonify({"error": "`batchId` inválido."}), 400
+    try:
+        result = services.reprocess_transcriptions(
+            data.get('stage'), batch_id, data.get('transcriptionIds'), data.get('modelId'),
+            data.get('promptVersion'), bool(data.get('force'))
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if result is None:
+        return jsonify({"error": "Lote não encontrado."}), 404
+    return jsonify(result), 202
+
+
+@bp.route('/api/cache/stats', methods=['GET'])
+def get_cache_stats():
+    """Retorna os contadores de acertos/falhas da cache por conteúdo."""
+    return jsonify(cache.get_cache_stats())
+
+
 @bp.route('/api/dashboard_data', methods=['GET'])
 def get_dashboard_data():
-    """Rota para buscar dados para o dashboard."""
+    """Rota para buscar uma página dos detalhes do dashboard (paginação por cursor)."""
     batch_id_filter = request.args.get('batch_id')
-    data = services.get_dashboard_data_from_db(batch_id_filter)
+    cursor = request.args.get('cursor')
+    limit = max(1, min(request.args.get('limit', 50, type=int), 500))
+    try:
+        data = services.get_dashboard_data_from_db(batch_id_filter, cursor, limit)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(data)
+
+@bp.route('/api/dashboard/aggregates', methods=['GET'])
+def get_dashboard_aggregates():
+    """Rota para buscar as contagens de sentimentos/tópicos e os KPIs do dashboard."""
+    try:
+        data = services.get_dashboard_aggregates_from_db(request.args.get('batch_id'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     return jsonify(data)
 
+@bp.route('/api/analytics/action_items_by_topic', methods=['GET'])
+def get_action_items_by_topic():
+    """Rota para buscar o número de itens de ação por tópico."""
+    try:
+        data = services.get_action_items_by_topic_from_db(request.args.get('batch_id'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(data)
+
+@bp.route('/api/analytics/sentiment_by_operator', methods=['GET'])
+def get_sentiment_by_operator():
+    """Rota para buscar os sentimentos por operador (filtro opcional `sentiment`)."""
+    try:
+        data = services.get_sentiment_by_operator_from_db(request.args.get('batch_id'), request.args.get('sentiment'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(data)
+
+@bp.route('/api/analytics/talk_time', methods=['GET'])
+def get_talk_time():
+    """Rota para buscar o tempo de fala por interveniente (filtro opcional de lote)."""
+    try:
+        data = services.get_talk_time_from_db(batch_id_filter=request.args.get('batch_id'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(data)
+
+@bp.route('/api/search', methods=['GET'])
+def search():
+    """Pesquisa nas transcrições, resumos e tópicos (resultados por relevância, paginados).
+
+    A relevância só é calculada entre as SEARCH_MAX_CANDIDATES correspondências mais
+    recentes: com termos muito frequentes, resultados mais antigos e mais relevantes podem
+    ficar de fora (afine a pesquisa com mais termos ou com `batch_id`).
+    """
+    page = request.args.get('page', 1, type=int)
+    per_page = max(1, min(request.args.get('per_page', 20, type=int), 100))
+    try:
+        data = services.search_from_db(request.args.get('q', ''), request.args.get('batch_id'), page, per_page)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(data)
+
+@bp.route('/api/export', methods=['GET'])
+def export_analyses():
+    """Exporta as análises (CSV, JSONL ou XLSX) de um lote e/ou intervalo de datas, em streaming."""
+    try:
+        chunks, mimetype, filename = services.export_analyses_from_db(
+            request.args.get('format', 'csv'),
+            request.args.get('batch_id'),
+            request.args.get('date_from'),
+            request.args.get('date_to')
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return Response(stream_with_context(chunks), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename="{filename}"'
+    })
+
 @bp.route('/api/batches', methods=['GET'])
 def get_batches():
     """Retorna uma lista de todos os lotes processados."""
-    batches = Batch.query.order_by(Batch.created_at.desc()).all()
-    return jsonify([b.to_dict() for b in batches])
+    return jsonify(services.get_batches_with_counts())
 
 
 @bp.route('/api/batch/<int:batch_id>/details', methods=['GET'])
@@ -61,7 +216,7 @@ def get_batch_details(batch_id):
     transcriptions = Transcription.query.filter_by(batch_id=batch_id).order_by(Transcription.id).all()
     if not transcriptions:
         # Verifica se o lote ao menos existe
-        batch = Batch.query.get(batch_id)
+        batch = db.session.get(Batch, batch_id)
         if not batch:
              return jsonify({"error": "Lote não encontrado."}), 404
         return jsonify([]) # Lote existe mas está vazio
@@ -69,10 +224,35 @@ def get_batch_details(batch_id):
     return jsonify([t.to_dict_details() for t in transcriptions])
 
 
+@bp.route('/api/batch/<int:batch_id>/timings', methods=['GET'])
+def get_batch_timings(batch_id):
+    """Tempo gasto em cada etapa do pipeline (por provedor) nos ficheiros de um lote."""
+    data = services.get_batch_timings_from_db(batch_id)
+    if data is None:
+        return jsonify({"error": "Lote não encontrado."}), 404
+    return jsonify(data)
+
+
+@bp.route('/api/batch/<int:batch_id>/events', methods=['GET'])
+def stream_batch_events(batch_id):
+    """Stream SSE com o estado e o progresso dos ficheiros de um lote (503 acima do limite de streams)."""
+    if not acquire_stream_slot():
+        return jsonify({"error": "Demasiados streams abertos; use /api/batch/<id>/details."}), 503, {'Retry-After': '30'}
+    events = services.stream_batch_progress_events(batch_id)
+    if events is None:
+        release_stream_slot()
+        return jsonify({"error": "Lote não encontrado."}), 404
+    response = Response(stream_with_context(events), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no' # Desliga o buffering do nginx, se existir
+    })
+    response.call_on_close(release_stream_slot) # Também quando o cliente se desliga a meio
+    return response
+
 @bp.route('/api/transcription/<int:transcription_id>', methods=['GET'])
 def get_transcription_text(transcription_id):
     """Retorna o texto transcrito e a análise de um ficheiro específico."""
-    transcription = Transcription.query.get(transcription_id)
+    transcription = db.session.get(Transcription, transcription_id)
     if not transcription:
         return jsonify({"error": "Análise não encontrada."}), 404
 
@@ -81,7 +261,59 @@ def get_transcription_text(transcription_id):
         analysis_json = transcription.analysis.to_dict()
 
     response_data = {
-        "transcript_text": transcription.transcript_text or "Conteúdo não disponível.",
+        "transcript_text": load_transcript(transcription) or "Conteúdo não disponível.",
         "analysis": analysis_json
     }
-    return jsonify(response_data)
\ No newline at end of file
+    return jsonify(response_data)
+
+
+@bp.route('/api/transcription/<int:transcription_id>/analyses', methods=['GET'])
+def get_analysis_versions(transcription_id):
+    """Versões da análise de um ficheiro (com `?transcripts=1`, o texto analisado em cada uma)."""
+    data = services.get_analysis_versions(transcription_id, request.args.get('transcripts') == '1')
+    if data is None:
+        return jsonify({"error": "Transcrição não encontrada."}), 404
+    return jsonify(data)
+
+
+@bp.route('/api/transcription/<int:transcription_id>/segments', methods=['GET'])
+def get_transcription_segments(transcription_id):
+    """Uma página dos segmentos com tempos de um ficheiro (paginação por `after`)."""
+    after = request.args.get('after', type=int)
+    limit = max(1, min(request.args.get('limit', 200, type=int), 500))
+    data = services.get_segments_from_db(transcription_id, after, limit)
+    if data is None:
+        return jsonify({"error": "Transcrição não encontrada."}), 404
+    return jsonify(data)
+
+@bp.route('/api/transcription/<int:transcription_id>/talk_time', methods=['GET'])
+def get_transcription_talk_time(transcription_id):
+    """Tempo de fala por interveniente de um ficheiro."""
+    data = services.get_talk_time_from_db(transcription_id)
+    if data is None:
+        return jsonify({"error": "Transcrição não encontrada."}), 404
+    return jsonify(data)
+
+
+@bp.route('/api/transcription/<int:transcription_id>/timings', methods=['GET'])
+def get_transcription_timings(transcription_id):
+    """Retorna as etapas medidas do pipeline de um ficheiro."""
+    data = services.get_transcription_timings_from_db(transcription_id)
+    if data is None:
+        return jsonify({"error": "Transcrição não encontrada."}), 404
+    return jsonify(data)
+
+@bp.route('/api/transcription/<int:transcription_id>/profile', methods=['GET'])
+def get_transcription_profile(transcription_id):
+    """Descarrega o perfil mais recente (pilhas "folded") de um ficheiro perfilado."""
+    path = services.get_latest_profile_path(transcription_id)
+    if path is None:
+        return jsonify({"error": "Perfil não encontrado."}), 404
+    return send_file(os.path.abspath(path), mimetype='text/plain', as_attachment=True,
+                     download_name=os.path.basename(path))
+
+
+@bp.route('/metrics', methods=['GET'])
+def metrics():
+    """Métricas do processo em formato de texto do Prometheus."""
+    return Response(services.render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
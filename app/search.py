@@ -0,0 +1,339 @@
+import html
+import re
+import unicodedata
+from functools import lru_cache
+
+from sqlalchemy import inspect, text
+
+from .models import db
+from .blobs import put_text, read_transcript
+
+# Índice de pesquisa de texto integral sobre a transcrição, o resumo e o tópico.
+#
+# SQLite: tabela virtual FTS5 (`rowid` = id da transcrição). O FTS5 não tem stemmer para
+# português, por isso o texto é indexado já reduzido a radicais aproximados (ver `stem`) e
+# a pesquisa procura os radicais dos termos ("pagamentos" e "pagamento" -> "pagament").
+# A tabela é sem conteúdo (content=''): guarda só o índice invertido, não uma cópia dos
+# textos. Para retirar uma linha, o FTS5 precisa dos valores indexados, pelo que
+# `SEARCH_SOURCES_TABLE` regista de onde veio cada linha (hash da transcrição no armazém,
+# tópico e resumo). Os excertos são gerados em Python a partir do texto original, só para
+# a página pedida.
+# PostgreSQL: tsvector com a configuração 'portuguese' (stemming real) e índice GIN.
+
+SEARCH_TABLE = 'transcription_search'
+SEARCH_SOURCES_TABLE = 'transcription_search_sources'
+PG_CONFIG = 'portuguese'
+
+# Marcadores dos termos encontrados nos excertos (PostgreSQL); substituídos por <mark> depois de escapar o HTML
+_MARK_START = '\ue000'
+_MARK_END = '\ue001'
+SNIPPET_WORDS = 16
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+_STEM_SUFFIXES = (('ções', 'ç'), ('ção', 'ç'), ('ões', ''), ('ão', ''), ('mente', ''))
+
+
+def _is_postgres(bind):
+    return bind.dialect.name == 'postgresql'
+
+
+# --- RADICAIS (SQLITE) ---
+
+def _fold(word):
+    """Minúsculas e sem acentos, como o tokenizador unicode61 com remove_diacritics."""
+    decomposed = unicodedata.normalize('NFKD', word.lower())
+    return ''.join(c for c in decomposed if not unicodedata.combining(c))
+
+@lru_cache(maxsize=100000)
+def stem(word):
+    """Radical aproximado de uma palavra portuguesa (plural, género e alguns sufixos)."""
+    word = word.lower()
+    if len(word) <= 4:
+        return _fold(word)
+    for suffix, replacement in _STEM_SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return _fold(word[:-len(suffix)] + replacement)
+    if word.endswith('s'):
+        word = word[:-1]
+    if len(word) > 4 and word[-1] in 'aeo':
+        word = word[:-1]
+    return _fold(word)
+
+def stem_text(value):
+    return ' '.join(stem(word) for word in _WORD_RE.findall(value or ''))
+
+
+# --- ESTRUTURA DO ÍNDICE ---
+
+def create_search_index(conn):
+    """Cria a estrutura do índice para o dialeto da ligação (idempotente)."""
+    if _is_postgres(conn):
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} (
+                transcription_id INTEGER PRIMARY KEY REFERENCES transcriptions(id) ON DELETE CASCADE,
+                document TSVECTOR NOT NULL
+            )"""))
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS idx_{SEARCH_TABLE}_document ON {SEARCH_TABLE} USING GIN (document)"))
+    else:
+        conn.execute(text(f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(
+                topic, summary, transcript_text,
+                content = '',
+                tokenize = 'unicode61 remove_diacritics 2'
+            )"""))
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS {SEARCH_SOURCES_TABLE} (
+                transcription_id INTEGER PRIMARY KEY,
+                transcript_blob VARCHAR(64),
+                topic TEXT,
+                summary TEXT
+            )"""))
+
+def make_search_index_contentless(conn):
+    """Migração: recria a tabela FTS5 sem conteúdo (as anteriores guardavam os textos com radicais)."""
+    if _is_postgres(conn):
+        return
+    sql = conn.execute(text("SELECT sql FROM sqlite_master WHERE name = :name"), {'name': SEARCH_TABLE}).scalar()
+    if sql and "content = ''" in sql:
+        return
+    conn.execute(text(f"DROP TABLE IF EXISTS {SEARCH_TABLE}"))
+    create_search_index(conn)
+    rebuild_search_index(conn)
+
+def clear_search_index(conn):
+    """Esvazia o índice (as tabelas FTS5 sem conteúdo não aceitam DELETE)."""
+    if _is_postgres(conn):
+        conn.execute(text(f"DELETE FROM {SEARCH_TABLE}"))
+    else:
+        conn.execute(text(f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('delete-all')"))
+        conn.execute(text(f"DELETE FROM {SEARCH_SOURCES_TABLE}"))
+
+def _pg_document_sql(topic, summary, transcript_text):
+    # Pesos: o tópico conta mais do que o resumo, e este mais do que a transcrição
+    return (f"setweight(to_tsvector('{PG_CONFIG}', coalesce({topic}, '')), 'A') || "
+            f"setweight(to_tsvector('{PG_CONFIG}', coalesce({summary}, '')), 'B') || "
+            f"setweight(to_tsvector('{PG_CONFIG}', coalesce({transcript_text}, '')), 'C')")
+
+def _fts_row(transcription_id, transcript_text, summary, topic):
+    return {'id': transcription_id, 'topic': stem_text(topic),
+            'summary': stem_text(summary), 'transcript_text': stem_text(transcript_text)}
+
+def _source_row(transcription_id, transcript_text, summary, topic):
+    # O texto da transcrição fica só por referência (o armazém é por conteúdo: normalmente já lá está)
+    return {'id': transcription_id, 'transcript_blob': put_text(transcript_text) if transcript_text else None,
+            'summary': summary, 'topic': topic}
+
+_FTS_INSERT = text(f"INSERT INTO {SEARCH_TABLE} (rowid, topic, summary, transcript_text) "
+                   f"VALUES (:id, :topic, :summary, :transcript_text)")
+
+_FTS_DELETE = text(f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}, rowid, topic, summary, transcript_text) "
+                   f"VALUES ('delete', :id, :topic, :summary, :transcript_text)")
+
+_SOURCE_INSERT = text(f"INSERT INTO {SEARCH_SOURCES_TABLE} (transcription_id, transcript_blob, topic, summary) "
+                      f"VALUES (:id, :transcript_blob, :topic, :summary)")
+
+_PG_INSERT = text(f"INSERT INTO {SEARCH_TABLE} (transcription_id, document) "
+                  f"VALUES (:id, {_pg_document_sql(':topic', ':summary', ':transcript_text')})")
+
+def rebuild_search_index(conn, chunk_size=1000):
+    """Indexa todas as transcrições concluídas (usado na criação do índice)."""
+    # Bases anteriores às migrações 12 e 13 ainda não têm a referência ao armazém nem versões da análise
+    has_blob = 'transcript_blob' in {c['name'] for c in inspect(conn).get_columns('transcriptions')}
+    current = " AND a.is_current" if 'is_current' in {c['name'] for c in inspect(conn).get_columns('analyses')} else ""
+    clear_search_index(conn)
+    postgres = _is_postgres(conn)
+
+    # Os textos vêm do armazém (e os radicais, no SQLite, são calculados em Python): as
+    # linhas são lidas por blocos de ID
+    last_id = 0
+    while True:
+        rows = conn.execute(text(f"""
+            SELECT t.id, {'t.transcript_blob' if has_blob else 'NULL'}, t.transcript_text, a.summary, a.topic
+            FROM transcriptions t JOIN analyses a ON a.transcription_id = t.id{current}
+            WHERE t.status = 'Concluído' AND t.id > :last_id
+            ORDER BY t.id LIMIT :limit"""), {'last_id': last_id, 'limit': chunk_size}).all()
+        if not rows:
+            break
+        documents = [(row_id, read_transcript(blob, legacy_text), summary, topic)
+                     for row_id, blob, legacy_text, summary, topic in rows]
+        if postgres:
+            conn.execute(_PG_INSERT, [{'id': row_id, 'transcript_text': body, 'summary': summary, 'topic': topic}
+                                      for row_id, body, summary, topic in documents])
+        else:
+            conn.execute(_FTS_INSERT, [_fts_row(*document) for document in documents])
+            conn.execute(_SOURCE_INSERT, [_source_row(*document) for document in documents])
+        last_id = rows[-1][0]
+
+
+# --- INDEXAÇÃO INCREMENTAL ---
+
+def index_transcription(transcription_id, transcript_text, summary, topic):
+    """(Re)indexa uma transcrição na transação corrente (o commit é de quem chama)."""
+    if _is_postgres(db.session.get_bind()):
+        db.session.execute(text(f"""
+            INSERT INTO {SEARCH_TABLE} (transcription_id, document)
+            VALUES (:id, {_pg_document_sql(':topic', ':summary', ':transcript_text')})
+            ON CONFLICT (transcription_id) DO UPDATE SET document = EXCLUDED.document"""),
+            {'id': transcription_id, 'transcript_text': transcript_text, 'summary': summary, 'topic': topic})
+    else:
+        _remove_fts_row(transcription_id)
+        db.session.execute(_FTS_INSERT, _fts_row(transcription_id, transcript_text, summary, topic))
+        db.session.execute(_SOURCE_INSERT, _source_row(transcription_id, transcript_text, summary, topic))
+
+def remove_from_index(transcription_id):
+    """Retira uma transcrição do índice (ex.: passou a erro), na transação corrente."""
+    if _is_postgres(db.session.get_bind()):
+        db.session.execute(text(f"DELETE FROM {SEARCH_TABLE} WHERE transcription_id = :id"), {'id': transcription_id})
+    else:
+        _remove_fts_row(transcription_id)
+
+def _remove_fts_row(transcription_id):
+    # Tabela sem conteúdo: o 'delete' do FTS5 recebe os mesmos valores (com radicais) que foram indexados
+    source = db.session.execute(text(f"""
+        SELECT transcript_blob, topic, summary FROM {SEARCH_SOURCES_TABLE}
+        WHERE transcription_id = :id"""), {'id': transcription_id}).first()
+    if source is None:
+        return
+    transcript_text = read_transcript(source.transcript_blob) if source.transcript_blob else None
+    if source.transcript_blob and transcript_text is None:
+        print(f"AVISO: Não foi possível retirar a transcrição {transcription_id} do índice de pesquisa; "
+              f"reconstrua o índice (`rebuild_search_index`).")
+    else:
+        db.session.execute(_FTS_DELETE, _fts_row(transcription_id, transcript_text, source.summary, source.topic))
+    db.session.execute(text(f"DELETE FROM {SEARCH_SOURCES_TABLE} WHERE transcription_id = :id"), {'id': transcription_id})
+
+
+# --- PESQUISA ---
+
+def build_fts_query(query):
+    """Converte o texto do utilizador numa expressão FTS5 segura (todos os radicais)."""
+    stems = [stem(term) for term in _WORD_RE.findall(query)]
+    if not stems:
+        raise ValueError("A pesquisa deve conter pelo menos uma palavra.")
+    return ' '.join(f'"{s}"' for s in stems)
+
+def _highlight(snippet):
+    if not snippet:
+        return ''
+    escaped = html.escape(snippet)
+    return escaped.replace(_MARK_START, '<mark>').replace(_MARK_END, '</mark>')
+
+def make_snippet(fields, stems, words=SNIPPET_WORDS):
+    """Excerto do primeiro campo com correspondências, com os termos entre <mark> (HTML escapado)."""
+    for value in fields:
+        if not value:
+            continue
+        tokens = list(_WORD_RE.finditer(value))
+        hits = {i for i, token in enumerate(tokens) if stem(token.group()) in stems}
+        if not hits:
+            continue
+        first = max(0, min(hits) - words // 4)
+        last = min(len(tokens), first + words)
+        start, end = tokens[first].start(), tokens[last - 1].end()
+
+        parts = ['…' if start > 0 else '']
+        position = start
+        for i in range(first, last):
+            if i in hits:
+                token = tokens[i]
+                parts.append(html.escape(value[position:token.start()]))
+                parts.append(f"<mark>{html.escape(token.group())}</mark>")
+                position = token.end()
+        parts.append(html.escape(value[position:end]))
+        parts.append('…' if end < len(value) else '')
+        return ''.join(parts)
+    return ''
+
+def _page_texts(page_ids):
+    """{id: (resumo, texto da transcrição)} das linhas de uma página de resultados."""
+    if not page_ids:
+        return {}
+    rows = db.session.execute(text(f"""
+        SELECT t.id, a.summary, t.transcript_blob, t.transcript_text
+        FROM transcriptions t LEFT JOIN analyses a ON a.transcription_id = t.id AND a.is_current
+        WHERE t.id IN ({', '.join(str(int(i)) for i in page_ids)})"""))
+    return {row.id: (row.summary, read_transcript(row.transcript_blob, row.transcript_text)) for row in rows}
+
+def search_transcriptions(query, batch_id=None, page=1, per_page=20, max_candidates=5000):
+    """Transcrições concluídas que correspondem a `query`, ordenadas por relevância.
+
+    Para que termos muito frequentes não obriguem a pontuar todo o índice, a relevância
+    é calculada só entre as `max_candidates` correspondências mais recentes. Devolve uma
+    página com excertos em que os termos encontrados vêm entre <mark> (o resto do texto
+    vem escapado).
+    """
+    params = {'batch_id': batch_id, 'candidates': max_candidates,
+              'limit': per_page + 1, 'offset': (page - 1) * per_page}
+    batch_filter = "AND t.batch_id = :batch_id" if batch_id is not None else ""
+
+    if _is_postgres(db.session.get_bind()):
+        if not _WORD_RE.search(query):
+            raise ValueError("A pesquisa deve conter pelo menos uma palavra.")
+        params['query'] = query
+        sql = f"""
+            SELECT page.id, page.score, t.filename, t.batch_id, b.name AS batch_name,
+                   a.topic, a.sentiment
+            FROM (
+                SELECT c.id, ts_rank_cd(c.document, c.q) AS score, c.q
+                FROM (
+                    SELECT s.transcription_id AS id, s.document, q
+                    FROM {SEARCH_TABLE} s
+                    JOIN transcriptions t ON t.id = s.transcription_id,
+                         websearch_to_tsquery('{PG_CONFIG}', :query) q
+                    WHERE s.document @@ q AND t.status = 'Concluído' {batch_filter}
+                    ORDER BY s.transcription_id DESC
+                    LIMIT :candidates
+                ) c
+                ORDER BY score DESC, c.id DESC
+                LIMIT :limit OFFSET :offset
+            ) page
+            JOIN transcriptions t ON t.id = page.id
+            JOIN batches b ON b.id = t.batch_id
+            LEFT JOIN analyses a ON a.transcription_id = t.id AND a.is_current
+            ORDER BY page.score DESC, page.id DESC"""
+        rows = [dict(row) for row in db.session.execute(text(sql), params).mappings()]
+
+        # O excerto (ts_headline) só é calculado para as linhas da página, com o texto lido do armazém
+        headline = text(f"""
+            SELECT ts_headline('{PG_CONFIG}', :document, websearch_to_tsquery('{PG_CONFIG}', :query), :options)""")
+        options = f"StartSel={_MARK_START}, StopSel={_MARK_END}, MaxWords=35, MinWords=15, MaxFragments=2"
+        texts = _page_texts([row['id'] for row in rows[:per_page]])
+        for row in rows[:per_page]:
+            summary, body = texts.get(row['id'], (None, None))
+            document = f"{summary or ''} … {body or ''}"
+            row['snippet'] = _highlight(db.session.execute(headline, {'document': document, 'query': query, 'options': options}).scalar())
+    else:
+        params['query'] = build_fts_query(query)
+        # bm25 com pesos por coluna (tópico, resumo, transcrição); valores menores são melhores.
+        # O FTS5 percorre as correspondências por rowid, pelo que o LIMIT interno pára cedo.
+        sql = f"""
+            SELECT c.id, -c.rank AS score, t.filename, t.batch_id, b.name AS batch_name,
+                   a.topic, a.sentiment
+            FROM (
+                SELECT s.rowid AS id, bm25({SEARCH_TABLE}, 4.0, 2.0, 1.0) AS rank
+                FROM {SEARCH_TABLE} s
+                {"JOIN transcriptions t ON t.id = s.rowid" if batch_id is not None else ""}
+                WHERE {SEARCH_TABLE} MATCH :query {batch_filter}
+                ORDER BY s.rowid DESC
+                LIMIT :candidates
+            ) c
+            JOIN transcriptions t ON t.id = c.id
+            JOIN batches b ON b.id = t.batch_id
+            LEFT JOIN analyses a ON a.transcription_id = t.id AND a.is_current
+            WHERE t.status = 'Concluído'
+            ORDER BY c.rank, c.id DESC
+            LIMIT :limit OFFSET :offset"""
+        rows = [dict(row) for row in db.session.execute(text(sql), params).mappings()]
+
+        # Textos completos só para as linhas da página (não para todos os candidatos ordenados)
+        stems = {stem(term) for term in _WORD_RE.findall(query)}
+        texts = _page_texts([row['id'] for row in rows[:per_page]])
+        for row in rows:
+            summary, body = texts.get(row['id'], (None, None))
+            row['snippet'] = make_snippet([summary, body, row['topic']], stems)
+
+    has_more = len(rows) > per_page
+    items = rows[:per_page]
+    for item in items:
+        item['score'] = round(float(item['score']), 4)
+    return {'items': items, 'page': page, 'has_more': has_more}
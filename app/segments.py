@@ -0,0 +1,109 @@
+from sqlalchemy import func
+
+from .models import db, Segment, Transcription
+
+# Segmentos (falas) de uma transcrição: interveniente, início e fim (segundos desde o início
+# do áudio) e texto. São montados a partir das palavras com tempos do Chirp (`chirp.py`)
+# numa só passagem e gravados com o resultado do pipeline; a interface carrega-os por
+# páginas e o tempo de fala por interveniente é somado em SQL. Transcrições da API externa
+# só trazem texto e não têm segmentos.
+
+# Uma pausa maior do que isto (s) dentro do mesmo interveniente começa um segmento novo
+SEGMENT_MAX_GAP = 2.0
+
+
+# --- MONTAGEM ---
+
+def build_segments(words, max_gap=SEGMENT_MAX_GAP):
+    """Agrupa palavras consecutivas (ordenadas por tempo) em segmentos, em tempo linear.
+
+    Um segmento termina quando o interveniente muda ou depois de uma pausa de mais de
+    `max_gap` segundos. `words` são objetos com `word`, `start`, `end` e `speaker`.
+    """
+    segments = []
+    current = None
+    for word in words:
+        if current is None or word.speaker != current['speaker'] or word.start - current['end'] > max_gap:
+            current = {'speaker': word.speaker, 'start': word.start, 'end': word.end, 'words': []}
+            segments.append(current)
+        current['words'].append(word.word)
+        current['end'] = max(current['end'], word.end)
+    for segment in segments:
+        segment['text'] = " ".join(segment.pop('words'))
+    return segments
+
+def format_dialogue(segments):
+    """Diálogo em markdown, com o interveniente indicado sempre que muda."""
+    parts = []
+    speaker = None
+    for segment in segments:
+        if segment['speaker'] != speaker:
+            speaker = segment['speaker']
+            parts.append(f"\n\n**Interveniente {speaker}:** ")
+        else:
+            parts.append(" ")
+        parts.append(segment['text'])
+    return "".join(parts).strip()
+
+
+# --- GRAVAÇÃO ---
+
+def replace_segments(transcription_id, segments):
+    """Substitui os segmentos da transcrição na transação corrente (o commit é de quem chama)."""
+    Segment.query.filter_by(transcription_id=transcription_id).delete(synchronize_session=False)
+    if segments:
+        db.session.execute(Segment.__table__.insert(), [
+            {'transcription_id': transcription_id, 'position': i, 'speaker': s['speaker'],
+             'start_seconds': s['start'], 'end_seconds': s['end'], 'text': s['text']}
+            for i, s in enumerate(segments)
+        ])
+
+def copy_segments(source_id, target_id):
+    """Copia os segmentos de outra transcrição (resultado reaproveitado da cache)."""
+    Segment.query.filter_by(transcription_id=target_id).delete(synchronize_session=False)
+    columns = [Segment.position, Segment.speaker, Segment.start_seconds, Segment.end_seconds, Segment.text]
+    db.session.execute(Segment.__table__.insert().from_select(
+        ['transcription_id'] + [c.key for c in columns],
+        db.select(db.literal(target_id), *columns).where(Segment.transcription_id == source_id)
+    ))
+
+
+# --- LEITURA ---
+
+def get_segments_page(transcription_id, after=None, limit=200):
+    """Segmentos a seguir à posição `after` (keyset); `next_after` é None na última página."""
+    query = Segment.query.filter(Segment.transcription_id == transcription_id)
+    if after is not None:
+        query = query.filter(Segment.position > after)
+    rows = query.order_by(Segment.position).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        'transcription_id': transcription_id,
+        'segments': [row.to_dict() for row in rows],
+        'next_after': rows[-1].position if has_more else None
+    }
+
+def get_segments_text(transcription_id):
+    """Texto de todos os segmentos por ordem, sem intervenientes (o texto dado à análise no Chirp)."""
+    rows = db.session.query(Segment.text).filter(Segment.transcription_id == transcription_id)\
+        .order_by(Segment.position)
+    return " ".join(text for text, in rows)
+
+def get_talk_time(transcription_id=None, batch_id=None):
+    """Tempo de fala (s), número de segmentos e percentagem por interveniente, somados em SQL."""
+    duration = func.sum(Segment.end_seconds - Segment.start_seconds)
+    query = db.session.query(Segment.speaker, duration, func.count(Segment.id))
+    if transcription_id is not None:
+        query = query.filter(Segment.transcription_id == transcription_id)
+    if batch_id is not None:
+        query = query.join(Transcription, Transcription.id == Segment.transcription_id)\
+            .filter(Transcription.batch_id == batch_id)
+    rows = query.group_by(Segment.speaker).order_by(duration.desc()).all()
+    total = sum(seconds or 0 for _, seconds, _ in rows)
+    return [{
+        'speaker': speaker,
+        'seconds': round(seconds or 0, 2),
+        'segments': int(count),
+        'share': round((seconds or 0) * 100 / total, 1) if total else 0.0
+    } for speaker, seconds, count in rows]
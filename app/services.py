@@ -1,187 +1,133 @@
 import os
-import json
-import threading
+import tempfile
+from collections import Counter
 from datetime import datetime
 import requests
-import time
-import librosa
-import io
-import hashlib
 from werkzeug.utils import secure_filename
 from flask import current_app
-
-# Imports do Google
-import vertexai
-from google.cloud import speech
-from vertexai.generative_models import GenerativeModel
-
-# Imports locais
-from .models import db, Batch, Transcription, Analysis
+from sqlalchemy import func
+from sqlalchemy.orm import joinedload
+
+# Imports locais (os SDKs pesados — librosa, Speech, Vertex AI — só são importados no
+# primeiro uso: ver `transcribe_with_google_chirp` e `clients.py`)
+from .models import db, Batch, Transcription, Analysis, Job, Upload, add_analysis_version
+from .analysis import analyze_transcript, resolve_prompt_version
+from .audio import preprocess_audio, guess_mime_type
+from .cache import save_and_hash, hash_file, cache_key_model, find_cached_result, copy_cached_result, record_lookup
+from .ratelimit import get_scheduler, get_scheduler_stats
+from .stats import record_analysis_stats, get_dashboard_aggregates, get_dashboard_page, get_action_items_by_topic, get_sentiment_by_operator
+from .jobs import enqueue_job, finish_job, mark_job_waiting, notify_workers
+from .search import index_transcription, remove_from_index, search_transcriptions
+from .export import export_analyses, parse_date
+from .catalogue import get_available_models
+from .clients import get_http_session
+from .uploads import new_upload_id, upload_write_lock, write_chunk, finish_hash
+from .segments import replace_segments, get_segments_page, get_segments_text, get_talk_time
+from .blobs import (store_file, find_upload, is_blob_path, touch, save_transcript, load_transcript, read_transcript,
+                    save_analysis_input, load_analysis_input)
+from .metrics import REGISTRY, JOBS, PROVIDER_CONCURRENCY, PROVIDER_IN_FLIGHT
+from .timings import (StageTimer, last_stage_end, get_batch_timings, get_transcription_timings,
+                      STAGE_QUEUE_WAIT, STAGE_PREPROCESS, STAGE_UPLOAD, STAGE_TRANSCRIPTION, STAGE_ANALYSIS, STAGE_PERSIST)
+from .profiling import should_profile, profile_job, find_latest_profile
+from .progress import STATUS_DONE, set_status, report_progress, is_final_status, stream_batch_progress
 from config import Config
 
-# --- INICIALIZAÇÃO DE SERVIÇOS EXTERNOS ---
-try:
-    vertexai.init(project=Config.PROJECT_ID, location=Config.LOCATION)
-    print("Vertex AI inicializado com sucesso.")
-except Exception as e:
-    print(f"AVISO: Não foi possível inicializar a Vertex AI. Verifique a autenticação gcloud. Erro: {e}")
-
 
 # --- LÓGICA DE TRANSCRIÇÃO ---
 
-def transcribe_via_api(file_path, filename, model_id, entry_id):
-    """Orquestra a transcrição usando a API externa."""
+def submit_api_job(file_path, filename, model_id, entry_id, mime_type='audio/ogg'):
+    """Envia o ficheiro para a API de transcrição externa e devolve o ID do job criado.
+
+    O acompanhamento do job é feito pelo poller partilhado (ver `poller.py`), de modo
+    que o worker fica livre assim que o envio termina.
+    """
     print(f"Redirecionando '{filename}' para a API de transcrição externa no modelo '{model_id}'...")
-    
-    # Etapa 1: Enviar o job para a API
-    try:
+
+    def post_job():
         with open(file_path, 'rb') as f:
-            files = {'files': (filename, f, 'audio/ogg')}
+            files = {'files': (filename, f, mime_type)}
             payload = {'model_id': model_id, 'session_id': str(entry_id), 'language': 'pt'}
-            response = requests.post(f"{Config.PUBLIC_URL_API}/jobs", files=files, data=payload, timeout=30)
+            response = get_http_session().post(f"{Config.PUBLIC_URL_API}/jobs", files=files, data=payload, timeout=30)
             response.raise_for_status()
+            return response
+
+    try:
+        # Só erros de quota são repetidos: uma falha de rede pode já ter criado o job
+        response = get_scheduler('jobs_api').call(post_job, retry_transient=False)
         
         job_info = response.json().get('jobs_created', [])
         if not job_info:
             raise ValueError("A API não retornou um ID de job válido.")
         job_id = job_info[0]['job_id']
         print(f"Job criado na API com sucesso. ID: {job_id}")
+        return job_id
 
     except requests.exceptions.RequestException as e:
         raise ConnectionError(f"Falha ao conectar ou enviar job para a API de transcrição: {e}")
     except Exception as e:
         raise ValueError(f"Erro ao processar resposta da criação de job da API: {e}")
 
-    # Etapa 2: Monitorar (poll) o status do job
-    while True:
-        try:
-            status_response = requests.get(f"{Config.PUBLIC_URL_API}/jobs/{job_id}", timeout=10)
-            status_response.raise_for_status()
-            job_status = status_response.json()
-            
-            status = job_status.get('status')
-            progress = job_status.get('progress', 0)
-
-            # Atualiza o status no banco de dados local
-            transcription = Transcription.query.get(entry_id)
-            if transcription:
-                transcription.status = f"A transcrever (API): {progress}%"
-                db.session.commit()
-
-            if status == 'completed':
-                print(f"Job {job_id} concluído na API.")
-                break
-            elif status in ['failed', 'cancelled']:
-                error_details = job_status.get('debug_log', ['Erro desconhecido na API.'])[-1]
-                raise RuntimeError(f"Job na API falhou ou foi cancelado. Detalhe: {error_details}")
-            
-            time.sleep(5)
-
-        except requests.exceptions.RequestException as e:
-            raise ConnectionError(f"Falha ao verificar status do job na API: {e}")
+def download_api_result(job_id):
+    """Baixa o diálogo formatado e o texto simples de um job concluído na API externa."""
+    def download(text_type):
+        response = get_http_session().get(f"{Config.PUBLIC_URL_API}/jobs/{job_id}/download", params={"text_type": text_type}, timeout=30)
+        response.raise_for_status()
+        return response.text
 
-    # Etapa 3: Baixar o resultado
     try:
-        download_response = requests.get(f"{Config.PUBLIC_URL_API}/jobs/{job_id}/download", params={"text_type": "transcription_dialogue_markdown"}, timeout=30)
-        download_response.raise_for_status()
-        full_dialogue = download_response.text
-
-        download_simple_response = requests.get(f"{Config.PUBLIC_URL_API}/jobs/{job_id}/download", params={"text_type": "transcription_raw"}, timeout=30)
-        download_simple_response.raise_for_status()
-        analysis_input = download_simple_response.text
-
+        scheduler = get_scheduler('jobs_api')
+        full_dialogue = scheduler.call(download, "transcription_dialogue_markdown")
+        analysis_input = scheduler.call(download, "transcription_raw")
         return full_dialogue, analysis_input
 
     except requests.exceptions.RequestException as e:
         raise ConnectionError(f"Falha ao baixar resultado da API: {e}")
 
-def transcribe_with_google_chirp(file_path):
-    """Função específica para o modelo Chirp da Google."""
+def transcribe_with_google_chirp(file_path, recognizer=None, on_progress=None):
+    """Função específica para o modelo Chirp da Google.
+
+    O áudio é dividido em blocos nos silêncios e os blocos são transcritos em paralelo
+    (ver `chirp.py`). `recognizer` permite substituir o Chirp por um reconhecedor local;
+    `on_progress(concluídos, total)` é chamado à medida que os blocos terminam. Devolve
+    (diálogo, texto para análise, segmentos com interveniente e tempos).
+    """
     try:
-        client = speech.SpeechClient()
-        _, sr = librosa.load(file_path, sr=None)
-        print(f"Taxa de amostragem detetada para Chirp: {sr}Hz")
+        # Importação tardia: librosa e o SDK Speech só são carregados quando o Chirp é usado
+        from .chirp import ChirpRecognizer, transcribe_long_audio
+        if recognizer is None:
+            recognizer = ChirpRecognizer(Config.PROJECT_ID, scheduler=get_scheduler('chirp'))
 
-        with io.open(file_path, "rb") as audio_file:
-            content = audio_file.read()
-        
-        audio = speech.RecognitionAudio(content=content)
-        config = speech.RecognitionConfig(
-            auto_decoding_config={}, model="chirp", language_codes=["pt-BR"],
-            features=speech.RecognitionFeatures(
-                enable_automatic_punctuation=True, enable_speaker_diarization=True,
-                min_speaker_count=1, max_speaker_count=2
-            ),
-        )
-        
         print(f"A enviar para o Google Chirp...")
-        recognizer_path = f"projects/{Config.PROJECT_ID}/locations/global/recognizers/_"
-        request_chirp = speech.RecognizeRequest(config=config, audio=audio, recognizer=recognizer_path)
-        response = client.recognize(request=request_chirp)
-
-        if not response.results:
+        full_transcript, analysis_input, segments = transcribe_long_audio(
+            file_path, recognizer,
+            max_chunk_seconds=Config.CHIRP_CHUNK_SECONDS,
+            overlap_seconds=Config.CHIRP_CHUNK_OVERLAP_SECONDS,
+            max_concurrency=Config.CHIRP_MAX_CONCURRENCY,
+            top_db=Config.CHIRP_SILENCE_TOP_DB,
+            on_progress=on_progress
+        )
+        if not analysis_input:
             raise ValueError("A API de transcrição Google não retornou resultados.")
-
-        result = response.results[-1]
-        if not result.alternatives or not result.alternatives[0].words:
-            return result.alternatives[0].transcript, result.alternatives[0].transcript
-
-        words_info = result.alternatives[0].words
-        full_transcript = ""
-        current_speaker = None
-        for word in words_info:
-            if word.speaker != current_speaker:
-                current_speaker = word.speaker
-                full_transcript += f"\n\n**Interveniente {current_speaker}:** "
-            full_transcript += word.word + " "
-        return full_transcript.strip(), result.alternatives[0].transcript
+        return full_transcript, analysis_input, segments
     except Exception as e:
         print(f"Erro no agente de transcrição Google Chirp: {e}")
-        return f"Erro na transcrição com Google: {e}", None
+        return f"Erro na transcrição com Google: {e}", None, []
 
 
 # --- LÓGICA DE ANÁLISE COM IA ---
 
-def run_ai_analysis_pipeline(transcript_text):
-    """Pipeline de Agentes de Análise com Gemini."""
-    if not transcript_text:
-        return {"error": "Texto para análise está vazio."}
+def run_ai_analysis_pipeline(transcript_text, key=None, prompt_version=None):
+    """Pipeline de Agentes de Análise com Gemini.
 
-    model = GenerativeModel("gemini-1.5-flash-preview-0514")
-    prompt = f"""
-    Você é um sistema de múltiplos agentes de IA para análise de conversas. Analise a seguinte transcrição e retorne um objeto JSON.
-
-    **Transcrição:**
-    ---
-    {transcript_text}
-    ---
-
-    **Tarefas dos Agentes:**
-    1.  **Agente de Identificação:** Identifique o "Operador" e o "Aluno". Se não for claro, use "Interveniente 1" e "Interveniente 2".
-    2.  **Agente de Resumo:** Crie um resumo executivo conciso da conversa.
-    3.  **Agente de Sentimento:** Analise o sentimento geral do Aluno ("Positivo", "Negativo", "Neutro").
-    4.  **Agente de Tópicos:** Qual é o tópico principal da conversa em 2-3 palavras?
-    5.  **Agente de Ação:** Identifique até 3 itens de ação claros. Se não houver, retorne uma lista vazia.
-
-    **Formato de Saída Obrigatório (APENAS JSON):**
-    {{
-      "speaker_identification": {{"operator": "...", "student": "..."}},
-      "summary": "...",
-      "sentiment": "...",
-      "main_topic": "...",
-      "action_items": []
-    }}
+    Transcrições curtas são agrupadas com as de outros workers num único prompt e as
+    muito longas são analisadas em map-reduce (ver `analysis.py`). `key` identifica a
+    transcrição dentro de um lote.
     """
+    if not transcript_text:
+        return {"error": "Texto para análise está vazio."}
 
     try:
-        response = model.generate_content(prompt)
-        json_text = response.text.strip()
-        # Limpa o texto para garantir que é um JSON válido
-        start_index = json_text.find('{')
-        end_index = json_text.rfind('}') + 1
-        if start_index == -1 or end_index == 0:
-            raise ValueError("Nenhum JSON encontrado na resposta da IA.")
-        return json.loads(json_text[start_index:end_index])
+        return analyze_transcript(transcript_text, key, prompt_version)
     except Exception as e:
         print(f"Erro no pipeline de análise com IA: {e}")
         return {"error": f"Falha na análise da IA: {e}"}
@@ -189,108 +135,292 @@ def run_ai_analysis_pipeline(transcript_text):
 
 # --- PIPELINE DE PROCESSAMENTO PRINCIPAL ---
 
-def process_file_pipeline_thread_target(app, entry_id, file_path, filename, file_type, model_id):
-    """Função alvo da thread que garante o contexto da aplicação."""
-    with app.app_context():
-        process_file_pipeline(entry_id, file_path, filename, file_type, model_id)
+# Cabeçalho do diálogo guardado para ficheiros de texto (o texto em si é o que vai para a análise)
+TEXT_FILE_HEADER = "**Texto do Ficheiro:**\n\n"
+
+def run_job(job):
+    """Executa um job reservado da fila persistente (chamado pelos workers)."""
+    transcription = db.session.get(Transcription, job.transcription_id)
+    if transcription and is_final_status(transcription.status):
+        # Já processado numa execução anterior (ex.: reinício antes de fechar o job)
+        finish_job(job.id)
+        return
 
-def process_file_pipeline(entry_id, file_path, filename, file_type, model_id):
-    """Orquestrador do pipeline de processamento para cada ficheiro."""
+    job_id = job.id
+    timer = StageTimer(job.transcription_id, job.model_id)
+    try:
+        with profile_job(job, should_profile(job)):
+            if job.stage == Job.STAGE_RESUME_API:
+                resume_api_pipeline(job.transcription_id, timer=timer, prompt_version=job.prompt_version, reprocess=job.reprocess)
+            elif job.stage == Job.STAGE_REANALYZE:
+                if job.started_at:
+                    timer.record(STAGE_QUEUE_WAIT, (job.started_at - job.created_at).total_seconds(), started_at=job.created_at)
+                reanalyze_pipeline(job.transcription_id, job.prompt_version, timer=timer)
+            else:
+                if job.started_at:
+                    timer.record(STAGE_QUEUE_WAIT, (job.started_at - job.created_at).total_seconds(), started_at=job.created_at)
+                external_job_id = process_file_pipeline(job.transcription_id, job.file_path, job.filename, job.file_type, job.model_id,
+                                                        force=job.force, timer=timer, prompt_version=job.prompt_version,
+                                                        reprocess=job.reprocess)
+                if external_job_id:
+                    timer.save()
+                    mark_job_waiting(job_id, job.transcription_id, external_job_id)
+                    return
+    except Exception as e:
+        # O pipeline já registou o erro na transcrição; aqui fica registado no job
+        db.session.rollback()
+        timer.save()
+        finish_job(job_id, error=str(e))
+        return
+    timer.save()
+    finish_job(job_id)
+
+def process_file_pipeline(entry_id, file_path, filename, file_type, model_id, force=False, timer=None, prompt_version=None,
+                          reprocess=False):
+    """Orquestrador do pipeline de processamento para cada ficheiro.
+
+    Se já existir um resultado para o mesmo conteúdo e modelo, ele é reaproveitado
+    (a menos que `force` seja verdadeiro). Devolve o ID do job externo quando a transcrição foi delegada à API externa;
+    nesse caso o pipeline continua em `resume_api_pipeline` quando o job terminar.
+    A duração de cada etapa é registada em `timer` (ver `timings.py`); a análise usa a versão
+    `prompt_version` do prompt (padrão: ANALYSIS_PROMPT_VERSION). Com `reprocess`, uma falha
+    mantém a versão atual da análise (ver `mark_pipeline_error`).
+    """
     print(f"Iniciando pipeline para '{filename}' (ID: {entry_id}) com o modelo '{model_id}'")
+    own_timer = timer is None
+    timer = timer or StageTimer(entry_id, model_id)
     full_dialogue = None
     analysis_input = None
+    segments = [] # Só o Chirp devolve tempos por palavra
     
     try:
         # --- ETAPA 1: TRANSCRIÇÃO OU LEITURA ---
-        transcription = Transcription.query.get(entry_id)
+        transcription = db.session.get(Transcription, entry_id)
         if not transcription:
             print(f"ERRO: Transcrição com ID {entry_id} não encontrada no pipeline.")
-            return
+            return None
+
+        # --- ETAPA 0: CACHE POR CONTEÚDO ---
+        prompt_version = resolve_prompt_version(prompt_version)
+        if transcription.audio_hash and not force:
+            key_model = cache_key_model(file_type, model_id)
+            cached = find_cached_result(transcription.audio_hash, key_model, prompt_version, exclude_id=entry_id)
+            record_lookup(key_model, cached is not None)
+            if cached:
+                with timer.stage(STAGE_PERSIST, 'cache'):
+                    copy_cached_result(cached, transcription)
+                    record_analysis_stats(transcription.batch_id, cached.analysis.sentiment, cached.analysis.topic)
+                    index_transcription(transcription.id, load_transcript(transcription), cached.analysis.summary, cached.analysis.topic)
+                    set_status(transcription, STATUS_DONE)
+                    db.session.commit()
+                print(f"Resultado reaproveitado da transcrição {cached.id} para '{filename}' (cache por conteúdo).")
+                return None
 
         if file_type == 'audio':
-            transcription.status = f"Aguardando na fila para o modelo '{model_id}'..."
-            db.session.commit()
+            report_progress(transcription, f"Aguardando na fila para o modelo '{model_id}'...", progress=0)
+            db.session.commit() # Nada a gravar: só devolve a ligação ao pool durante a transcrição
+            
+            # Pré-processamento: mono 16 kHz comprimido, com cache pelo hash do conteúdo
+            audio_path, mime_type = file_path, guess_mime_type(file_path)
+            if Config.AUDIO_PREPROCESS:
+                with timer.stage(STAGE_PREPROCESS, 'ffmpeg'):
+                    audio_path, mime_type = preprocess_audio(
+                        file_path, transcription.audio_hash or hash_file(file_path),
+                        Config.PROCESSED_AUDIO_FOLDER,
+                        target_format=Config.AUDIO_TARGET_FORMAT,
+                        trim_silence=Config.AUDIO_TRIM_SILENCE
+                    )
             
             if model_id == 'google_chirp':
-                full_dialogue, analysis_input = transcribe_with_google_chirp(file_path)
+                def report_chunks(done, total):
+                    report_progress(transcription, f"A transcrever (Chirp): {done}/{total} blocos", progress=done * 100 // total)
+                with timer.stage(STAGE_TRANSCRIPTION, 'chirp'):
+                    full_dialogue, analysis_input, segments = transcribe_with_google_chirp(audio_path, on_progress=report_chunks)
             else:
-                full_dialogue, analysis_input = transcribe_via_api(file_path, filename, model_id, entry_id)
+                upload_name = os.path.splitext(filename)[0] + os.path.splitext(audio_path)[1]
+                with timer.stage(STAGE_UPLOAD, 'jobs_api'):
+                    external_job_id = submit_api_job(audio_path, upload_name, model_id, entry_id, mime_type)
+                transcription.external_job_id = external_job_id
+                set_status(transcription, "A transcrever (API): 0%", progress=0)
+                db.session.commit()
+                return external_job_id
         elif file_type == 'text':
             with open(file_path, 'r', encoding='utf-8') as f:
                 analysis_input = f.read()
-            full_dialogue = f"**Texto do Ficheiro:**\n\n{analysis_input}"
+            full_dialogue = TEXT_FILE_HEADER + analysis_input
         
         if analysis_input is None:
             raise ValueError(full_dialogue or "Falha ao obter texto para análise.")
 
-        # --- ETAPA 2: ANÁLISE COM IA ---
-        transcription.transcript_text = full_dialogue
-        transcription.status = 'A Analisar com IA...'
-        db.session.commit()
-        
-        analysis_result = run_ai_analysis_pipeline(analysis_input)
-        if "error" in analysis_result:
-             raise ValueError(analysis_result["error"])
-
-        # --- ETAPA 3: SALVAR RESULTADOS ---
-        new_analysis = Analysis(
-            transcription_id=entry_id,
-            sentiment=analysis_result.get("sentiment"),
-            topic=analysis_result.get("main_topic"),
-            summary=analysis_result.get("summary"),
-            full_analysis_json=json.dumps(analysis_result, ensure_ascii=False)
-        )
-        db.session.add(new_analysis)
-        
-        transcription.status = 'Concluído'
-        db.session.commit()
+        analyze_and_save(transcription, full_dialogue, analysis_input, timer, prompt_version, segments)
         print(f"Pipeline concluído com sucesso para '{filename}'.")
 
     except Exception as e:
-        error_message = f"Erro no pipeline: {e}"
-        print(error_message)
-        transcription = Transcription.query.get(entry_id)
-        if transcription:
-            transcription.status = error_message
-            transcription.transcript_text = full_dialogue or str(e)
-            db.session.commit()
+        mark_pipeline_error(entry_id, e, full_dialogue, reprocess)
+        raise
     finally:
-        # Limpeza do ficheiro temporário
-        if os.path.exists(file_path):
+        if own_timer:
+            timer.save()
+        if is_blob_path(file_path):
+            touch(file_path) # Fica no armazém para reprocessamento (ver retenção em `blobs.py`)
+        elif os.path.exists(file_path):
+            # Limpeza do ficheiro temporário
             os.remove(file_path)
             print(f"Ficheiro temporário removido: {filename}")
+    return None
 
+def resume_api_pipeline(entry_id, timer=None, prompt_version=None, reprocess=False):
+    """Continua o pipeline de um ficheiro cujo job na API externa foi concluído."""
+    full_dialogue = None
+    own_timer = timer is None
+    timer = timer or StageTimer(entry_id, None)
+    try:
+        transcription = db.session.get(Transcription, entry_id)
+        if not transcription or not transcription.external_job_id:
+            print(f"ERRO: Transcrição com ID {entry_id} sem job externo para retomar.")
+            return
+        timer.model_id = timer.model_id or transcription.model_id
 
-# --- FUNÇÕES DE SERVIÇO PARA AS ROTAS ---
+        # A transcrição remota conta desde o fim do envio até o resultado estar descarregado
+        uploaded_at = last_stage_end(entry_id, STAGE_UPLOAD)
+        started_at = uploaded_at or datetime.utcnow()
+        try:
+            full_dialogue, analysis_input = download_api_result(transcription.external_job_id)
+        finally:
+            timer.record(STAGE_TRANSCRIPTION, (datetime.utcnow() - started_at).total_seconds(), 'jobs_api',
+                         'ok' if full_dialogue is not None else 'error', started_at)
+        analyze_and_save(transcription, full_dialogue, analysis_input, timer, resolve_prompt_version(prompt_version), segments=[])
+        print(f"Pipeline concluído com sucesso para '{transcription.filename}'.")
+    except Exception as e:
+        mark_pipeline_error(entry_id, e, full_dialogue, reprocess)
+        raise
+    finally:
+        if own_timer:
+            timer.save()
 
-def get_available_models():
-    """Busca modelos da API externa e adiciona os locais."""
+def reanalyze_pipeline(entry_id, prompt_version=None, timer=None):
+    """Volta a analisar a transcrição guardada (sem transcrever de novo) com outra versão do prompt."""
+    full_dialogue = None
+    own_timer = timer is None
+    timer = timer or StageTimer(entry_id, None)
     try:
-        response = requests.get(f"{Config.PUBLIC_URL_API}/models", timeout=5)
-        if response.status_code == 200:
-            api_models = response.json().get('available_models', [])
-            # Garante que o Chirp não seja duplicado
-            if 'google_chirp' in api_models:
-                api_models.remove('google_chirp')
-            return api_models + ['google_chirp']
-    except requests.exceptions.RequestException as e:
-        print(f"AVISO: Não foi possível contactar a API de transcrição. Erro: {e}")
-    return ['google_chirp'] # Retorna o fallback
+        transcription = db.session.get(Transcription, entry_id)
+        if not transcription:
+            print(f"ERRO: Transcrição com ID {entry_id} não encontrada para reanálise.")
+            return
+        timer.model_id = timer.model_id or transcription.model_id
+        full_dialogue = load_transcript(transcription)
+        if not full_dialogue:
+            raise ValueError("Texto da transcrição não encontrado no armazém.")
+        analysis_input = stored_analysis_input(transcription, full_dialogue)
+        analyze_and_save(transcription, full_dialogue, analysis_input, timer, resolve_prompt_version(prompt_version))
+        print(f"Reanálise concluída para '{transcription.filename}'.")
+    except Exception as e:
+        mark_pipeline_error(entry_id, e, full_dialogue, reprocess=True)
+        raise
+    finally:
+        if own_timer:
+            timer.save()
+
+def stored_analysis_input(transcription, full_dialogue):
+    """O texto dado à análise original, para que a reanálise compare versões do prompt sobre o mesmo texto.
+
+    Linhas anteriores à coluna `analysis_input_blob` usam os segmentos (Chirp), o conteúdo de
+    um ficheiro de texto ou, em último caso, o diálogo formatado.
+    """
+    analysis_input = load_analysis_input(transcription) or get_segments_text(transcription.id)
+    if analysis_input:
+        return analysis_input
+    if full_dialogue.startswith(TEXT_FILE_HEADER):
+        return full_dialogue[len(TEXT_FILE_HEADER):]
+    return full_dialogue
 
-def create_and_process_batch(files, batch_name, model_id):
-    """Cria um novo lote, salva os ficheiros e inicia o processamento em threads."""
-    ALLOWED_EXTENSIONS = {'.wav', '.mp3', '.flac', '.ogg', '.txt'}
+def analyze_and_save(transcription, full_dialogue, analysis_input, timer, prompt_version, segments=None):
+    """Etapas finais do pipeline: análise com IA e gravação dos resultados (como nova versão da análise).
+
+    `segments` substitui os segmentos da transcrição (None mantém os atuais, como na reanálise).
+    """
+    # --- ETAPA 2: ANÁLISE COM IA ---
+    report_progress(transcription, 'A Analisar com IA...')
+    db.session.commit() # Nada a gravar: só devolve a ligação ao pool durante a análise
     
-    # Define o modelo padrão
-    if not model_id:
-        api_models = get_available_models()
-        whisper_models = [m for m in api_models if 'whisper' in m.lower()]
-        if whisper_models:
-            model_id = whisper_models[0]
-        elif api_models:
-            model_id = api_models[0]
-        else:
-            model_id = 'google_chirp' # Fallback final
+    with timer.stage(STAGE_ANALYSIS, 'gemini'):
+        analysis_result = run_ai_analysis_pipeline(analysis_input, key=transcription.id, prompt_version=prompt_version)
+        if "error" in analysis_result:
+             raise ValueError(analysis_result["error"])
+
+    # --- ETAPA 3: SALVAR RESULTADOS ---
+    with timer.stage(STAGE_PERSIST, 'db'):
+        # O texto é gravado com o resultado, numa só transação (em caso de erro, por `mark_pipeline_error`)
+        save_transcript(transcription, full_dialogue)
+        save_analysis_input(transcription, analysis_input)
+        if segments is not None:
+            replace_segments(transcription.id, segments)
+        new_analysis = add_analysis_version(transcription, Analysis.from_result(
+            transcription.id, analysis_result, prompt_version=prompt_version,
+            model_id=transcription.model_id, transcript_blob=transcription.transcript_blob))
+        record_analysis_stats(transcription.batch_id, new_analysis.sentiment, new_analysis.topic)
+        index_transcription(transcription.id, full_dialogue, new_analysis.summary, new_analysis.topic)
+        
+        set_status(transcription, STATUS_DONE)
+        db.session.commit()
+
+def mark_pipeline_error(entry_id, error, full_dialogue=None, reprocess=False):
+    """Regista o erro do pipeline na transcrição correspondente (quem chama volta a lançar a exceção, para o job falhar).
+
+    Num reprocessamento, se a transcrição já tiver uma versão atual da análise, é essa que
+    se mantém (ver `restore_current_version`) e o erro fica só no job.
+    """
+    error_message = f"Erro no pipeline: {error}"
+    print(error_message)
+    db.session.rollback()
+    transcription = db.session.get(Transcription, entry_id)
+    if transcription and reprocess and restore_current_version(transcription):
+        db.session.commit()
+    elif transcription:
+        set_status(transcription, error_message)
+        remove_from_index(transcription.id)
+        save_transcript(transcription, full_dialogue or str(error))
+        db.session.commit()
+
+def restore_current_version(transcription):
+    """Reprocessamento falhado: a transcrição volta ao estado da versão atual da análise.
+
+    A versão atual volta a contar nos agregados (saiu deles ao entrar na fila, ver
+    `reprocess_transcriptions`). Devolve False se não houver versão atual. Sem commit.
+    """
+    analysis = transcription.analysis
+    if analysis is None:
+        return False
+    transcription.model_id = analysis.model_id or transcription.model_id
+    set_status(transcription, STATUS_DONE)
+    record_analysis_stats(transcription.batch_id, analysis.sentiment, analysis.topic)
+    return True
+
+
+# --- FUNÇÕES DE SERVIÇO PARA AS ROTAS ---
+
+ALLOWED_EXTENSIONS = {'.wav', '.mp3', '.flac', '.ogg', '.txt'}
+
+def resolve_model_id(model_id):
+    """Define o modelo padrão quando o cliente não escolheu nenhum."""
+    if model_id:
+        return model_id
+    api_models = get_available_models()
+    whisper_models = [m for m in api_models if 'whisper' in m.lower()]
+    if whisper_models:
+        return whisper_models[0]
+    elif api_models:
+        return api_models[0]
+    return 'google_chirp' # Fallback final
+
+def create_and_process_batch(files, batch_name, model_id, force_reprocess=False, profile=False):
+    """Cria um novo lote, salva os ficheiros e enfileira o processamento de cada um.
+
+    Com `force_reprocess`, resultados anteriores do mesmo conteúdo não são reaproveitados;
+    com `profile`, cada job é perfilado (ver `profiling.py`). Para lotes grandes, a interface usa o upload por blocos (`init_chunked_upload`).
+    """
+    model_id = resolve_model_id(model_id)
     
     # Cria o lote no banco de dados
     new_batch = Batch(name=batch_name)
@@ -304,30 +434,28 @@ def create_and_process_batch(files, batch_name, model_id):
         if ext not in ALLOWED_EXTENSIONS:
             continue
 
-        # Salva o ficheiro temporariamente
-        temp_dir = os.path.join(current_app.config['UPLOAD_FOLDER'], str(new_batch.id))
-        os.makedirs(temp_dir, exist_ok=True)
-        file_path = os.path.join(temp_dir, filename)
-        file.seek(0)
-        file.save(file_path)
+        # Grava o ficheiro calculando o hash do conteúdo ao mesmo tempo e guarda-o no
+        # armazém (um conteúdo repetido fica só uma vez em disco)
+        os.makedirs(current_app.config['UPLOAD_FOLDER'], exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(suffix=ext, dir=current_app.config['UPLOAD_FOLDER'])
+        os.close(fd)
+        audio_hash = save_and_hash(file, temp_path)
+        file_path = store_file(temp_path, audio_hash, ext)
 
         file_type = 'audio' if ext != '.txt' else 'text'
         
         # Cria a entrada de transcrição no banco
         new_transcription = Transcription(
             filename=filename,
-            batch_id=new_batch.id
+            batch_id=new_batch.id,
+            audio_hash=audio_hash,
+            model_id=model_id
         )
         db.session.add(new_transcription)
         db.session.flush() # Para obter o ID da transcrição
         
-        # Inicia o processamento em uma nova thread
-        # Passamos a instância da app para a thread ter o contexto correto
-        thread = threading.Thread(
-            target=process_file_pipeline_thread_target,
-            args=(current_app._get_current_object(), new_transcription.id, file_path, filename, file_type, model_id)
-        )
-        thread.start()
+        # Enfileira o processamento; o pool de workers limita a concorrência
+        enqueue_job(new_transcription.id, file_path, filename, file_type, model_id, force=force_reprocess, profile=profile)
         files_processed_count += 1
     
     if files_processed_count == 0:
@@ -335,26 +463,297 @@ def create_and_process_batch(files, batch_name, model_id):
         raise ValueError("Nenhum ficheiro válido (.wav, .mp3, .flac, .ogg, .txt) encontrado na seleção.")
 
     db.session.commit() # Salva tudo no banco de dados
+    notify_workers()
     
     message = f"Lote '{batch_name}' recebido. {files_processed_count} ficheiros enviados para o pipeline com o modelo '{model_id}'."
     return message, new_batch.id
 
-def get_dashboard_data_from_db(batch_id_filter=None):
-    """Prepara os dados para o dashboard a partir do banco de dados."""
-    query = db.session.query(
-        Transcription.id,
-        Batch.name.label('batch_name'),
-        Analysis.sentiment,
-        Analysis.topic,
-        Analysis.summary
-    ).join(Analysis, Transcription.id == Analysis.transcription_id)\
-     .join(Batch, Transcription.batch_id == Batch.id)\
-     .filter(Transcription.status == 'Concluído')
-
-    if batch_id_filter and batch_id_filter != 'all':
-        query = query.filter(Batch.id == int(batch_id_filter))
-
-    results = query.order_by(Transcription.upload_date.desc()).all()
-    
-    # Converte o resultado (uma lista de Tuplas Nomeadas) em uma lista de dicionários
-    return [row._asdict() for row in results]
\ No newline at end of file
+# --- UPLOAD POR BLOCOS (RETOMÁVEL) ---
+
+def init_chunked_upload(batch_name, model_id, files, force_reprocess=False, profile=False):
+    """Cria o lote e uma sessão de upload por ficheiro (`files`: [{'name', 'size'}]).
+
+    Os blocos chegam depois por `write_upload_chunk`; cada ficheiro é enfileirado assim
+    que é finalizado, sem esperar pelos restantes.
+    """
+    if not isinstance(files, list):
+        raise ValueError("Indique a lista de ficheiros a enviar.")
+    model_id = resolve_model_id(model_id)
+
+    new_batch = Batch(name=batch_name)
+    db.session.add(new_batch)
+    db.session.flush()
+    temp_dir = os.path.join(current_app.config['UPLOAD_FOLDER'], str(new_batch.id))
+    os.makedirs(temp_dir, exist_ok=True)
+
+    uploads, skipped = [], []
+    for index, file in enumerate(files):
+        filename = secure_filename(str(file.get('name', ''))) if isinstance(file, dict) else ''
+        ext = os.path.splitext(filename)[1].lower()
+        size = file.get('size') if isinstance(file, dict) else None
+        if ext not in ALLOWED_EXTENSIONS or not isinstance(size, int) or size <= 0:
+            skipped.append(file.get('name') if isinstance(file, dict) else None)
+            continue
+
+        new_transcription = Transcription(filename=filename, batch_id=new_batch.id, model_id=model_id)
+        set_status(new_transcription, "A carregar: 0%", progress=0)
+        db.session.add(new_transcription)
+        db.session.flush()
+
+        # Prefixo com o ID: ficheiros com o mesmo nome no lote são enviados em paralelo
+        file_path = os.path.join(temp_dir, f"{new_transcription.id}_{filename}")
+        open(file_path, 'wb').close()
+        upload = Upload(
+            id=new_upload_id(),
+            transcription_id=new_transcription.id,
+            file_path=file_path,
+            file_type='audio' if ext != '.txt' else 'text',
+            size=size,
+            force=force_reprocess,
+            profile=profile
+        )
+        db.session.add(upload)
+        uploads.append((index, filename, upload))
+
+    if not uploads:
+        db.session.rollback()
+        raise ValueError("Nenhum ficheiro válido (.wav, .mp3, .flac, .ogg, .txt) encontrado na seleção.")
+    db.session.commit()
+
+    return {
+        'batch_id': new_batch.id,
+        'model_id': model_id,
+        'chunk_size': Config.UPLOAD_CHUNK_SIZE,
+        'uploads': [dict(upload.to_dict(), index=index, filename=filename) for index, filename, upload in uploads],
+        'skipped': skipped
+    }
+
+def get_upload_status(upload_id):
+    """Estado de um upload (o `offset` indica onde retomar); None se não existir."""
+    upload = db.session.get(Upload, upload_id)
+    return upload.to_dict() if upload else None
+
+def write_upload_chunk(upload_id, offset, stream):
+    """Grava um bloco recebido por PUT e atualiza o progresso do ficheiro; None se não existir."""
+    with upload_write_lock(upload_id):
+        # Lido já com o lock: um pedido paralelo pode ter avançado o offset
+        upload = db.session.get(Upload, upload_id, populate_existing=True)
+        if upload is None:
+            return None
+        write_chunk(upload, offset, stream)
+        db.session.commit() # O offset tem de ficar gravado: é dele que o cliente retoma
+    percent = upload.received * 100 // upload.size
+    report_progress(upload.transcription, f"A carregar: {percent}%", progress=percent)
+    return upload.to_dict()
+
+def finalize_upload(upload_id):
+    """Confirma um upload completo e enfileira o processamento do ficheiro; None se não existir."""
+    with upload_write_lock(upload_id):
+        upload = db.session.get(Upload, upload_id, populate_existing=True)
+        if upload is None:
+            return None
+        if upload.completed_at is not None:
+            return upload.to_dict() # Repetição do pedido (ex.: a resposta anterior perdeu-se)
+
+        transcription = upload.transcription
+        transcription.audio_hash = finish_hash(upload)
+        batch_dir = os.path.dirname(upload.file_path)
+        upload.file_path = store_file(upload.file_path, transcription.audio_hash, os.path.splitext(transcription.filename)[1])
+        upload.completed_at = datetime.utcnow()
+        set_status(transcription, 'Na Fila', progress=0)
+        enqueue_job(transcription.id, upload.file_path, transcription.filename, upload.file_type,
+                    transcription.model_id, force=upload.force, profile=upload.profile)
+        db.session.commit()
+    notify_workers()
+    try:
+        os.rmdir(batch_dir) # Pasta do lote, quando já não tem uploads por terminar
+    except OSError:
+        pass
+    return upload.to_dict()
+
+# --- REPROCESSAMENTO ---
+
+REPROCESS_STAGES = ('transcription', 'analysis')
+
+def reprocess_transcriptions(stage, batch_id=None, transcription_ids=None, model_id=None, prompt_version=None, force=False):
+    """Põe de novo na fila um lote (ou uma lista de transcrições) a partir de uma etapa, sem novo upload.
+
+    `stage='transcription'` transcreve de novo o ficheiro guardado no armazém com `model_id`;
+    `stage='analysis'` só volta a analisar a transcrição guardada. Ambos usam `prompt_version`
+    e gravam o resultado como nova versão da análise. Devolve None se o lote não existir.
+    """
+    if stage not in REPROCESS_STAGES:
+        raise ValueError(f"Etapa inválida: use {' ou '.join(REPROCESS_STAGES)}.")
+    if stage == 'transcription' and not model_id:
+        raise ValueError("Indique o modelo (`model_id`) para transcrever de novo.")
+    prompt_version = resolve_prompt_version(prompt_version)
+
+    if batch_id is not None:
+        if db.session.get(Batch, batch_id) is None:
+            return None
+        query = Transcription.query.filter(Transcription.batch_id == batch_id)
+    elif transcription_ids:
+        if not isinstance(transcription_ids, list) or not all(isinstance(i, int) for i in transcription_ids):
+            raise ValueError("`transcription_ids` deve ser uma lista de IDs.")
+        query = Transcription.query.filter(Transcription.id.in_(transcription_ids))
+    else:
+        raise ValueError("Indique o lote (`batch_id`) ou a lista de transcrições (`transcription_ids`).")
+
+    queued, skipped, uncounted = 0, [], Counter()
+    for transcription in query.options(joinedload(Transcription.analysis)).order_by(Transcription.id):
+        file_path = find_upload(transcription.audio_hash, transcription.filename)
+        if not is_final_status(transcription.status):
+            reason = "Ainda em processamento."
+        elif stage == 'transcription' and file_path is None:
+            reason = "O ficheiro enviado já não está no armazém; envie-o de novo."
+        elif stage == 'analysis' and transcription.status != STATUS_DONE:
+            reason = "Sem transcrição concluída; reprocesse a partir da transcrição."
+        else:
+            reason = None
+        if reason:
+            skipped.append({'transcription_id': transcription.id, 'reason': reason})
+            continue
+
+        # A análise atual deixa de contar nos agregados até haver uma nova versão (ou o reprocessamento falhar)
+        if transcription.status == STATUS_DONE and transcription.analysis:
+            uncounted[(transcription.batch_id, transcription.analysis.sentiment, transcription.analysis.topic)] += 1
+        if stage == 'transcription':
+            transcription.model_id = model_id
+            transcription.external_job_id = None
+        set_status(transcription, 'Na Fila', progress=0)
+        file_type = 'text' if os.path.splitext(transcription.filename)[1].lower() == '.txt' else 'audio'
+        enqueue_job(transcription.id, file_path or '', transcription.filename, file_type, transcription.model_id or '',
+                    force=force, stage=Job.STAGE_PROCESS if stage == 'transcription' else Job.STAGE_REANALYZE,
+                    prompt_version=prompt_version, reprocess=True)
+        queued += 1
+
+    for (stat_batch_id, sentiment, topic), count in uncounted.items():
+        record_analysis_stats(stat_batch_id, sentiment, topic, delta=-count)
+    db.session.commit()
+    notify_workers()
+    return {
+        'stage': stage,
+        'model_id': model_id if stage == 'transcription' else None,
+        'prompt_version': prompt_version,
+        'queued': queued,
+        'skipped': skipped
+    }
+
+def get_segments_from_db(transcription_id, after=None, limit=200):
+    """Uma página dos segmentos (falas com tempos) de uma transcrição (None se não existir)."""
+    if db.session.get(Transcription, transcription_id) is None:
+        return None
+    return get_segments_page(transcription_id, after, limit)
+
+def get_talk_time_from_db(transcription_id=None, batch_id_filter=None):
+    """Tempo de fala por interveniente numa transcrição ou num lote (ou em todos)."""
+    if transcription_id is not None:
+        if db.session.get(Transcription, transcription_id) is None:
+            return None
+        return {'transcription_id': transcription_id, 'speakers': get_talk_time(transcription_id=transcription_id)}
+    return {'speakers': get_talk_time(batch_id=parse_batch_filter(batch_id_filter))}
+
+def get_analysis_versions(transcription_id, include_transcripts=False):
+    """Todas as versões da análise de uma transcrição, da mais antiga para a mais recente (None se não existir)."""
+    transcription = db.session.get(Transcription, transcription_id)
+    if transcription is None:
+        return None
+    versions = []
+    for analysis in transcription.analyses:
+        version = analysis.to_version_dict()
+        if include_transcripts:
+            version['transcript_text'] = read_transcript(analysis.transcript_blob)
+        versions.append(version)
+    return {'transcription_id': transcription_id, 'versions': versions}
+
+def parse_batch_filter(batch_id_filter):
+    """Converte o filtro de lote recebido na query string ('all' ou um ID)."""
+    if not batch_id_filter or batch_id_filter == 'all':
+        return None
+    try:
+        return int(batch_id_filter)
+    except ValueError:
+        raise ValueError("Filtro de lote inválido.")
+
+def get_dashboard_data_from_db(batch_id_filter=None, cursor=None, limit=50):
+    """Prepara uma página dos detalhes do dashboard a partir do banco de dados."""
+    return get_dashboard_page(parse_batch_filter(batch_id_filter), cursor, limit)
+
+def get_batches_with_counts():
+    """Todos os lotes com o número de ficheiros, numa única consulta agrupada."""
+    rows = db.session.query(Batch, func.count(Transcription.id))\
+        .outerjoin(Transcription, Transcription.batch_id == Batch.id)\
+        .group_by(Batch.id)\
+        .order_by(Batch.created_at.desc())\
+        .all()
+    return [batch.to_dict(file_count=count) for batch, count in rows]
+
+def get_dashboard_aggregates_from_db(batch_id_filter=None):
+    """Contagens e KPIs do dashboard, agregados no banco de dados."""
+    return get_dashboard_aggregates(parse_batch_filter(batch_id_filter))
+
+def get_action_items_by_topic_from_db(batch_id_filter=None):
+    """Itens de ação por tópico, agregados no banco de dados."""
+    return get_action_items_by_topic(parse_batch_filter(batch_id_filter))
+
+def get_sentiment_by_operator_from_db(batch_id_filter=None, sentiment=None):
+    """Sentimentos por operador (ex.: `sentiment='Negativo'`), agregados no banco de dados."""
+    return get_sentiment_by_operator(parse_batch_filter(batch_id_filter), sentiment or None)
+
+def search_from_db(query, batch_id_filter=None, page=1, per_page=20):
+    """Pesquisa de texto integral nas transcrições, resumos e tópicos."""
+    if not query or not query.strip():
+        raise ValueError("Indique o texto a pesquisar.")
+    if page < 1:
+        raise ValueError("A página deve ser maior ou igual a 1.")
+    return search_transcriptions(query, parse_batch_filter(batch_id_filter), page, per_page,
+                                 max_candidates=Config.SEARCH_MAX_CANDIDATES)
+
+def export_analyses_from_db(export_format, batch_id_filter=None, date_from=None, date_to=None):
+    """Exportação em streaming das análises concluídas (por lote e/ou intervalo de datas)."""
+    return export_analyses(
+        (export_format or 'csv').lower(),
+        batch_id=parse_batch_filter(batch_id_filter),
+        date_from=parse_date(date_from, 'date_from'),
+        date_to=parse_date(date_to, 'date_to'),
+        chunk_size=Config.EXPORT_CHUNK_SIZE
+    )
+
+def stream_batch_progress_events(batch_id):
+    """Eventos SSE com o estado dos ficheiros de um lote (None se o lote não existir)."""
+    if db.session.get(Batch, batch_id) is None:
+        return None
+    return stream_batch_progress(
+        batch_id,
+        poll_interval=Config.PROGRESS_STREAM_POLL_INTERVAL,
+        keepalive_interval=Config.PROGRESS_STREAM_KEEPALIVE,
+        max_duration=Config.PROGRESS_STREAM_MAX_SECONDS
+    )
+
+
+# --- MÉTRICAS E TEMPOS POR ETAPA ---
+
+def render_metrics():
+    """Métricas deste processo em formato Prometheus; os gauges são lidos no momento da recolha."""
+    counts = db.session.query(Job.status, func.count(Job.id)).group_by(Job.status).all()
+    JOBS.replace([({'status': status}, count) for status, count in counts])
+    schedulers = get_scheduler_stats()
+    PROVIDER_CONCURRENCY.replace([({'provider': name}, stats['concurrency_limit']) for name, stats in schedulers.items()])
+    PROVIDER_IN_FLIGHT.replace([({'provider': name}, stats['in_flight']) for name, stats in schedulers.items()])
+    return REGISTRY.render()
+
+def get_batch_timings_from_db(batch_id):
+    """Tempo gasto por etapa e provedor num lote (None se o lote não existir)."""
+    if db.session.get(Batch, batch_id) is None:
+        return None
+    return get_batch_timings(batch_id)
+
+def get_transcription_timings_from_db(transcription_id):
+    """Etapas medidas de uma transcrição, por ordem de execução (None se não existir)."""
+    if db.session.get(Transcription, transcription_id) is None:
+        return None
+    return {'transcription_id': transcription_id, 'stages': get_transcription_timings(transcription_id)}
+
+def get_latest_profile_path(transcription_id):
+    """Ficheiro do perfil mais recente de uma transcrição, ou None."""
+    return find_latest_profile(transcription_id)
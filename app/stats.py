@@ -0,0 +1,175 @@
+import base64
+from datetime import datetime
+
+from sqlalchemy import func, or_, and_
+from sqlalchemy.exc import IntegrityError
+
+from .models import db, Batch, Transcription, Analysis, ActionItem, BatchStat
+
+
+# --- ESTATÍSTICAS INCREMENTAIS ---
+
+def record_analysis_stats(batch_id, sentiment, topic, delta=1):
+    """Soma `delta` ao contador do lote (-n ao reprocessar análises já contadas), na transação corrente."""
+    key = {'batch_id': batch_id, 'sentiment': sentiment or '', 'topic': topic or ''}
+    for _ in range(3):
+        updated = BatchStat.query.filter_by(**key)\
+            .update({BatchStat.count: BatchStat.count + delta}, synchronize_session=False)
+        if delta < 0:
+            # Grupos que ficam sem análises (reprocessamento) deixam de aparecer nos agregados
+            BatchStat.query.filter_by(**key).filter(BatchStat.count <= 0).delete(synchronize_session=False)
+            return
+        if updated:
+            return
+        try:
+            # Savepoint: se outro worker criar a mesma linha primeiro, volta a tentar o UPDATE
+            with db.session.begin_nested():
+                db.session.add(BatchStat(count=delta, **key))
+            return
+        except IntegrityError:
+            continue
+    raise RuntimeError("Não foi possível atualizar as estatísticas do lote.")
+
+def rebuild_batch_stats():
+    """Recalcula toda a tabela de estatísticas a partir das análises existentes."""
+    BatchStat.query.delete(synchronize_session=False)
+    rows = db.session.query(
+        Transcription.batch_id,
+        func.coalesce(Analysis.sentiment, ''),
+        func.coalesce(Analysis.topic, ''),
+        func.count(Analysis.id)
+    ).join(Analysis, Transcription.id == Analysis.transcription_id)\
+     .filter(Transcription.status == 'Concluído', Analysis.is_current)\
+     .group_by(Transcription.batch_id, func.coalesce(Analysis.sentiment, ''), func.coalesce(Analysis.topic, ''))\
+     .all()
+    db.session.add_all(
+        BatchStat(batch_id=batch_id, sentiment=sentiment, topic=topic, count=count)
+        for batch_id, sentiment, topic, count in rows
+    )
+    db.session.commit()
+    return len(rows)
+
+def ensure_batch_stats():
+    """Preenche a tabela de estatísticas na primeira execução com análises já existentes."""
+    if db.session.query(BatchStat.id).first() is None and db.session.query(Analysis.id).first() is not None:
+        print(f"Estatísticas de lotes recalculadas: {rebuild_batch_stats()} grupos.")
+
+
+# --- AGREGADOS DO DASHBOARD ---
+
+def _counts(column, batch_id=None, sentiment=None):
+    query = db.session.query(column, func.sum(BatchStat.count)).filter(column != '')
+    if batch_id is not None:
+        query = query.filter(BatchStat.batch_id == batch_id)
+    if sentiment is not None:
+        query = query.filter(BatchStat.sentiment == sentiment)
+    rows = query.group_by(column).having(func.sum(BatchStat.count) > 0)\
+        .order_by(func.sum(BatchStat.count).desc()).all()
+    return {key: int(total) for key, total in rows}
+
+def get_dashboard_aggregates(batch_id=None):
+    """Contagens por sentimento/tópico e KPIs, calculados com GROUP BY sobre `batch_stats`."""
+    total_query = db.session.query(func.coalesce(func.sum(BatchStat.count), 0))
+    if batch_id is not None:
+        total_query = total_query.filter(BatchStat.batch_id == batch_id)
+
+    sentiment_counts = _counts(BatchStat.sentiment, batch_id)
+    topic_counts = _counts(BatchStat.topic, batch_id)
+    problem_topics = _counts(BatchStat.topic, batch_id, sentiment='Negativo')
+    return {
+        'total_analyses': int(total_query.scalar()),
+        'sentiment_counts': sentiment_counts,
+        'topic_counts': topic_counts,
+        'predominant_sentiment': next(iter(sentiment_counts), 'N/A'),
+        'top_problem': next(iter(problem_topics), 'Nenhum')
+    }
+
+
+# --- AGREGADOS DAS COLUNAS ESTRUTURADAS ---
+
+def _completed_analyses(query, batch_id=None):
+    query = query.join(Transcription, Transcription.id == Analysis.transcription_id)\
+        .filter(Transcription.status == 'Concluído', Analysis.is_current)
+    if batch_id is not None:
+        query = query.filter(Transcription.batch_id == batch_id)
+    return query
+
+def get_action_items_by_topic(batch_id=None):
+    """Número de análises e de itens de ação por tópico."""
+    topic = func.coalesce(Analysis.topic, '')
+    action_items = func.count(ActionItem.id)
+    query = db.session.query(topic, func.count(func.distinct(Analysis.id)), action_items)\
+        .outerjoin(ActionItem, ActionItem.analysis_id == Analysis.id)
+    rows = _completed_analyses(query, batch_id)\
+        .group_by(topic).order_by(action_items.desc(), topic).all()
+    return [{'topic': name or None, 'analyses': int(count), 'action_items': int(items)}
+            for name, count, items in rows]
+
+def get_sentiment_by_operator(batch_id=None, sentiment=None):
+    """Análises por operador, com a distribuição de sentimentos (ou só de `sentiment`)."""
+    operator = func.coalesce(Analysis.operator_label, '')
+    query = db.session.query(operator, func.coalesce(Analysis.sentiment, ''), func.count(Analysis.id))
+    query = _completed_analyses(query, batch_id)
+    if sentiment is not None:
+        query = query.filter(Analysis.sentiment == sentiment)
+    rows = query.group_by(operator, func.coalesce(Analysis.sentiment, '')).all()
+
+    by_operator = {}
+    for name, row_sentiment, count in rows:
+        entry = by_operator.setdefault(name, {'operator': name or None, 'total': 0, 'by_sentiment': {}})
+        entry['total'] += int(count)
+        if row_sentiment:
+            entry['by_sentiment'][row_sentiment] = int(count)
+    return sorted(by_operator.values(), key=lambda entry: (-entry['total'], entry['operator'] or ''))
+
+
+# --- PAGINAÇÃO POR CURSOR (KEYSET) ---
+
+def encode_cursor(upload_date, transcription_id):
+    raw = f"{upload_date.isoformat()}|{transcription_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor):
+    try:
+        upload_date, transcription_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(upload_date), int(transcription_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Cursor de paginação inválido.")
+
+def get_dashboard_page(batch_id=None, cursor=None, limit=50):
+    """Uma página de análises concluídas, da mais recente para a mais antiga.
+
+    A posição é dada por (upload_date, id) da última linha da página anterior, pelo que
+    o custo de cada página não cresce com a profundidade (ao contrário de OFFSET).
+    """
+    query = db.session.query(
+        Transcription.id,
+        Transcription.upload_date,
+        Batch.name.label('batch_name'),
+        Analysis.sentiment,
+        Analysis.topic,
+        Analysis.summary
+    ).join(Analysis, Transcription.id == Analysis.transcription_id)\
+     .join(Batch, Transcription.batch_id == Batch.id)\
+     .filter(Transcription.status == 'Concluído', Analysis.is_current)
+
+    if batch_id is not None:
+        query = query.filter(Transcription.batch_id == batch_id)
+    if cursor:
+        last_date, last_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            Transcription.upload_date < last_date,
+            and_(Transcription.upload_date == last_date, Transcription.id < last_id)
+        ))
+
+    rows = query.order_by(Transcription.upload_date.desc(), Transcription.id.desc()).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    items = []
+    for row in rows:
+        item = row._asdict()
+        item['upload_date'] = row.upload_date.isoformat() + 'Z'
+        items.append(item)
+    next_cursor = encode_cursor(rows[-1].upload_date, rows[-1].id) if has_more else None
+    return {'items': items, 'next_cursor': next_cursor}
@@ -0,0 +1,108 @@
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from sqlalchemy import case, func
+
+from .metrics import STAGE_SECONDS, STAGE_TOTAL
+from .models import db, Transcription, PipelineStage
+
+# Etapas medidas em cada transcrição (tabela `pipeline_stages` e histogramas de /metrics)
+STAGE_QUEUE_WAIT = 'queue_wait'      # Da criação do job até um worker o reservar
+STAGE_PREPROCESS = 'preprocess'      # Conversão com ffmpeg
+STAGE_UPLOAD = 'upload'              # Envio do ficheiro para a API de transcrição externa
+STAGE_TRANSCRIPTION = 'transcription' # Chirp, ou espera pela API externa + download do resultado
+STAGE_ANALYSIS = 'analysis'          # Gemini
+STAGE_PERSIST = 'persist'            # Gravação dos resultados (commit)
+
+
+class StageTimer:
+    """Mede as etapas de um job; as medições são gravadas de uma vez em `save`."""
+
+    def __init__(self, transcription_id, model_id):
+        self.transcription_id = transcription_id
+        self.model_id = model_id
+        self._rows = []
+
+    @contextmanager
+    def stage(self, name, provider=None):
+        started_at = datetime.utcnow()
+        started = time.perf_counter()
+        outcome = 'error'
+        try:
+            yield
+            outcome = 'ok'
+        finally:
+            self.record(name, time.perf_counter() - started, provider, outcome, started_at)
+
+    def record(self, name, seconds, provider=None, outcome='ok', started_at=None):
+        seconds = max(0.0, seconds)
+        STAGE_SECONDS.observe(seconds, stage=name, provider=provider or '', model_id=self.model_id or '')
+        STAGE_TOTAL.inc(stage=name, provider=provider or '', model_id=self.model_id or '', outcome=outcome)
+        self._rows.append({
+            'transcription_id': self.transcription_id,
+            'stage': name,
+            'provider': provider,
+            'model_id': self.model_id,
+            'outcome': outcome,
+            'started_at': started_at or datetime.utcnow(),
+            'duration_ms': int(seconds * 1000)
+        })
+
+    def save(self):
+        """Grava as etapas medidas numa transação própria (também quando o pipeline falhou)."""
+        if not self._rows:
+            return
+        try:
+            db.session.execute(PipelineStage.__table__.insert(), self._rows)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"AVISO: Não foi possível gravar os tempos das etapas da transcrição {self.transcription_id}. Erro: {e}")
+        self._rows = []
+
+
+def last_stage_end(transcription_id, stage):
+    """Instante (UTC) em que terminou a última execução de `stage` (ex.: fim do envio para a API)."""
+    row = PipelineStage.query.filter_by(transcription_id=transcription_id, stage=stage)\
+        .order_by(PipelineStage.id.desc()).first()
+    if row is None:
+        return None
+    return row.started_at + timedelta(milliseconds=row.duration_ms)
+
+
+# --- LEITURAS ---
+
+def get_transcription_timings(transcription_id):
+    rows = PipelineStage.query.filter_by(transcription_id=transcription_id).order_by(PipelineStage.id).all()
+    return [row.to_dict() for row in rows]
+
+def get_batch_timings(batch_id):
+    """Tempo por etapa e provedor nas transcrições de um lote (agregado em SQL)."""
+    rows = db.session.query(
+        PipelineStage.stage,
+        PipelineStage.provider,
+        func.count(PipelineStage.id),
+        func.count(func.distinct(PipelineStage.transcription_id)),
+        func.sum(PipelineStage.duration_ms),
+        func.max(PipelineStage.duration_ms),
+        func.sum(case((PipelineStage.outcome == 'error', 1), else_=0))
+    ).join(Transcription, Transcription.id == PipelineStage.transcription_id)\
+     .filter(Transcription.batch_id == batch_id)\
+     .group_by(PipelineStage.stage, PipelineStage.provider)\
+     .order_by(func.sum(PipelineStage.duration_ms).desc())\
+     .all()
+
+    stages = []
+    for stage, provider, count, files, total_ms, max_ms, errors in rows:
+        stages.append({
+            'stage': stage,
+            'provider': provider,
+            'count': int(count),
+            'files': int(files),
+            'errors': int(errors or 0),
+            'total_seconds': round((total_ms or 0) / 1000, 3),
+            'avg_seconds': round((total_ms or 0) / count / 1000, 3) if count else 0.0,
+            'max_seconds': round((max_ms or 0) / 1000, 3)
+        })
+    return {'batch_id': batch_id, 'stages': stages}
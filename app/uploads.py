@@ -0,0 +1,117 @@
+import hashlib
+import os
+import secrets
+import threading
+
+from .cache import HASH_CHUNK_SIZE
+from .models import db, Upload
+
+# Uploads por blocos (retomáveis): o cliente cria a sessão, envia os blocos por PUT com o
+# offset de cada um e finaliza. Os blocos são gravados diretamente no ficheiro de destino
+# e o SHA-256 é calculado à medida que chegam; o estado do hash fica em memória por upload
+# e, se faltar (outro processo, reinício), é refeito a partir do que já está em disco.
+
+_hash_lock = threading.Lock()
+_hash_states = {} # upload_id -> (offset, sha256)
+
+# Um bloco repetido pelo cliente pode chegar enquanto o original ainda está a ser gravado:
+# a gravação de cada upload é serializada (locks repartidos pelo ID, sem limpeza)
+_write_locks = [threading.Lock() for _ in range(64)]
+
+
+class UploadOffsetMismatch(ValueError):
+    """O bloco não começa onde o servidor espera; `offset` é a posição correta."""
+
+    def __init__(self, offset):
+        super().__init__(f"Offset inválido: o próximo bloco deve começar em {offset}.")
+        self.offset = offset
+
+
+def new_upload_id():
+    return secrets.token_hex(16)
+
+def upload_write_lock(upload_id):
+    """Lock a segurar da leitura do offset até ao commit do bloco (ver `write_chunk`)."""
+    return _write_locks[hash(upload_id) % len(_write_locks)]
+
+def _hash_state(upload):
+    """SHA-256 (cópia) dos primeiros `upload.received` bytes do ficheiro."""
+    with _hash_lock:
+        state = _hash_states.get(upload.id)
+        if state and state[0] == upload.received:
+            return state[1].copy()
+
+    sha256 = hashlib.sha256()
+    remaining = upload.received
+    with open(upload.file_path, 'rb') as f:
+        while remaining > 0:
+            chunk = f.read(min(HASH_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            sha256.update(chunk)
+            remaining -= len(chunk)
+    if remaining:
+        raise ValueError("O ficheiro em disco é menor do que o recebido; reinicie o upload.")
+    return sha256
+
+def write_chunk(upload, offset, stream):
+    """Grava um bloco a partir de `offset` e atualiza o hash e `upload.received` (sem commit).
+
+    Quem chama segura `upload_write_lock(upload.id)` desde que lê o upload até ao commit:
+    o ficheiro é truncado e escrito antes de o offset avançar na base de dados. Devolve o
+    número de bytes gravados.
+    """
+    if upload.completed_at is not None:
+        raise ValueError("O upload já foi finalizado.")
+    if offset != upload.received:
+        raise UploadOffsetMismatch(upload.received)
+
+    sha256 = _hash_state(upload)
+    written = 0
+    with open(upload.file_path, 'r+b') as out:
+        # Descarta o que uma tentativa interrompida tenha gravado depois do último bloco confirmado
+        out.seek(offset)
+        out.truncate()
+        while True:
+            chunk = stream.read(HASH_CHUNK_SIZE)
+            if not chunk:
+                break
+            written += len(chunk)
+            if offset + written > upload.size:
+                raise ValueError(f"O bloco ultrapassa o tamanho anunciado do ficheiro ({upload.size} bytes).")
+            sha256.update(chunk)
+            out.write(chunk)
+
+    # Só avança se ninguém tiver gravado o mesmo offset entretanto (ex.: outro processo)
+    updated = Upload.query.filter_by(id=upload.id, received=offset)\
+        .update({Upload.received: offset + written}, synchronize_session=False)
+    if not updated:
+        db.session.rollback()
+        raise UploadOffsetMismatch(db.session.get(Upload, upload.id).received)
+    upload.received = offset + written
+    with _hash_lock:
+        _hash_states[upload.id] = (upload.received, sha256)
+    return written
+
+def finish_hash(upload):
+    """Hash final de um upload completo; liberta o estado em memória."""
+    if upload.received != upload.size:
+        raise ValueError(f"Upload incompleto: {upload.received} de {upload.size} bytes recebidos.")
+    digest = _hash_state(upload).hexdigest()
+    with _hash_lock:
+        _hash_states.pop(upload.id, None)
+    return digest
+
+def discard_upload(upload):
+    """Apaga o ficheiro parcial e a sessão de um upload abandonado (sem commit)."""
+    with _hash_lock:
+        _hash_states.pop(upload.id, None)
+    try:
+        os.remove(upload.file_path)
+    except FileNotFoundError:
+        pass
+    try:
+        os.rmdir(os.path.dirname(upload.file_path)) # Pasta do lote, se já não tiver mais uploads
+    except OSError:
+        pass
+    db.session.delete(upload)
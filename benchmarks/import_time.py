@@ -0,0 +1,81 @@
+"""Orçamento do tempo de importação da aplicação (arranque de cada worker do gunicorn).
+
+Importa os módulos carregados no arranque (`app.routes`, `app.jobs`) num processo novo e
+falha (código de saída 1) se o tempo mediano exceder o orçamento ou se algum SDK pesado
+for importado antes de ser necessário. Mostra também os módulos mais lentos a importar
+(`python -X importtime`).
+
+Uso (na raiz do projeto):
+    python benchmarks/import_time.py --budget-ms 1500
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Módulos que só devem ser carregados quando um pipeline precisa deles
+HEAVY_MODULES = ['librosa', 'numba', 'scipy', 'soundfile', 'torch', 'vertexai', 'google.cloud.speech', 'pandas', 'xlsxwriter']
+
+CHILD_CODE = f"""
+import json, sys, time
+started = time.perf_counter()
+import app.routes, app.jobs
+elapsed = (time.perf_counter() - started) * 1000
+print(json.dumps({{'ms': elapsed, 'loaded': [m for m in {HEAVY_MODULES!r} if m in sys.modules]}}))
+"""
+
+
+def run_child(importtime=False):
+    command = [sys.executable] + (['-X', 'importtime'] if importtime else []) + ['-c', CHILD_CODE]
+    result = subprocess.run(command, cwd=ROOT, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+def slowest_imports(importtime_output, top):
+    """Pacotes (de topo ou da aplicação) com maior tempo cumulativo de importação."""
+    rows = {}
+    for line in importtime_output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        name = name.strip()
+        if '.' not in name or name.startswith('app.'):
+            rows[name] = max(rows.get(name, 0), int(cumulative) / 1000)
+    return sorted(((ms, name) for name, ms in rows.items()), reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--budget-ms', type=float, default=1500)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10)
+    args = parser.parse_args()
+
+    samples, loaded = [], set()
+    for _ in range(args.repeat):
+        result, _ = run_child()
+        samples.append(result['ms'])
+        loaded.update(result['loaded'])
+    _, importtime_output = run_child(importtime=True)
+
+    print(f"{'Módulo':<40}{'cumulativo (ms)':>18}")
+    for ms, name in slowest_imports(importtime_output, args.top):
+        print(f"{name:<40}{ms:>18.1f}")
+
+    median = statistics.median(samples)
+    print(f"\nImportação da aplicação: {median:.0f} ms (mediana de {args.repeat}; orçamento {args.budget_ms:.0f} ms)")
+    failures = []
+    if median > args.budget_ms:
+        failures.append(f"tempo de importação acima do orçamento ({median:.0f} ms > {args.budget_ms:.0f} ms)")
+    if loaded:
+        failures.append(f"SDKs pesados importados no arranque: {', '.join(sorted(loaded))}")
+    for failure in failures:
+        print(f"FALHA: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,242 @@
+"""Benchmark de carga do pipeline e do dashboard com provedores simulados (sem rede).
+
+Arranca a API de transcrição simulada (`app/fakes.py`), ativa os clientes Speech e Gemini
+simulados (FAKE_PROVIDERS) e, para cada escala, envia um lote por `create_and_process_batch`,
+espera que todos os ficheiros terminem e mede as leituras do dashboard com pedidos
+concorrentes. Mostra o débito (ficheiros/s), a latência p50/p99 de cada ficheiro (do envio
+à conclusão) e de cada endpoint, o número máximo de threads e o pico de memória (RSS).
+
+Uso (na raiz do projeto):
+    python benchmarks/pipeline.py --sizes 10,100,1000 --model whisper-large-v3
+    python benchmarks/pipeline.py --sizes 100 --model google_chirp --audio-seconds 120
+    python benchmarks/pipeline.py --sizes 1000 --text
+"""
+import argparse
+import io
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.datastructures import FileStorage
+
+from config import Config
+from app.fakes import FakeJobsApi
+
+DASHBOARD_ENDPOINTS = [
+    "/api/batches",
+    "/api/dashboard_data?batch_id={batch_id}&limit=50",
+    "/api/dashboard/aggregates?batch_id={batch_id}",
+    "/api/dashboard/aggregates",
+    "/api/batch/{batch_id}/details",
+]
+
+
+def configure(args, api_url, folder):
+    # Os módulos da aplicação leem `Config` diretamente: os valores são alterados na classe
+    Config.SQLALCHEMY_DATABASE_URI = f"sqlite:///{os.path.join(folder, 'bench.db')}"
+    Config.UPLOAD_FOLDER = os.path.join(folder, 'uploads')
+    Config.PROCESSED_AUDIO_FOLDER = os.path.join(folder, 'processed')
+    Config.PUBLIC_URL_API = api_url
+    Config.FAKE_PROVIDERS = True
+    Config.FAKE_PROVIDER_LATENCY = args.provider_latency
+    Config.WORKER_AUTOSTART = True
+    Config.WORKER_THREADS = args.workers
+    Config.WORKER_POLL_INTERVAL = 0.5
+    Config.API_POLL_MIN_INTERVAL = min(Config.API_POLL_MIN_INTERVAL, max(0.1, args.job_seconds / 4))
+    Config.AUDIO_PREPROCESS = args.preprocess
+    Config.PROFILE_SAMPLE_RATE = 0
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+def peak_rss_mb():
+    # ru_maxrss vem em KB no Linux e em bytes no macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+class ThreadMonitor(threading.Thread):
+    """Regista o número máximo de threads vivas enquanto corre."""
+
+    def __init__(self, interval=0.05):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak = threading.active_count()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.peak = max(self.peak, threading.active_count())
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        return self.peak
+
+
+# --- FICHEIROS SIMULADOS ---
+
+def make_wav(seconds, seed):
+    """WAV mono 16 kHz com ruído (conteúdo diferente por ficheiro, para não acertar na cache)."""
+    import numpy as np
+    samples = (np.random.default_rng(seed).standard_normal(int(seconds * 16000)) * 3000).astype('<i2')
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as out:
+        out.setnchannels(1)
+        out.setsampwidth(2)
+        out.setframerate(16000)
+        out.writeframes(samples.tobytes())
+    return buffer.getvalue()
+
+def make_files(count, args, offset):
+    files = []
+    for i in range(offset, offset + count):
+        if args.text:
+            content = (f"Operador: bom dia, chamada {i}. Aluno: tenho uma dúvida sobre o curso. " * 20).encode('utf-8')
+            name = f"chamada_{i}.txt"
+        elif args.model == 'google_chirp':
+            content, name = make_wav(args.audio_seconds, i), f"chamada_{i}.wav"
+        else:
+            # Sem pré-processamento, a API simulada não lê o áudio: basta um conteúdo único
+            content = i.to_bytes(8, 'big') + os.urandom(args.audio_bytes)
+            name = f"chamada_{i}.wav"
+        files.append(FileStorage(stream=io.BytesIO(content), filename=name))
+    return files
+
+
+# --- MEDIÇÕES ---
+
+def run_batch(app, size, args, offset):
+    from app.models import db, Transcription
+    from app.progress import STATUS_DONE, ERROR_PREFIX
+    from app.services import create_and_process_batch
+
+    files = make_files(size, args, offset)
+    monitor = ThreadMonitor()
+    monitor.start()
+    started = time.perf_counter()
+    with app.test_request_context():
+        _, batch_id = create_and_process_batch(files, f"Benchmark {size}", args.model)
+        db.session.remove()
+    submitted = time.perf_counter() - started
+
+    with app.app_context():
+        deadline = time.monotonic() + args.timeout
+        while True:
+            finished = Transcription.query.filter(
+                Transcription.batch_id == batch_id,
+                db.or_(Transcription.status == STATUS_DONE, Transcription.status.startswith(ERROR_PREFIX))
+            ).count()
+            db.session.remove()
+            if finished >= size or time.monotonic() > deadline:
+                break
+            time.sleep(0.1)
+        elapsed = time.perf_counter() - started
+
+        rows = Transcription.query.with_entities(Transcription.status, Transcription.upload_date, Transcription.updated_at)\
+            .filter_by(batch_id=batch_id).all()
+        db.session.remove()
+    threads = monitor.stop()
+
+    latencies = [(updated - uploaded).total_seconds() for status, uploaded, updated in rows if status == STATUS_DONE]
+    return {
+        'batch_id': batch_id,
+        'files': size,
+        'done': len(latencies),
+        'errors': sum(1 for status, _, _ in rows if (status or '').startswith(ERROR_PREFIX)),
+        'submit_s': submitted,
+        'elapsed_s': elapsed,
+        'throughput': len(latencies) / elapsed if elapsed else 0.0,
+        'p50_s': percentile(latencies, 0.5),
+        'p99_s': percentile(latencies, 0.99),
+        'threads': threads,
+        'rss_mb': peak_rss_mb()
+    }
+
+def run_dashboard(app, batch_id, args):
+    """Pedidos concorrentes aos endpoints do dashboard; latência em ms por endpoint."""
+    client = app.test_client()
+
+    def request(path):
+        started = time.perf_counter()
+        response = client.get(path)
+        response.close()
+        if response.status_code != 200:
+            raise RuntimeError(f"{path}: HTTP {response.status_code}")
+        return (time.perf_counter() - started) * 1000
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=args.dashboard_concurrency) as executor:
+        for endpoint in DASHBOARD_ENDPOINTS:
+            path = endpoint.format(batch_id=batch_id)
+            started = time.perf_counter()
+            samples = list(executor.map(request, [path] * args.dashboard_requests))
+            elapsed = time.perf_counter() - started
+            results[endpoint] = (len(samples) / elapsed, percentile(samples, 0.5), percentile(samples, 0.99))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='10,100,1000', help="Ficheiros por lote, separados por vírgulas")
+    parser.add_argument('--model', default='whisper-large-v3', help="Modelo da API simulada ou 'google_chirp'")
+    parser.add_argument('--text', action='store_true', help="Envia ficheiros .txt (só análise)")
+    parser.add_argument('--workers', type=int, default=Config.WORKER_THREADS)
+    parser.add_argument('--api-latency', type=float, default=0.05, help="Latência (s) de cada pedido à API simulada")
+    parser.add_argument('--job-seconds', type=float, default=1.0, help="Duração (s) de cada job na API simulada")
+    parser.add_argument('--provider-latency', type=float, default=0.2, help="Latência (s) do Speech e do Gemini simulados")
+    parser.add_argument('--audio-seconds', type=float, default=30, help="Duração do áudio gerado para o Chirp")
+    parser.add_argument('--audio-bytes', type=int, default=256 * 1024, help="Tamanho do áudio enviado à API simulada")
+    parser.add_argument('--preprocess', action='store_true', help="Mantém o pré-processamento com ffmpeg")
+    parser.add_argument('--dashboard-requests', type=int, default=50)
+    parser.add_argument('--dashboard-concurrency', type=int, default=8)
+    parser.add_argument('--timeout', type=float, default=1800, help="Tempo máximo (s) à espera de cada lote")
+    args = parser.parse_args()
+
+    api = FakeJobsApi(latency=args.api_latency, job_seconds=args.job_seconds).start()
+    folder = tempfile.mkdtemp(prefix='bench-pipeline-')
+    configure(args, api.url, folder)
+
+    from app import create_app
+    from app.jobs import stop_worker_pool
+    app = create_app()
+    print(f"Base de dados e uploads em {folder}; API simulada em {api.url}; {args.workers} workers.")
+
+    batches, dashboards, offset = [], {}, 0
+    try:
+        for size in [int(s) for s in args.sizes.split(',') if s.strip()]:
+            print(f"A processar um lote de {size} ficheiros...")
+            result = run_batch(app, size, args, offset)
+            offset += size
+            batches.append(result)
+            dashboards[size] = run_dashboard(app, result['batch_id'], args)
+    finally:
+        stop_worker_pool()
+        api.stop()
+
+    print(f"\n{'Ficheiros':>10}{'concluídos':>12}{'erros':>8}{'envio (s)':>11}{'total (s)':>11}"
+          f"{'fich./s':>10}{'p50 (s)':>10}{'p99 (s)':>10}{'threads':>9}{'RSS (MB)':>10}")
+    for r in batches:
+        print(f"{r['files']:>10}{r['done']:>12}{r['errors']:>8}{r['submit_s']:>11.2f}{r['elapsed_s']:>11.2f}"
+              f"{r['throughput']:>10.1f}{r['p50_s']:>10.2f}{r['p99_s']:>10.2f}{r['threads']:>9}{r['rss_mb']:>10.0f}")
+
+    print(f"\n{'Endpoint (após o lote)':<50}{'ficheiros':>10}{'pedidos/s':>11}{'p50 (ms)':>10}{'p99 (ms)':>10}")
+    for size, results in dashboards.items():
+        for endpoint, (rate, p50, p99) in results.items():
+            print(f"{endpoint:<50}{size:>10}{rate:>11.0f}{p50:>10.1f}{p99:>10.1f}")
+    print(f"\nPedidos servidos pela API simulada: {api.requests}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+"""Benchmark das leituras de lotes e do dashboard sobre uma base de dados semeada.
+
+Compara a forma antiga (N+1 em `/api/batches`, sem índices nas colunas filtradas e
+ordenadas) com a atual (contagem agrupada, colunas Text diferidas e índices compostos).
+
+Uso (na raiz do projeto):
+    python benchmarks/read_paths.py --rows 100000 --batches 1000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+from sqlalchemy.orm import undefer
+
+from config import Config
+from app import create_app
+from app.models import db, Batch, Transcription, Analysis, ActionItem
+from app.services import get_batches_with_counts
+from app.stats import get_dashboard_page
+
+# Índices acrescentados para estas leituras (removidos para medir a forma antiga)
+READ_PATH_INDEXES = {
+    'idx_transcriptions_batch_updated': ('transcriptions', ['batch_id', 'updated_at']),
+    'idx_transcriptions_status_date': ('transcriptions', ['status', 'upload_date', 'id']),
+    'idx_transcriptions_batch_status_date': ('transcriptions', ['batch_id', 'status', 'upload_date', 'id']),
+}
+SENTIMENTS = ['Positivo', 'Negativo', 'Neutro']
+TOPICS = ['Pagamento', 'Matrícula', 'Acesso à plataforma', 'Certificado', 'Cancelamento']
+OPERATORS = ['Ana', 'Bruno', 'Carla', 'Diogo']
+
+
+class BenchConfig(Config):
+    WORKER_AUTOSTART = False
+
+
+def seed(rows, batches, text_bytes):
+    random.seed(42)
+    start = datetime.utcnow() - timedelta(days=365)
+    filler = ("Operador: bom dia, em que posso ajudar? Aluno: tenho uma dúvida sobre o curso. " * 50)[:text_bytes]
+
+    db.session.execute(Batch.__table__.insert(), [
+        {'id': i, 'name': f"Lote {i}", 'created_at': start + timedelta(hours=i)} for i in range(1, batches + 1)
+    ])
+    chunk = 10000
+    for offset in range(0, rows, chunk):
+        transcriptions, analyses, action_items = [], [], []
+        for i in range(offset + 1, min(rows, offset + chunk) + 1):
+            uploaded = start + timedelta(seconds=i * 300)
+            done = random.random() < 0.9
+            transcriptions.append({
+                'id': i, 'filename': f"chamada_{i}.wav", 'upload_date': uploaded, 'updated_at': uploaded,
+                'status': 'Concluído' if done else 'Erro no pipeline: falha simulada',
+                'progress': 100 if done else 0, 'transcript_text': filler,
+                'batch_id': random.randint(1, batches), 'model_id': 'google_chirp'
+            })
+            if done:
+                result = {'speaker_identification': {'operator': random.choice(OPERATORS), 'student': "Aluno"},
+                          'sentiment': random.choice(SENTIMENTS), 'main_topic': random.choice(TOPICS),
+                          'summary': "Resumo simulado da conversa.", 'action_items': ["Enviar e-mail"] * 3}
+                analyses.append({
+                    'id': i, 'transcription_id': i, 'sentiment': result['sentiment'], 'topic': result['main_topic'],
+                    'summary': result['summary'], 'operator_label': result['speaker_identification']['operator'],
+                    'student_label': "Aluno", 'analysis_data': result
+                })
+                action_items.extend({'analysis_id': i, 'position': p, 'text': item}
+                                    for p, item in enumerate(result['action_items']))
+        db.session.execute(Transcription.__table__.insert(), transcriptions)
+        if analyses:
+            db.session.execute(Analysis.__table__.insert(), analyses)
+            db.session.execute(ActionItem.__table__.insert(), action_items)
+        db.session.commit()
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+        db.session.remove()
+    return statistics.median(samples)
+
+
+def legacy_batches():
+    # Forma antiga: Batch.to_dict() com len(self.transcriptions), uma consulta (com o texto) por lote
+    result = []
+    for batch in Batch.query.order_by(Batch.created_at.desc()).all():
+        transcriptions = Transcription.query.options(undefer(Transcription.transcript_text))\
+            .filter_by(batch_id=batch.id).all()
+        result.append({'id': batch.id, 'name': batch.name, 'file_count': len(transcriptions)})
+    return result
+
+
+def set_indexes(enabled):
+    for name, (table, columns) in READ_PATH_INDEXES.items():
+        if enabled:
+            db.session.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})"))
+        else:
+            db.session.execute(text(f"DROP INDEX IF EXISTS {name}"))
+    db.session.commit()
+    db.session.execute(text("ANALYZE"))
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--batches', type=int, default=1000)
+    parser.add_argument('--text-bytes', type=int, default=1000, help="Tamanho do transcript_text de cada linha")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--db', help="Ficheiro SQLite a usar (por omissão, um temporário)")
+    args = parser.parse_args()
+
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix='bench-read-paths-'), 'bench.db')
+    BenchConfig.SQLALCHEMY_DATABASE_URI = f"sqlite:///{db_path}"
+    app = create_app(BenchConfig)
+
+    with app.app_context():
+        if Transcription.query.count() == 0:
+            print(f"A semear {args.rows} transcrições em {args.batches} lotes ({db_path})...")
+            started = time.perf_counter()
+            seed(args.rows, args.batches, args.text_bytes)
+            print(f"Semeado em {time.perf_counter() - started:.1f}s.")
+
+        middle_batch = args.batches // 2
+        deep_page = get_dashboard_page(limit=50)
+        for _ in range(20):
+            deep_page = get_dashboard_page(cursor=deep_page['next_cursor'], limit=50)
+        deep_cursor = deep_page['next_cursor']
+        db.session.remove()
+
+        cases = [
+            ("dashboard, 1ª página", lambda: get_dashboard_page(limit=50)),
+            ("dashboard, 21ª página", lambda: get_dashboard_page(cursor=deep_cursor, limit=50)),
+            ("dashboard, filtro por lote", lambda: get_dashboard_page(batch_id=middle_batch, limit=50)),
+        ]
+
+        set_indexes(False)
+        before = {name: timed(fn, args.repeat) for name, fn in cases}
+        before["/api/batches"] = timed(legacy_batches, max(1, args.repeat // 2))
+        set_indexes(True)
+        after = {name: timed(fn, args.repeat) for name, fn in cases}
+        after["/api/batches"] = timed(get_batches_with_counts, args.repeat)
+
+    print(f"\n{'Leitura':<30}{'antes (ms)':>14}{'depois (ms)':>14}{'ganho':>10}")
+    for name in before:
+        gain = before[name] / after[name] if after[name] else float('inf')
+        print(f"{name:<30}{before[name]:>14.1f}{after[name]:>14.1f}{gain:>9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""Benchmark da pesquisa de texto integral (`/api/search`) sobre uma base de dados semeada.
+
+Gera transcrições sintéticas com vocabulário variado, constrói o índice de pesquisa e
+mede a latência da primeira página para termos frequentes, raros e combinados.
+
+Uso (na raiz do projeto):
+    python benchmarks/search.py --docs 1000000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from app import create_app
+from app.models import db, Batch, Transcription, Analysis
+from app.search import rebuild_search_index
+from app.services import search_from_db
+
+COMMON_WORDS = ("bom dia obrigado aluno operador curso plataforma aula professor prazo "
+                "semana dúvida sistema conta senha email acesso módulo conteúdo").split()
+TOPICS = ['Pagamento de mensalidade', 'Matrícula', 'Acesso à plataforma', 'Emissão de certificado',
+          'Cancelamento', 'Reembolso', 'Troca de turma', 'Informações sobre estágio']
+RARE_WORDS = ("boleto vencido reembolsos rematrícula certificação estágios transferência "
+              "parcelamento bolsa desconto segunda via cancelar").split()
+
+QUERIES = {
+    "termo frequente": "plataforma",
+    "termo raro": "rematrícula",
+    "dois termos": "boleto vencido",
+    "plural/variação": "certificados",
+}
+
+
+class BenchConfig(Config):
+    WORKER_AUTOSTART = False
+
+
+def seed(docs, batches, words_per_doc):
+    random.seed(7)
+    start = datetime.utcnow() - timedelta(days=365)
+    db.session.execute(Batch.__table__.insert(), [
+        {'id': i, 'name': f"Lote {i}", 'created_at': start} for i in range(1, batches + 1)
+    ])
+    chunk = 20000
+    for offset in range(0, docs, chunk):
+        transcriptions, analyses = [], []
+        for i in range(offset + 1, min(docs, offset + chunk) + 1):
+            words = random.choices(COMMON_WORDS, k=words_per_doc)
+            # Cerca de 1% dos documentos menciona cada termo raro
+            for rare in RARE_WORDS:
+                if random.random() < 0.01:
+                    words.insert(random.randrange(len(words)), rare)
+            uploaded = start + timedelta(seconds=i * 30)
+            transcriptions.append({
+                'id': i, 'filename': f"chamada_{i}.wav", 'upload_date': uploaded, 'updated_at': uploaded,
+                'status': 'Concluído', 'progress': 100, 'transcript_text': ' '.join(words),
+                'batch_id': random.randint(1, batches), 'model_id': 'google_chirp'
+            })
+            topic = random.choice(TOPICS)
+            analyses.append({'transcription_id': i, 'sentiment': 'Neutro', 'topic': topic,
+                             'summary': f"O aluno contactou sobre {topic.lower()}."})
+        db.session.execute(Transcription.__table__.insert(), transcriptions)
+        db.session.execute(Analysis.__table__.insert(), analyses)
+        db.session.commit()
+
+    with db.engine.begin() as conn:
+        rebuild_search_index(conn)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--docs', type=int, default=1000000)
+    parser.add_argument('--batches', type=int, default=1000)
+    parser.add_argument('--words', type=int, default=60, help="Palavras por transcrição")
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--db', help="Ficheiro SQLite a usar (por omissão, um temporário)")
+    args = parser.parse_args()
+
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix='bench-search-'), 'bench.db')
+    BenchConfig.SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL') or f"sqlite:///{db_path}"
+    app = create_app(BenchConfig)
+
+    with app.app_context():
+        if Transcription.query.count() == 0:
+            print(f"A semear e indexar {args.docs} transcrições...")
+            started = time.perf_counter()
+            seed(args.docs, args.batches, args.words)
+            print(f"Semeado em {time.perf_counter() - started:.1f}s.")
+
+        print(f"\n{'Pesquisa':<20}{'resultados':>12}{'p50 (ms)':>12}{'máx (ms)':>12}")
+        for name, query in QUERIES.items():
+            samples = []
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                page = search_from_db(query)
+                samples.append((time.perf_counter() - started) * 1000)
+                db.session.remove()
+            print(f"{name:<20}{len(page['items']):>12}{statistics.median(samples):>12.1f}{max(samples):>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -4,6 +4,15 @@ from dotenv import load_dotenv
 # Carrega as variáveis do arquivo .env para o ambiente
 load_dotenv()
 
+def _provider_limits(prefix, rate, burst, initial_concurrency, max_concurrency):
+    """Limites de um provedor, sobreponíveis por variáveis <PREFIX>_RATE_LIMIT, etc."""
+    return {
+        'rate': float(os.getenv(f"{prefix}_RATE_LIMIT", rate)),
+        'burst': float(os.getenv(f"{prefix}_RATE_BURST", burst)),
+        'initial_concurrency': int(os.getenv(f"{prefix}_INITIAL_CONCURRENCY", initial_concurrency)),
+        'max_concurrency': int(os.getenv(f"{prefix}_MAX_INFLIGHT", max_concurrency)),
+    }
+
 class Config:
     """Classe de configuração central da aplicação."""
     SECRET_KEY = os.environ.get('SECRET_KEY', 'uma-chave-secreta-bem-forte-e-aleatoria')
@@ -12,6 +21,9 @@ class Config:
     # Usa a variável de ambiente DATABASE_URL; se não existir, usa um SQLite local.
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', f"sqlite:///{os.path.join(os.path.dirname(os.path.abspath(__file__)), 'database.db')}")
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # SQLite: modo WAL e tempo máximo (ms) de espera pelo bloqueio de escrita antes de falhar.
+    SQLITE_WAL = os.getenv("SQLITE_WAL", "true").lower() == "true"
+    SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 30000))
 
     # --- Configurações de APIs e Serviços Externos ---
     PUBLIC_URL_GUI = os.getenv("PUBLIC_URL_GUI")
@@ -19,5 +31,145 @@ class Config:
     PROJECT_ID = os.getenv("PROJECT_ID", "transcricao-467718")
     LOCATION = os.getenv("LOCATION", "us-central1")
 
+    # Catálogo de modelos da API (partilhado entre processos pelo banco de dados):
+    # validade (s), validade após uma falha da API (s) e timeout da consulta em segundo plano.
+    MODEL_CATALOGUE_TTL = int(os.getenv("MODEL_CATALOGUE_TTL", 300))
+    MODEL_CATALOGUE_NEGATIVE_TTL = int(os.getenv("MODEL_CATALOGUE_NEGATIVE_TTL", 30))
+    MODEL_CATALOGUE_TIMEOUT = float(os.getenv("MODEL_CATALOGUE_TIMEOUT", 5))
+
+    # Ligações HTTP mantidas por processo para a API (keep-alive) e retries de falhas de ligação.
+    HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", 32))
+    HTTP_CONNECT_RETRIES = int(os.getenv("HTTP_CONNECT_RETRIES", 3))
+
     # --- Configuração de Pastas ---
-    UPLOAD_FOLDER = 'uploads'
\ No newline at end of file
+    UPLOAD_FOLDER = 'uploads'
+    # Áudio pré-processado, guardado pelo hash do conteúdo original
+    PROCESSED_AUDIO_FOLDER = os.getenv("PROCESSED_AUDIO_FOLDER", os.path.join(UPLOAD_FOLDER, 'processed'))
+    # Horas sem uso até o áudio pré-processado ser removido (0 = nunca), a cada BLOB_RETENTION_INTERVAL s.
+    PROCESSED_AUDIO_MAX_AGE_HOURS = float(os.getenv("PROCESSED_AUDIO_MAX_AGE_HOURS", 24))
+
+    # Tamanho dos blocos do upload retomável (cada PUT envia no máximo isto).
+    UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", 8 * 1024 * 1024))
+    # Horas sem blocos novos até um upload por terminar ser dado como abandonado (0 = nunca),
+    # a cada BLOB_RETENTION_INTERVAL s: o ficheiro parcial é apagado e a transcrição fica em erro.
+    UPLOAD_TTL_HOURS = float(os.getenv("UPLOAD_TTL_HOURS", 24))
+
+    # --- Configuração da Fila de Processamento ---
+    # Número de threads de worker por processo (o trabalho é sobretudo I/O de rede).
+    WORKER_THREADS = int(os.getenv("WORKER_THREADS", (os.cpu_count() or 1) * 2))
+    # Se 'false', o processo web apenas enfileira; os jobs correm em `python worker.py`.
+    WORKER_AUTOSTART = os.getenv("WORKER_AUTOSTART", "true").lower() == "true"
+    # Intervalo (s) para procurar novos jobs quando não há notificação local.
+    WORKER_POLL_INTERVAL = float(os.getenv("WORKER_POLL_INTERVAL", 2))
+    # Tempo (s) sem heartbeat após o qual um job em execução é considerado abandonado.
+    JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", 120))
+    JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 3))
+    # Máximo de jobs de reprocessamento (`/api/reprocess`) em execução ao mesmo tempo, em todos os
+    # processos, para que não ocupem todos os workers (0 = sem limite além de WORKER_THREADS).
+    REPROCESS_MAX_CONCURRENCY = int(os.getenv("REPROCESS_MAX_CONCURRENCY", max(1, (os.cpu_count() or 1))))
+
+    # --- Acompanhamento de Jobs na API Externa ---
+    # Intervalo adaptativo: começa em MIN e cresce por BACKOFF a cada verificação até MAX.
+    API_POLL_MIN_INTERVAL = float(os.getenv("API_POLL_MIN_INTERVAL", 2))
+    API_POLL_MAX_INTERVAL = float(os.getenv("API_POLL_MAX_INTERVAL", 30))
+    API_POLL_BACKOFF = float(os.getenv("API_POLL_BACKOFF", 1.5))
+    # Falhas de rede consecutivas toleradas antes de marcar a transcrição com erro.
+    API_POLL_MAX_ERRORS = int(os.getenv("API_POLL_MAX_ERRORS", 5))
+
+
+    # --- Transcrição em Blocos (Google Chirp) ---
+    # O reconhecimento síncrono aceita até ~60s por pedido: blocos de 50s + sobreposição.
+    CHIRP_CHUNK_SECONDS = float(os.getenv("CHIRP_CHUNK_SECONDS", 50))
+    CHIRP_CHUNK_OVERLAP_SECONDS = float(os.getenv("CHIRP_CHUNK_OVERLAP_SECONDS", 2))
+    # Blocos transcritos em paralelo por ficheiro.
+    CHIRP_MAX_CONCURRENCY = int(os.getenv("CHIRP_MAX_CONCURRENCY", 4))
+    # Limiar (dB abaixo do pico) para considerar um trecho como silêncio.
+    CHIRP_SILENCE_TOP_DB = float(os.getenv("CHIRP_SILENCE_TOP_DB", 35))
+
+
+    # --- Pré-processamento de Áudio (ffmpeg) ---
+    AUDIO_PREPROCESS = os.getenv("AUDIO_PREPROCESS", "true").lower() == "true"
+    # 'flac' (sem perdas) ou 'opus' (menor, com perdas, otimizado para voz).
+    AUDIO_TARGET_FORMAT = os.getenv("AUDIO_TARGET_FORMAT", "flac")
+    AUDIO_TRIM_SILENCE = os.getenv("AUDIO_TRIM_SILENCE", "false").lower() == "true"
+
+
+    # --- Análise com Gemini ---
+    GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-1.5-flash-preview-0514")
+    # Agrupa transcrições curtas de vários workers num único prompt.
+    GEMINI_BATCHING = os.getenv("GEMINI_BATCHING", "true").lower() == "true"
+    GEMINI_BATCH_MAX_ITEMS = int(os.getenv("GEMINI_BATCH_MAX_ITEMS", 8))
+    GEMINI_BATCH_MAX_TOKENS = int(os.getenv("GEMINI_BATCH_MAX_TOKENS", 12000))
+    # Só transcrições até este tamanho (tokens estimados) entram num lote.
+    GEMINI_BATCH_ITEM_MAX_TOKENS = int(os.getenv("GEMINI_BATCH_ITEM_MAX_TOKENS", 1500))
+    # Tempo máximo (s) que uma transcrição espera por companhia antes de o lote ser enviado.
+    GEMINI_BATCH_MAX_WAIT = float(os.getenv("GEMINI_BATCH_MAX_WAIT", 2))
+    # Acima deste tamanho a análise é feita em map-reduce, com trechos de GEMINI_CHUNK_TOKENS.
+    GEMINI_LONG_THRESHOLD_TOKENS = int(os.getenv("GEMINI_LONG_THRESHOLD_TOKENS", 100000))
+    GEMINI_CHUNK_TOKENS = int(os.getenv("GEMINI_CHUNK_TOKENS", 25000))
+    # Versão das instruções de análise usada nos ficheiros novos (ver PROMPT_VERSIONS em `app/analysis.py`).
+    ANALYSIS_PROMPT_VERSION = os.getenv("ANALYSIS_PROMPT_VERSION", "v1")
+
+
+    # --- Stream de Progresso (SSE) ---
+    # Sem notificação local (workers noutro processo), o stream relê o banco a cada N segundos.
+    PROGRESS_STREAM_POLL_INTERVAL = float(os.getenv("PROGRESS_STREAM_POLL_INTERVAL", 1))
+    PROGRESS_STREAM_KEEPALIVE = float(os.getenv("PROGRESS_STREAM_KEEPALIVE", 15))
+    # Cada ligação fecha ao fim deste tempo; o navegador volta a ligar-se automaticamente.
+    PROGRESS_STREAM_MAX_SECONDS = float(os.getenv("PROGRESS_STREAM_MAX_SECONDS", 300))
+    # Streams abertos em simultâneo por processo (cada um ocupa uma thread do gunicorn); os
+    # restantes clientes usam polling. Manter abaixo do número de threads do Dockerfile.
+    PROGRESS_STREAM_MAX_CLIENTS = int(os.getenv("PROGRESS_STREAM_MAX_CLIENTS", 4))
+    # O progresso intermédio é gravado em lote, no máximo uma vez a cada N segundos por processo.
+    STATUS_FLUSH_INTERVAL = float(os.getenv("STATUS_FLUSH_INTERVAL", 1))
+
+
+    # --- Pesquisa de Texto Integral ---
+    # A relevância é calculada entre as N correspondências mais recentes (limita o custo de termos frequentes).
+    SEARCH_MAX_CANDIDATES = int(os.getenv("SEARCH_MAX_CANDIDATES", 5000))
+
+
+    # --- Exportação ---
+    # Linhas lidas do banco de cada vez durante uma exportação (a memória não cresce com o total).
+    EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", 1000))
+
+
+    # --- Limites por Provedor (taxa em pedidos/s; concorrência ajustada por AIMD) ---
+    PROVIDER_LIMITS = {
+        'chirp': _provider_limits("CHIRP", rate=5, burst=10, initial_concurrency=4, max_concurrency=32),
+        'jobs_api': _provider_limits("JOBS_API", rate=20, burst=40, initial_concurrency=8, max_concurrency=64),
+        'gemini': _provider_limits("GEMINI", rate=5, burst=10, initial_concurrency=4, max_concurrency=32),
+    }
+    PROVIDER_MAX_RETRIES = int(os.getenv("PROVIDER_MAX_RETRIES", 5))
+    PROVIDER_RETRY_BASE_DELAY = float(os.getenv("PROVIDER_RETRY_BASE_DELAY", 1))
+    PROVIDER_RETRY_MAX_DELAY = float(os.getenv("PROVIDER_RETRY_MAX_DELAY", 60))
+
+
+    # --- Métricas e Perfilamento ---
+    # Porta onde `worker.py` expõe /metrics (0 = desativado); o servidor web usa a rota /metrics.
+    WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", 0))
+    # Fração dos jobs perfilados por amostragem (além dos pedidos com `profile`) e intervalo entre amostras (s).
+    PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", 0))
+    PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", 0.01))
+    PROFILE_FOLDER = os.getenv("PROFILE_FOLDER", "profiles")
+
+
+    # --- Provedores Simulados (benchmarks e desenvolvimento sem credenciais) ---
+    # Com 'true', os clientes Speech e Gemini são substituídos pelos de `app/fakes.py`, com
+    # FAKE_PROVIDER_LATENCY segundos por pedido. A API de transcrição simulada arranca com
+    # `python -m app.fakes --port 8000` (aponte PUBLIC_URL_API para ela).
+    FAKE_PROVIDERS = os.getenv("FAKE_PROVIDERS", "false").lower() == "true"
+    FAKE_PROVIDER_LATENCY = float(os.getenv("FAKE_PROVIDER_LATENCY", 0.2))
+
+
+    # --- Armazém de Conteúdos (blobs) ---
+    # Ficheiros enviados e textos das transcrições, endereçados pelo SHA-256 (ver `app/blobs.py`).
+    # Faça cópia de segurança desta pasta juntamente com o banco.
+    BLOB_FOLDER = os.getenv("BLOB_FOLDER", "blobs")
+    # Retenção dos ficheiros enviados (para reprocessamento): tamanho total e idade máximos
+    # (0 = sem limite); os usados há mais tempo são removidos primeiro, a cada BLOB_RETENTION_INTERVAL s.
+    BLOB_UPLOADS_MAX_BYTES = int(os.getenv("BLOB_UPLOADS_MAX_BYTES", 20 * 1024 ** 3))
+    BLOB_UPLOADS_MAX_AGE_DAYS = float(os.getenv("BLOB_UPLOADS_MAX_AGE_DAYS", 30))
+    BLOB_RETENTION_INTERVAL = float(os.getenv("BLOB_RETENTION_INTERVAL", 600))
+    # Nível de compressão dos textos com zstd (se o pacote `zstandard` estiver instalado).
+    BLOB_ZSTD_LEVEL = int(os.getenv("BLOB_ZSTD_LEVEL", 10))
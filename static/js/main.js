@@ -2,6 +2,7 @@ document.addEventListener('DOMContentLoaded', function () {
     const API_BASE_URL = ''; // Vazio para usar rotas relativas, ex: /api/batches
     let activeCharts = {};
     let activeTimers = {};
+    let activeStreams = {};
 
     // --- Lógica do Tema Escuro/Claro ---
     const themeToggleBtn = document.getElementById('theme-toggle');
@@ -87,25 +88,34 @@ document.addEventListener('DOMContentLoaded', function () {
     
     async function applyFilters(batchId = 'all') {
         try {
-            const dataUrl = new URL(`${API_BASE_URL}/api/dashboard_data`, window.location.origin);
+            const aggregatesUrl = new URL(`${API_BASE_URL}/api/dashboard/aggregates`, window.location.origin);
             if (batchId !== 'all') {
-                dataUrl.searchParams.append('batch_id', batchId);
+                aggregatesUrl.searchParams.append('batch_id', batchId);
             }
-            const dataResponse = await fetch(dataUrl);
-            const filteredData = await dataResponse.json();
-            renderDashboard(filteredData);
+            const aggregatesResponse = await fetch(aggregatesUrl);
+            const aggregates = await aggregatesResponse.json();
+            renderDashboard(aggregates);
+            await loadDetailsPage(batchId, null);
         } catch (error) { console.error("Erro ao aplicar filtros:", error); }
     }
 
     const batchFilterSelect = document.getElementById('batch-filter');
     if (batchFilterSelect) batchFilterSelect.addEventListener('change', (e) => applyFilters(e.target.value));
 
-    function renderDashboard(data) {
+    // A exportação é gerada em streaming pelo servidor; o navegador trata do download
+    const exportExcelBtn = document.getElementById('export-excel-btn');
+    if (exportExcelBtn) exportExcelBtn.addEventListener('click', () => {
+        const exportUrl = new URL(`${API_BASE_URL}/api/export`, window.location.origin);
+        exportUrl.searchParams.append('format', 'xlsx');
+        if (batchFilterSelect && batchFilterSelect.value !== 'all') exportUrl.searchParams.append('batch_id', batchFilterSelect.value);
+        window.location.href = exportUrl.toString();
+    });
+
+    function renderDashboard(aggregates) {
         destroyCharts();
-        renderKPIs(data);
-        renderSentimentDonut(data);
-        renderTopicsBar(data);
-        renderDetailsTable(data);
+        renderKPIs(aggregates);
+        renderSentimentDonut(aggregates);
+        renderTopicsBar(aggregates);
     }
 
     function destroyCharts() {
@@ -126,52 +136,73 @@ document.addEventListener('DOMContentLoaded', function () {
         };
     }
 
-    function renderKPIs(data) {
+    function renderKPIs(aggregates) {
         const kpiContainer = document.getElementById('kpis');
         if(!kpiContainer) return;
-        if (!data || data.length === 0) {
+        if (!aggregates || !aggregates.total_analyses) {
             kpiContainer.innerHTML = `<p class="text-gray-500 dark:text-gray-400 col-span-full text-center">Nenhum dado encontrado para os filtros selecionados.</p>`;
             return;
         }
-        const totalAnalises = data.length;
-        const sentimentCounts = data.reduce((acc, item) => { if(item.sentiment) acc[item.sentiment] = (acc[item.sentiment] || 0) + 1; return acc; }, {});
-        const predominantSentiment = Object.keys(sentimentCounts).length ? Object.keys(sentimentCounts).reduce((a, b) => sentimentCounts[a] > sentimentCounts[b] ? a : b) : 'N/A';
-        const problemTopics = data.filter(d => d.sentiment === 'Negativo').reduce((acc, item) => { if(item.topic) acc[item.topic] = (acc[item.topic] || 0) + 1; return acc; }, {});
-        const topProblem = Object.keys(problemTopics).length ? Object.keys(problemTopics).reduce((a, b) => problemTopics[a] > problemTopics[b] ? a : b) : 'Nenhum';
 
         kpiContainer.innerHTML = `
-            <div class="card text-center"><h3 class="text-gray-500 dark:text-gray-400 text-sm font-medium uppercase">Total de Análises</h3><p class="text-4xl font-bold text-gray-900 dark:text-white mt-2">${totalAnalises}</p></div>
-            <div class="card text-center"><h3 class="text-gray-500 dark:text-gray-400 text-sm font-medium uppercase">Sentimento Predominante</h3><p class="text-4xl font-bold text-amber-500 dark:text-amber-400 mt-2">${predominantSentiment}</p></div>
-            <div class="card text-center"><h3 class="text-gray-500 dark:text-gray-400 text-sm font-medium uppercase">Principal Desafio</h3><p class="text-4xl font-bold text-red-600 dark:text-red-500 mt-2">${topProblem}</p></div>`;
+            <div class="card text-center"><h3 class="text-gray-500 dark:text-gray-400 text-sm font-medium uppercase">Total de Análises</h3><p class="text-4xl font-bold text-gray-900 dark:text-white mt-2">${aggregates.total_analyses}</p></div>
+            <div class="card text-center"><h3 class="text-gray-500 dark:text-gray-400 text-sm font-medium uppercase">Sentimento Predominante</h3><p class="text-4xl font-bold text-amber-500 dark:text-amber-400 mt-2">${aggregates.predominant_sentiment}</p></div>
+            <div class="card text-center"><h3 class="text-gray-500 dark:text-gray-400 text-sm font-medium uppercase">Principal Desafio</h3><p class="text-4xl font-bold text-red-600 dark:text-red-500 mt-2">${aggregates.top_problem}</p></div>`;
     }
     
-    function renderSentimentDonut(data) {
+    function renderSentimentDonut(aggregates) {
         const ctx = document.getElementById('sentimentChart')?.getContext('2d');
-        if(!ctx || !data) return;
+        if(!ctx || !aggregates) return;
         const colors = getChartColors();
-        const sentimentCounts = data.reduce((acc, item) => { if(item.sentiment) acc[item.sentiment] = (acc[item.sentiment] || 0) + 1; return acc; }, {});
+        const sentimentCounts = aggregates.sentiment_counts || {};
         activeCharts.sentiment = new Chart(ctx, {
             type: 'doughnut', data: { labels: Object.keys(sentimentCounts), datasets: [{ data: Object.values(sentimentCounts), backgroundColor: Object.keys(sentimentCounts).map(key => colors.sentiment[key] || '#9ca3af'), borderColor: colors.donutBorder, borderWidth: 4, }] },
             options: { responsive: true, maintainAspectRatio: false, plugins: { legend: { position: 'bottom', labels: { color: colors.textColor } } } }
         });
     }
 
-    function renderTopicsBar(data) {
+    function renderTopicsBar(aggregates) {
         const ctx = document.getElementById('topicsChart')?.getContext('2d');
-        if(!ctx || !data) return;
+        if(!ctx || !aggregates) return;
         const colors = getChartColors();
-        const topicCounts = data.reduce((acc, item) => { if(item.topic) acc[item.topic] = (acc[item.topic] || 0) + 1; return acc; }, {});
+        const topicCounts = aggregates.topic_counts || {};
         activeCharts.topics = new Chart(ctx, {
             type: 'bar', data: { labels: Object.keys(topicCounts), datasets: [{ label: 'Nº de Menções', data: Object.values(topicCounts), backgroundColor: colors.topics, }] },
             options: { indexAxis: 'y', responsive: true, maintainAspectRatio: false, scales: { x: { ticks: { color: colors.textColor }, grid: { color: colors.gridColor } }, y: { ticks: { color: colors.textColor }, grid: { display: false } } }, plugins: { legend: { display: false } } }
         });
     }
+
+    // --- Tabela de detalhes paginada (cursor devolvido pelo servidor) ---
+    async function loadDetailsPage(batchId, cursor) {
+        const dataUrl = new URL(`${API_BASE_URL}/api/dashboard_data`, window.location.origin);
+        if (batchId !== 'all') dataUrl.searchParams.append('batch_id', batchId);
+        if (cursor) dataUrl.searchParams.append('cursor', cursor);
+        const dataResponse = await fetch(dataUrl);
+        const page = await dataResponse.json();
+        renderDetailsTable(page.items, Boolean(cursor));
+        renderLoadMoreButton(batchId, page.next_cursor);
+    }
+
+    function renderLoadMoreButton(batchId, nextCursor) {
+        const container = document.getElementById('dataTable-more');
+        if (!container) return;
+        container.innerHTML = '';
+        if (!nextCursor) return;
+        const button = document.createElement('button');
+        button.className = 'bg-gray-200 dark:bg-gray-700 hover:bg-gray-300 dark:hover:bg-gray-600 text-gray-700 dark:text-gray-200 py-2 px-4 rounded-lg text-sm';
+        button.textContent = 'Carregar mais';
+        button.addEventListener('click', () => {
+            button.disabled = true;
+            loadDetailsPage(batchId, nextCursor).catch(error => console.error("Erro ao carregar mais análises:", error));
+        });
+        container.appendChild(button);
+    }
     
-    function renderDetailsTable(data) {
+    function renderDetailsTable(data, append = false) {
         const tableBody = document.getElementById('dataTable');
         if (!tableBody) return;
-        tableBody.innerHTML = '';
-        if (!data || data.length === 0) {
+        if (!append) tableBody.innerHTML = '';
+        if (!append && (!data || data.length === 0)) {
             tableBody.innerHTML = `<tr><td colspan="4" class="p-4 text-center text-gray-500">Nenhum dado para exibir.</td></tr>`; return;
         }
         const sentimentColors = { 'Positivo': 'text-green-600 dark:text-green-400', 'Negativo': 'text-red-600 dark:text-red-400', 'Neutro': 'text-amber-600 dark:text-amber-400' };
@@ -184,9 +215,9 @@ document.addEventListener('DOMContentLoaded', function () {
                 <td class="p-3 font-medium ${sentimentColors[item.sentiment] || ''}">${item.sentiment || 'N/A'}</td>
                 <td class="p-3 text-gray-700 dark:text-gray-300">${item.topic || 'N/A'}</td>
                 <td class="p-3 text-gray-500 dark:text-gray-400 text-sm">${item.summary || 'N/A'}</td>`;
+            row.addEventListener('click', () => openAnalysisModal(row.dataset.id));
             tableBody.appendChild(row);
         });
-        tableBody.querySelectorAll('.analysis-row').forEach(row => row.addEventListener('click', () => openAnalysisModal(row.dataset.id)));
     }
 
     async function loadTranscriptionModels() {
@@ -227,19 +258,17 @@ document.addEventListener('DOMContentLoaded', function () {
                     return;
                 }
                 
-                const formData = new FormData(uploadForm);
                 if (uploadStatus) uploadStatus.innerHTML = `<p class="text-blue-500">A enviar ficheiros...</p>`;
                 
                 try {
-                    const response = await fetch(`${API_BASE_URL}/api/upload`, { method: 'POST', body: formData });
-                    const result = await response.json();
-                    if (response.ok) {
-                        if (uploadStatus) uploadStatus.innerHTML = `<p class="text-green-500">${result.message}</p>`;
-                        uploadForm.reset();
-                        setTimeout(loadBatchesData, 2000); 
-                    } else { 
-                        throw new Error(result.error || 'Erro desconhecido no servidor.'); 
-                    }
+                    const result = await uploadFilesInChunks(uploadForm, Array.from(fileUploadInput.files), (sent, total) => {
+                        const percent = total ? Math.floor(sent * 100 / total) : 100;
+                        if (uploadStatus) uploadStatus.innerHTML = `<p class="text-blue-500">A enviar ficheiros... ${percent}%</p>`;
+                    });
+                    const skipped = result.skipped.length ? ` ${result.skipped.length} ficheiro(s) ignorado(s).` : '';
+                    if (uploadStatus) uploadStatus.innerHTML = `<p class="text-green-500">Lote enviado: ${result.uploads.length} ficheiros em processamento.${skipped}</p>`;
+                    uploadForm.reset();
+                    loadBatchesData();
                 } catch (error) {
                     if (uploadStatus) uploadStatus.innerHTML = `<p class="text-red-500">Erro: ${error.message}</p>`;
                 }
@@ -247,6 +276,84 @@ document.addEventListener('DOMContentLoaded', function () {
         }
     }
 
+    // --- Upload por Blocos (retomável) ---
+    // Cada ficheiro é enviado em blocos (PUT com offset) e finalizado logo a seguir, pelo que o
+    // servidor começa a processá-lo sem esperar pelo resto do lote. Após uma falha, o envio
+    // retoma a partir do offset que o servidor confirmou.
+    const UPLOAD_PARALLEL_FILES = 3;
+    const UPLOAD_MAX_RETRIES = 5;
+
+    const sleep = (ms) => new Promise(resolve => setTimeout(resolve, ms));
+
+    async function uploadFilesInChunks(form, files, onProgress) {
+        const initResponse = await fetch(`${API_BASE_URL}/api/uploads`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                batchName: form.querySelector('[name="batchName"]').value,
+                modelId: form.querySelector('[name="modelId"]').value,
+                forceReprocess: form.querySelector('[name="forceReprocess"]').checked,
+                files: files.map(file => ({ name: file.name, size: file.size }))
+            })
+        });
+        const session = await initResponse.json();
+        if (!initResponse.ok) throw new Error(session.error || 'Erro desconhecido no servidor.');
+        loadBatchesData(); // O lote já existe; o progresso do envio aparece nos seus ficheiros
+
+        const total = session.uploads.reduce((sum, upload) => sum + upload.size, 0);
+        const sentByUpload = {};
+        const reportProgress = (uploadId, offset) => {
+            sentByUpload[uploadId] = offset;
+            onProgress(Object.values(sentByUpload).reduce((sum, sent) => sum + sent, 0), total);
+        };
+
+        const queue = [...session.uploads];
+        const worker = async () => {
+            while (queue.length > 0) {
+                const upload = queue.shift();
+                await uploadSingleFile(upload, files[upload.index], session.chunk_size, reportProgress);
+            }
+        };
+        await Promise.all(Array.from({ length: Math.min(UPLOAD_PARALLEL_FILES, queue.length) }, worker));
+        return session;
+    }
+
+    async function uploadSingleFile(upload, file, chunkSize, reportProgress) {
+        const url = `${API_BASE_URL}/api/uploads/${upload.upload_id}`;
+        let offset = upload.offset;
+        let failures = 0;
+        while (offset < upload.size) {
+            try {
+                const response = await fetch(`${url}?offset=${offset}`, {
+                    method: 'PUT',
+                    headers: { 'Content-Type': 'application/octet-stream' },
+                    body: file.slice(offset, offset + chunkSize)
+                });
+                const result = await response.json();
+                if (response.status === 409) {
+                    offset = result.offset; // O servidor já tinha (ou não) este bloco
+                } else if (!response.ok) {
+                    throw new Error(result.error || `Erro ${response.status} ao enviar '${upload.filename}'.`);
+                } else {
+                    offset = result.offset;
+                    failures = 0;
+                }
+                reportProgress(upload.upload_id, offset);
+            } catch (error) {
+                if (++failures > UPLOAD_MAX_RETRIES) throw error;
+                await sleep(1000 * 2 ** (failures - 1));
+                // Retoma a partir do que o servidor confirmou
+                const status = await fetch(url).then(r => r.ok ? r.json() : null).catch(() => null);
+                if (status) offset = status.offset;
+            }
+        }
+        const response = await fetch(`${url}/finalize`, { method: 'POST' });
+        if (!response.ok) {
+            const result = await response.json().catch(() => ({}));
+            throw new Error(result.error || `Erro ao finalizar '${upload.filename}'.`);
+        }
+    }
+
     async function loadBatchesData() {
         try {
             const response = await fetch(`${API_BASE_URL}/api/batches`);
@@ -284,12 +391,52 @@ document.addEventListener('DOMContentLoaded', function () {
         const isVisible = filesRow.style.display === 'table-row';
         if (isVisible) {
             filesRow.style.display = 'none';
-            if(activeTimers[batchId]) clearInterval(activeTimers[batchId]);
+            stopBatchUpdates(batchId);
         } else {
             filesRow.style.display = 'table-row';
-            await loadAndRenderBatchFiles(batchId);
+            startBatchUpdates(batchId);
         }
     }
+
+    function stopBatchUpdates(batchId) {
+        if (activeTimers[batchId]) clearInterval(activeTimers[batchId]);
+        delete activeTimers[batchId];
+        if (activeStreams[batchId]) activeStreams[batchId].close();
+        delete activeStreams[batchId];
+    }
+
+    // --- Atualizações em tempo real (SSE), com polling como alternativa ---
+    function startBatchUpdates(batchId) {
+        stopBatchUpdates(batchId);
+        if (!window.EventSource) {
+            loadAndRenderBatchFiles(batchId);
+            return;
+        }
+        const files = new Map();
+        let failedAttempts = 0;
+        const source = new EventSource(`${API_BASE_URL}/api/batch/${batchId}/events`);
+        activeStreams[batchId] = source;
+
+        source.addEventListener('snapshot', (e) => {
+            failedAttempts = 0;
+            files.clear();
+            JSON.parse(e.data).forEach(file => files.set(file.id, file));
+            renderFilesTable(batchId, Array.from(files.values()));
+        });
+        source.addEventListener('progress', (e) => {
+            JSON.parse(e.data).forEach(file => files.set(file.id, file));
+            renderFilesTable(batchId, Array.from(files.values()));
+        });
+        source.addEventListener('done', () => stopBatchUpdates(batchId));
+        source.onerror = () => {
+            // O navegador volta a ligar-se sozinho; se a ligação falhar repetidamente, passa a polling
+            failedAttempts += 1;
+            if (source.readyState === EventSource.CLOSED || failedAttempts >= 3) {
+                stopBatchUpdates(batchId);
+                loadAndRenderBatchFiles(batchId);
+            }
+        };
+    }
     
     async function loadAndRenderBatchFiles(batchId) {
         const container = document.getElementById(`files-table-${batchId}`);
@@ -327,7 +474,11 @@ document.addEventListener('DOMContentLoaded', function () {
             } else if (file.status && file.status.toLowerCase().includes('erro')) {
                 actions = `<button class="view-transcription-btn text-red-500 hover:text-red-400" data-id="${file.id}">Ver Erro</button>`;
             }
-            tableHTML += `<tr class="border-t border-gray-200 dark:border-gray-700"><td class="p-2">${file.filename}</td><td class="p-2 font-medium ${statusColor}">${file.status}</td><td class="p-2 text-right">${actions}</td></tr>`;
+            let progressBar = '';
+            if (file.status !== 'Concluído' && !(file.status && file.status.toLowerCase().includes('erro')) && file.progress > 0) {
+                progressBar = `<div class="w-full bg-gray-200 dark:bg-gray-700 rounded-full h-1.5 mt-1"><div class="bg-blue-500 h-1.5 rounded-full" style="width: ${file.progress}%"></div></div>`;
+            }
+            tableHTML += `<tr class="border-t border-gray-200 dark:border-gray-700"><td class="p-2">${file.filename}</td><td class="p-2 font-medium ${statusColor}">${file.status}${progressBar}</td><td class="p-2 text-right">${actions}</td></tr>`;
         });
         tableHTML += `</table>`;
         container.innerHTML = tableHTML;
@@ -337,6 +488,58 @@ document.addEventListener('DOMContentLoaded', function () {
     const modal = document.getElementById('transcription-modal');
     const modalCloseBtn = document.getElementById('modal-close-btn');
 
+    // --- Segmentos com tempos, carregados por páginas ao percorrer o modal ---
+    const SEGMENTS_PAGE_SIZE = 100;
+    let segmentsState = null; // { transcriptionId, nextAfter, loading, lastSpeaker }
+
+    function formatSegmentTime(seconds) {
+        const total = Math.floor(seconds);
+        return `${String(Math.floor(total / 60)).padStart(2, '0')}:${String(total % 60).padStart(2, '0')}`;
+    }
+
+    function appendSegments(container, segments) {
+        segments.forEach(segment => {
+            const paragraph = document.createElement('p');
+            paragraph.className = 'mb-2';
+            const time = document.createElement('span');
+            time.className = 'text-xs text-gray-500 mr-2';
+            time.textContent = `[${formatSegmentTime(segment.start)}]`;
+            paragraph.appendChild(time);
+            if (segment.speaker !== segmentsState.lastSpeaker) {
+                const speaker = document.createElement('b');
+                speaker.textContent = `Interveniente ${segment.speaker}: `;
+                paragraph.appendChild(speaker);
+                segmentsState.lastSpeaker = segment.speaker;
+            }
+            paragraph.appendChild(document.createTextNode(segment.text));
+            container.appendChild(paragraph);
+        });
+    }
+
+    async function fetchSegmentsPage(transcriptionId, after) {
+        const params = new URLSearchParams({ limit: SEGMENTS_PAGE_SIZE });
+        if (after !== null && after !== undefined) params.set('after', after);
+        const response = await fetch(`${API_BASE_URL}/api/transcription/${transcriptionId}/segments?${params}`);
+        if (!response.ok) throw new Error(`HTTP ${response.status}`);
+        return response.json();
+    }
+
+    async function loadMoreSegments(modalContent) {
+        const state = segmentsState;
+        if (!state || state.loading || state.nextAfter === null) return;
+        state.loading = true;
+        try {
+            const data = await fetchSegmentsPage(state.transcriptionId, state.nextAfter);
+            if (segmentsState !== state) return; // O modal foi aberto para outro ficheiro entretanto
+            appendSegments(modalContent, data.segments);
+            state.nextAfter = data.next_after;
+        } catch (error) {
+            console.error('Erro ao carregar segmentos:', error);
+        } finally {
+            state.loading = false;
+        }
+    }
+
     async function openAnalysisModal(transcriptionId) {
         if (!modal || !transcriptionId) return;
         const modalTitle = document.getElementById('modal-title');
@@ -344,9 +547,21 @@ document.addEventListener('DOMContentLoaded', function () {
         modalTitle.textContent = "Análise Individual";
         modalContent.innerHTML = '<p>A carregar conteúdo...</p>';
         modal.classList.remove('hidden');
+        const state = { transcriptionId, nextAfter: null, loading: false, lastSpeaker: null };
+        segmentsState = state;
         try {
+            // Transcrições com segmentos (Chirp) são mostradas por páginas; as restantes, de uma vez
+            const page = await fetchSegmentsPage(transcriptionId, null);
+            if (segmentsState !== state) return;
+            if (page.segments.length) {
+                modalContent.innerHTML = '';
+                appendSegments(modalContent, page.segments);
+                state.nextAfter = page.next_after;
+                return;
+            }
             const response = await fetch(`${API_BASE_URL}/api/transcription/${transcriptionId}`);
             const data = await response.json();
+            if (segmentsState !== state) return;
             const formattedText = data.transcript_text ? data.transcript_text.replace(/\*\*(.*?)\*\*/g, '<b>$1</b>').replace(/\n/g, '<br>') : '<p>Conteúdo não disponível.</p>';
             modalContent.innerHTML = formattedText;
         } catch (error) {
@@ -354,7 +569,19 @@ document.addEventListener('DOMContentLoaded', function () {
         }
     }
 
-    function hideModal() { if (modal) modal.classList.add('hidden'); }
+    const modalContentEl = document.getElementById('modal-content');
+    if (modalContentEl) {
+        modalContentEl.addEventListener('scroll', () => {
+            if (modalContentEl.scrollTop + modalContentEl.clientHeight >= modalContentEl.scrollHeight - 50) {
+                loadMoreSegments(modalContentEl);
+            }
+        });
+    }
+
+    function hideModal() {
+        segmentsState = null;
+        if (modal) modal.classList.add('hidden');
+    }
     
     if (modalCloseBtn) modalCloseBtn.addEventListener('click', hideModal);
     if (modal) modal.addEventListener('click', (e) => { if (e.target === modal) hideModal(); });
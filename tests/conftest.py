@@ -0,0 +1,75 @@
+import io
+import os
+import sys
+import tempfile
+
+import pytest
+
+# A configuração é lida do ambiente na importação de `config`: os testes usam uma pasta
+# temporária, os provedores simulados (`app/fakes.py`) e nenhum worker em segundo plano
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = tempfile.mkdtemp(prefix='transcricao-tests-')
+os.environ.update({
+    'DATABASE_URL': f"sqlite:///{os.path.join(DATA_DIR, 'test.db')}",
+    'FAKE_PROVIDERS': 'true',
+    'FAKE_PROVIDER_LATENCY': '0',
+    'WORKER_AUTOSTART': 'false',
+    'AUDIO_PREPROCESS': 'false',
+    'GEMINI_BATCH_MAX_WAIT': '0', # Um worker só: não espera por outras transcrições para o lote
+    'BLOB_FOLDER': os.path.join(DATA_DIR, 'blobs'),
+    'PROFILE_FOLDER': os.path.join(DATA_DIR, 'profiles'),
+    'PROCESSED_AUDIO_FOLDER': os.path.join(DATA_DIR, 'processed'),
+})
+sys.path.insert(0, ROOT)
+
+from config import Config
+from app import create_app
+from app.fakes import FakeJobsApi
+
+
+@pytest.fixture(scope='session')
+def app():
+    """Aplicação com a API de transcrição simulada; uma só por sessão (o gravador de estados é global)."""
+    os.chdir(DATA_DIR) # UPLOAD_FOLDER é relativo
+    api = FakeJobsApi(job_seconds=0).start()
+    Config.PUBLIC_URL_API = api.url
+    app = create_app()
+    yield app
+    api.stop()
+
+@pytest.fixture
+def db_session(app):
+    """Contexto da aplicação com todas as tabelas vazias no fim de cada teste."""
+    from app.models import db
+    from app.search import clear_search_index
+    with app.app_context():
+        yield db.session
+        db.session.rollback()
+        for table in reversed(db.metadata.sorted_tables):
+            if table.name != 'schema_migrations':
+                db.session.execute(table.delete())
+        clear_search_index(db.session.connection())
+        db.session.commit()
+
+@pytest.fixture
+def client(app, db_session):
+    return app.test_client()
+
+
+def upload_texts(client, texts, model_id='whisper-large-v3', batch_name='Lote de teste'):
+    """Envia ficheiros de texto por `/api/upload`; devolve o ID do lote."""
+    files = [(io.BytesIO(content.encode('utf-8')), f"ficheiro_{i}.txt") for i, content in enumerate(texts)]
+    response = client.post('/api/upload', data={'files[]': files, 'modelId': model_id, 'batchName': batch_name},
+                           content_type='multipart/form-data')
+    assert response.status_code == 202, response.get_json()
+    return response.get_json()['batch_id']
+
+def run_pending_jobs():
+    """Executa os jobs da fila na thread do teste, como faria um worker."""
+    from app.jobs import claim_next_job
+    from app.services import run_job
+    count = 0
+    while (job := claim_next_job()) is not None:
+        run_job(job)
+        count += 1
+    return count
@@ -0,0 +1,34 @@
+import os
+import threading
+
+from app import audio
+
+
+def test_concurrent_conversions_use_separate_temp_files(tmp_path, monkeypatch):
+    source = tmp_path / 'chamada.mp3'
+    source.write_bytes(b'mp3')
+    cache_folder = str(tmp_path / 'processed')
+    temp_paths = []
+    barrier = threading.Barrier(2)
+
+    def fake_ffmpeg(command, **kwargs):
+        # As duas conversões escrevem ao mesmo tempo, como dois workers com o mesmo áudio
+        temp_paths.append(command[-1])
+        barrier.wait(timeout=5)
+        with open(command[-1], 'wb') as out:
+            out.write(b'flac')
+    monkeypatch.setattr(audio, 'probe_audio', lambda path: {'codec': 'mp3', 'channels': 2, 'sample_rate': 44100})
+    monkeypatch.setattr(audio.subprocess, 'run', fake_ffmpeg)
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(audio.preprocess_audio(str(source), 'abc', cache_folder)))
+               for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(set(temp_paths)) == 2 and all(path.endswith('.flac') for path in temp_paths)
+    cached_path = os.path.join(cache_folder, 'abc-flac.flac')
+    assert results == [(cached_path, 'audio/flac')] * 2
+    assert os.listdir(cache_folder) == ['abc-flac.flac']
@@ -0,0 +1,76 @@
+import io
+
+from conftest import upload_texts, run_pending_jobs
+
+from app.cache import cache_key_model, find_cached_result
+from app.clients import get_gemini_model
+from app.models import db, Batch, Transcription, Analysis, add_analysis_version
+from app.progress import STATUS_DONE
+
+
+def make_done_transcription(audio_hash, model_id, prompt_version='v1'):
+    batch = Batch(name='Lote')
+    db.session.add(batch)
+    db.session.flush()
+    transcription = Transcription(filename='a.wav', batch_id=batch.id, audio_hash=audio_hash,
+                                  model_id=model_id, status=STATUS_DONE)
+    db.session.add(transcription)
+    db.session.flush()
+    add_analysis_version(transcription, Analysis(sentiment='Neutro', topic='Pagamento', prompt_version=prompt_version))
+    db.session.commit()
+    return transcription
+
+
+def test_cache_key_ignores_model_only_for_text():
+    assert cache_key_model('text', 'whisper-large-v3') is None
+    assert cache_key_model('audio', 'whisper-large-v3') == 'whisper-large-v3'
+
+
+def test_find_cached_result_matches_hash_model_and_prompt_version(db_session):
+    cached = make_done_transcription('h1', 'whisper-large-v3')
+
+    assert find_cached_result('h1', 'whisper-large-v3', 'v1').id == cached.id
+    assert find_cached_result('h1', None, 'v1').id == cached.id # Texto: só o hash
+    assert find_cached_result('h1', 'whisper-medium', 'v1') is None
+    assert find_cached_result('h1', 'whisper-large-v3', 'v2') is None
+    assert find_cached_result('h1', 'whisper-large-v3', 'v1', exclude_id=cached.id) is None
+    assert find_cached_result(None, 'whisper-large-v3', 'v1') is None
+
+
+def test_text_cache_hit_copies_result_with_requesting_model(client):
+    text = "Operador: bom dia. Aluno: quero cancelar a matrícula."
+    first_batch = upload_texts(client, [text], model_id='whisper-large-v3')
+    run_pending_jobs()
+    second_batch = upload_texts(client, [text], model_id='whisper-medium')
+    run_pending_jobs()
+
+    source = Transcription.query.filter_by(batch_id=first_batch).one()
+    copy = Transcription.query.filter_by(batch_id=second_batch).one()
+    assert copy.status == STATUS_DONE
+    assert copy.transcript_blob == source.transcript_blob
+    assert copy.analysis.summary == source.analysis.summary
+    assert copy.analysis.model_id == 'whisper-medium'
+
+    aggregates = client.get(f'/api/dashboard/aggregates?batch_id={second_batch}').get_json()
+    assert aggregates['total_analyses'] == 1
+
+
+def test_force_reprocess_skips_cache(client):
+    text = "Operador: boa tarde. Aluno: não consigo aceder à plataforma."
+    upload_texts(client, [text])
+    run_pending_jobs()
+    model = get_gemini_model()
+
+    calls = model.calls
+    upload_texts(client, [text])
+    run_pending_jobs()
+    assert model.calls == calls # Acerto na cache: sem nova análise
+
+    response = client.post('/api/upload', data={
+        'files[]': [(io.BytesIO(text.encode('utf-8')), 'igual.txt')],
+        'modelId': 'whisper-large-v3', 'forceReprocess': '1'
+    }, content_type='multipart/form-data')
+    assert response.status_code == 202
+    run_pending_jobs()
+    assert model.calls == calls + 1
+    assert {t.status for t in Transcription.query} == {STATUS_DONE}
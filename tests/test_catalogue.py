@@ -0,0 +1,17 @@
+from datetime import datetime, timedelta
+
+from app.catalogue import _claim_refresh
+from app.clients import http_request_max_seconds
+from config import Config
+
+
+def test_refresh_lease_covers_the_retried_request(db_session):
+    lease = http_request_max_seconds(Config.MODEL_CATALOGUE_TIMEOUT)
+    # Cada tentativa de ligação pode esgotar o timeout, e a última também a leitura
+    assert lease > Config.MODEL_CATALOGUE_TIMEOUT * (Config.HTTP_CONNECT_RETRIES + 1)
+
+    now = datetime.utcnow()
+    assert _claim_refresh(now)
+    # Enquanto o pedido do primeiro processo pode estar a decorrer, ninguém o retoma
+    assert not _claim_refresh(now + timedelta(seconds=lease - 1))
+    assert _claim_refresh(now + timedelta(seconds=lease + 1))
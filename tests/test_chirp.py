@@ -0,0 +1,55 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app.chirp import Chunk, ChirpRecognizer, FakeRecognizer, stitch_chunks
+from app.fakes import FakeSpeechClient, WAV_BYTES_PER_SECOND, WAV_HEADER_BYTES
+
+
+def expected_speaker(word):
+    # FakeRecognizer: o interveniente alterna a cada 10 palavras, pelo tempo absoluto
+    return str((int(word[1:]) // 10) % 2 + 1)
+
+def recognize_all(recognizer, chunks):
+    return [recognizer.recognize(b'', chunk) for chunk in chunks]
+
+
+def test_stitch_keeps_each_word_once_across_overlaps():
+    chunks = [Chunk(0, 0.0, 50.0, 0.0), Chunk(1, 48.0, 100.0, 50.0), Chunk(2, 98.0, 130.0, 100.0)]
+    dialogue, analysis_input, segments = stitch_chunks(chunks, recognize_all(FakeRecognizer(), chunks))
+
+    words = analysis_input.split()
+    assert words == [f"w{n}" for n in range(260)] # 2 palavras/s durante 130 s
+    assert " ".join(segment['text'] for segment in segments) == analysis_input
+    assert dialogue.startswith("**Interveniente 1:** w0 w1")
+
+
+def test_stitch_remaps_speaker_labels_that_swap_between_chunks():
+    chunks = [Chunk(0, 0.0, 50.0, 0.0), Chunk(1, 48.0, 100.0, 50.0), Chunk(2, 98.0, 130.0, 100.0)]
+    results = recognize_all(FakeRecognizer(relabel=True), chunks)
+    assert results[1].words[0].speaker != expected_speaker(results[1].words[0].word) # O bloco 1 vem trocado
+
+    _, _, segments = stitch_chunks(chunks, results)
+
+    for segment in segments:
+        assert {expected_speaker(word) for word in segment['text'].split()} == {segment['speaker']}
+    assert {segment['speaker'] for segment in segments} == {'1', '2'}
+    # Tempos absolutos e por ordem
+    starts = [segment['start'] for segment in segments]
+    assert starts == sorted(starts) and segments[-1]['end'] <= 130.0
+
+
+def test_stitch_falls_back_to_plain_text_without_words():
+    chunks = [Chunk(0, 0.0, 30.0, 0.0)]
+    results = [SimpleNamespace(words=[], transcript="texto sem tempos")]
+    assert stitch_chunks(chunks, results) == ("texto sem tempos", "texto sem tempos", [])
+
+
+def test_chirp_recognizer_reads_words_from_the_fake_client():
+    recognizer = ChirpRecognizer('projeto', client=FakeSpeechClient(words_per_turn=3))
+    content = b'\0' * (WAV_HEADER_BYTES + 3 * WAV_BYTES_PER_SECOND)
+    result = recognizer.recognize(content, Chunk(0, 0.0, 3.0, 0.0))
+
+    assert [w.word for w in result.words] == [f"palavra{n}" for n in range(6)]
+    assert [w.speaker for w in result.words] == ['1', '1', '1', '2', '2', '2']
+    assert result.words[1].start == pytest.approx(0.5)
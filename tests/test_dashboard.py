@@ -0,0 +1,22 @@
+from conftest import upload_texts, run_pending_jobs
+
+TEXTS = [f"Operador: bom dia, chamada {i}. Aluno: tenho uma dúvida sobre o pagamento." for i in range(3)]
+
+
+def test_dashboard_pages_clamp_the_limit(client):
+    batch_id = upload_texts(client, TEXTS)
+    run_pending_jobs()
+
+    for limit in (0, -1):
+        response = client.get(f'/api/dashboard_data?batch_id={batch_id}&limit={limit}')
+        assert response.status_code == 200
+        data = response.get_json()
+        assert len(data['items']) == 1 and data['next_cursor']
+
+    pages, cursor = [], None
+    while True:
+        data = client.get(f'/api/dashboard_data?batch_id={batch_id}&limit=2' + (f'&cursor={cursor}' if cursor else '')).get_json()
+        pages.append(len(data['items']))
+        if not (cursor := data['next_cursor']):
+            break
+    assert pages == [2, 1]
@@ -0,0 +1,28 @@
+import json
+import subprocess
+import sys
+
+from conftest import ROOT
+
+# Orçamento do arranque de cada worker do gunicorn (ver `benchmarks/import_time.py`)
+IMPORT_BUDGET_MS = 1500
+# Só carregados quando um pipeline precisa deles
+HEAVY_MODULES = ['google.cloud.speech', 'vertexai', 'librosa', 'soundfile', 'numba', 'scipy', 'torch',
+                 'pandas', 'xlsxwriter']
+
+CHILD_CODE = f"""
+import json, sys, time
+started = time.perf_counter()
+import app, app.routes, app.jobs
+elapsed = (time.perf_counter() - started) * 1000
+print(json.dumps({{'ms': elapsed, 'loaded': [m for m in {HEAVY_MODULES!r} if m in sys.modules]}}))
+"""
+
+
+def test_app_import_is_lazy_and_within_budget():
+    # Processo novo: nesta sessão de testes os módulos já estão importados
+    result = subprocess.run([sys.executable, '-c', CHILD_CODE], cwd=ROOT, capture_output=True, text=True, check=True)
+    measured = json.loads(result.stdout.strip().splitlines()[-1])
+
+    assert measured['loaded'] == []
+    assert measured['ms'] < IMPORT_BUDGET_MS
@@ -0,0 +1,51 @@
+from datetime import datetime, timedelta
+
+from conftest import upload_texts, run_pending_jobs
+
+from app.jobs import claim_next_job, requeue_stale_jobs
+from app.models import db, Job, Transcription
+from app.progress import STATUS_DONE
+
+TEXT = "Operador: bom dia. Aluno: tenho uma dúvida sobre o pagamento."
+
+
+def abandon_running_job():
+    """Simula um worker que assumiu o job e deixou de dar sinal."""
+    job = claim_next_job()
+    job.heartbeat_at = datetime.utcnow() - timedelta(hours=1)
+    db.session.commit()
+    return job
+
+
+def test_failed_first_run_marks_job_and_transcription(client):
+    upload_texts(client, [""])
+    run_pending_jobs()
+
+    transcription = Transcription.query.one()
+    job = Job.query.one()
+    assert transcription.status.startswith("Erro no pipeline")
+    assert job.status == Job.FAILED and job.last_error
+
+
+def test_stale_job_out_of_attempts_fails_the_transcription(client):
+    upload_texts(client, [TEXT])
+    abandon_running_job()
+
+    assert requeue_stale_jobs(lease_seconds=60, max_attempts=1) == 0
+    assert Job.query.one().status == Job.FAILED
+    assert Transcription.query.one().status.startswith("Erro no pipeline")
+
+
+def test_stale_reprocess_out_of_attempts_keeps_the_current_version(client):
+    batch_id = upload_texts(client, [TEXT])
+    run_pending_jobs()
+    before = client.get(f'/api/dashboard/aggregates?batch_id={batch_id}').get_json()
+
+    client.post('/api/reprocess', json={'stage': 'analysis', 'batchId': batch_id})
+    job = abandon_running_job()
+    requeue_stale_jobs(lease_seconds=60, max_attempts=1)
+
+    db.session.expire_all()
+    assert db.session.get(Job, job.id).status == Job.FAILED
+    assert Transcription.query.one().status == STATUS_DONE
+    assert client.get(f'/api/dashboard/aggregates?batch_id={batch_id}').get_json() == before
@@ -0,0 +1,34 @@
+from sqlalchemy import text
+
+from conftest import upload_texts, run_pending_jobs
+
+from app.models import db, Job, Transcription
+from app.poller import ApiJobPoller
+from app.search import SEARCH_TABLE, build_fts_query
+
+TEXT = "Operador: bom dia. Aluno: a fatura veio em duplicado."
+
+
+def make_poller(app):
+    return ApiJobPoller(app, min_interval=0, max_interval=0, backoff=1, max_errors=1, on_completed=lambda: None)
+
+
+def test_failed_external_job_marks_the_error_and_leaves_search(app, client):
+    upload_texts(client, [TEXT])
+    run_pending_jobs()
+    assert len(client.get('/api/search?q=fatura').get_json()['items']) == 1
+
+    # Job à espera na API externa com um ID que a API desconhece (404)
+    transcription = Transcription.query.one()
+    job = Job.query.one()
+    job.status = Job.WAITING
+    db.session.commit()
+    poller = make_poller(app)
+    poller.track(job.id, transcription.id, 'desconhecido')
+    poller._check_jobs([job.id])
+
+    db.session.expire_all()
+    assert db.session.get(Job, job.id).status == Job.FAILED
+    assert db.session.get(Transcription, transcription.id).status.startswith("Erro no pipeline: Falha ao verificar")
+    assert db.session.execute(text(f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH :query"),
+                              {'query': build_fts_query('fatura')}).first() is None
@@ -0,0 +1,103 @@
+import time
+
+import pytest
+import requests
+
+from app.ratelimit import (AdaptiveConcurrencyLimit, ProviderScheduler, TokenBucket, classify_error,
+                           PERMANENT, THROTTLED, TRANSIENT)
+
+
+def http_error(status):
+    response = requests.Response()
+    response.status_code = status
+    return requests.exceptions.HTTPError(response=response)
+
+def make_scheduler(**overrides):
+    options = dict(rate=0, burst=1, initial_concurrency=4, max_concurrency=8,
+                   max_retries=3, base_delay=0.001, max_delay=0.01)
+    options.update(overrides)
+    return ProviderScheduler('teste', **options)
+
+
+def test_classify_error():
+    assert classify_error(http_error(429)) == THROTTLED
+    assert classify_error(http_error(503)) == TRANSIENT
+    assert classify_error(http_error(400)) == PERMANENT
+    assert classify_error(requests.exceptions.ConnectionError()) == TRANSIENT
+    assert classify_error(type('ResourceExhausted', (Exception,), {})()) == THROTTLED
+    assert classify_error(ValueError("resposta inválida")) == PERMANENT
+
+
+def test_token_bucket_allows_burst_then_limits_rate():
+    bucket = TokenBucket(rate=50, burst=5)
+    started = time.monotonic()
+    for _ in range(5):
+        bucket.acquire()
+    assert time.monotonic() - started < 0.05 # A rajada não espera
+
+    for _ in range(5):
+        bucket.acquire()
+    assert time.monotonic() - started >= 5 / 50 * 0.9
+
+
+def test_concurrency_limit_is_aimd():
+    limit = AdaptiveConcurrencyLimit(initial=4, min_limit=1, max_limit=8)
+    limit.release(limit.acquire(), None)
+    assert limit.limit == pytest.approx(4.25) # +1/limite por sucesso
+
+    limit.release(limit.acquire(), THROTTLED)
+    assert limit.limit == pytest.approx(2.125) # x0.5 por erro de quota
+
+    for _ in range(5):
+        limit.release(limit.acquire(), THROTTLED)
+    assert limit.limit == 1 # Nunca abaixo do mínimo
+    assert limit.in_flight == 0
+
+
+def test_concurrency_limit_decreases_once_per_window():
+    limit = AdaptiveConcurrencyLimit(initial=8, min_limit=1, max_limit=8)
+    # Uma rajada de 429 para pedidos que estavam todos em curso: uma só descida
+    generations = [limit.acquire() for _ in range(4)]
+    for generation in generations:
+        limit.release(generation, THROTTLED)
+    assert limit.limit == 4
+
+    # Um pedido iniciado depois da descida volta a poder baixar o limite
+    limit.release(limit.acquire(), THROTTLED)
+    assert limit.limit == 2
+
+
+def test_scheduler_retries_throttled_calls_and_lowers_concurrency():
+    scheduler = make_scheduler()
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise http_error(429)
+        return 'ok'
+
+    assert scheduler.call(flaky) == 'ok'
+    assert len(attempts) == 3
+    assert scheduler.stats['throttled'] == 2 and scheduler.stats['retries'] == 2
+    assert scheduler.concurrency.limit < 4
+
+
+def test_scheduler_does_not_retry_permanent_or_non_idempotent_failures():
+    scheduler = make_scheduler()
+    calls = []
+
+    def fail(error):
+        calls.append(error)
+        raise error
+
+    with pytest.raises(requests.exceptions.HTTPError):
+        scheduler.call(fail, http_error(400))
+    with pytest.raises(requests.exceptions.HTTPError):
+        scheduler.call(fail, http_error(503), retry_transient=False)
+    assert len(calls) == 2
+
+    with pytest.raises(requests.exceptions.HTTPError):
+        scheduler.call(fail, http_error(503), retries=1)
+    assert len(calls) == 4
+    assert scheduler.stats['failures'] == 3
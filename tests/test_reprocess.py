@@ -0,0 +1,81 @@
+from conftest import upload_texts, run_pending_jobs
+
+from app import services
+from app.models import db, Job, Transcription, BatchStat
+from app.progress import STATUS_DONE
+
+TEXTS = [f"Operador: bom dia, chamada {i}. Aluno: tenho uma dúvida sobre o pagamento." for i in range(5)]
+
+
+def aggregates(client, batch_id):
+    return client.get(f'/api/dashboard/aggregates?batch_id={batch_id}').get_json()
+
+def reprocess(client, **body):
+    response = client.post('/api/reprocess', json=body)
+    assert response.status_code == 202, response.get_json()
+    return response.get_json()
+
+
+def test_reprocess_moves_stats_to_the_new_version(client):
+    batch_id = upload_texts(client, TEXTS)
+    run_pending_jobs()
+    before = aggregates(client, batch_id)
+    assert before['total_analyses'] == len(TEXTS)
+
+    assert reprocess(client, stage='analysis', batchId=batch_id)['queued'] == len(TEXTS)
+    # Enquanto está na fila, a versão atual não conta e não ficam grupos a zero
+    during = aggregates(client, batch_id)
+    assert during['total_analyses'] == 0 and during['sentiment_counts'] == {}
+    assert BatchStat.query.filter(BatchStat.count <= 0).count() == 0
+
+    run_pending_jobs()
+    after = aggregates(client, batch_id)
+    assert after == before # O simulador é determinístico: mesmo texto, mesma análise
+    assert all(len(t.analyses) == 2 and t.analysis.version == 2 for t in Transcription.query)
+
+
+def test_reanalysis_reuses_the_original_analysis_input(client, monkeypatch):
+    seen = []
+    original = services.analyze_transcript
+    monkeypatch.setattr(services, 'analyze_transcript', lambda text, *args, **kwargs: (seen.append(text), original(text, *args, **kwargs))[1])
+
+    batch_id = upload_texts(client, TEXTS[:1])
+    run_pending_jobs()
+    reprocess(client, stage='analysis', batchId=batch_id)
+    run_pending_jobs()
+
+    assert seen == [TEXTS[0], TEXTS[0]] # Não o diálogo formatado
+
+
+def test_failed_reprocess_keeps_the_current_version(client, monkeypatch):
+    batch_id = upload_texts(client, TEXTS[:2])
+    run_pending_jobs()
+    before = aggregates(client, batch_id)
+    transcription = Transcription.query.order_by(Transcription.id).first()
+    transcript_blob = transcription.transcript_blob
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("modelo indisponível")
+    monkeypatch.setattr(services, 'analyze_transcript', fail)
+    reprocess(client, stage='transcription', transcriptionIds=[transcription.id], modelId='whisper-medium')
+    run_pending_jobs()
+
+    db.session.expire_all()
+    transcription = db.session.get(Transcription, transcription.id)
+    assert transcription.status == STATUS_DONE
+    assert transcription.model_id == 'whisper-large-v3'
+    assert transcription.transcript_blob == transcript_blob
+    assert len(transcription.analyses) == 1
+    assert aggregates(client, batch_id) == before
+
+    job = Job.query.order_by(Job.id.desc()).first()
+    assert job.status == Job.FAILED and "modelo indisponível" in job.last_error
+
+    # Continua elegível para reanálise
+    assert reprocess(client, stage='analysis', transcriptionIds=[transcription.id])['queued'] == 1
+
+
+def test_reprocess_validation(client):
+    assert client.post('/api/reprocess', json={'stage': 'tudo', 'batchId': 1}).status_code == 400
+    assert client.post('/api/reprocess', json={'stage': 'transcription', 'batchId': 1}).status_code == 400
+    assert client.post('/api/reprocess', json={'stage': 'analysis', 'batchId': 999}).status_code == 404
@@ -0,0 +1,50 @@
+from sqlalchemy import text
+
+from conftest import upload_texts, run_pending_jobs
+
+from app.models import db, Transcription
+from app.search import SEARCH_TABLE, index_transcription, remove_from_index, build_fts_query
+
+TEXTS = ["Operador: bom dia. Aluno: os pagamentos do curso estão em atraso.",
+         "Operador: boa tarde. Aluno: o certificado ainda não chegou."]
+
+
+def matching_ids(query):
+    return [row[0] for row in db.session.execute(
+        text(f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH :query"), {'query': build_fts_query(query)})]
+
+
+def test_search_finds_stemmed_terms_with_snippets(client):
+    upload_texts(client, TEXTS)
+    run_pending_jobs()
+
+    data = client.get('/api/search?q=atrasos').get_json()
+    assert len(data['items']) == 1 and not data['has_more']
+    assert '<mark>atraso</mark>' in data['items'][0]['snippet']
+
+
+def test_index_keeps_no_copy_of_the_texts_and_reindexes_exactly(client):
+    upload_texts(client, TEXTS[:1])
+    run_pending_jobs()
+    transcription = Transcription.query.one()
+
+    # Tabela sem conteúdo: o FTS5 não cria a tabela-sombra com os textos
+    assert db.session.execute(text("SELECT name FROM sqlite_master WHERE name = :name"),
+                              {'name': f"{SEARCH_TABLE}_content"}).first() is None
+
+    index_transcription(transcription.id, "Aluno: o certificado ainda não chegou.", "Resumo", "Certificados")
+    assert matching_ids('atrasos') == [] # Os termos antigos saem do índice
+    assert matching_ids('certificado') == [transcription.id]
+
+    remove_from_index(transcription.id)
+    assert matching_ids('certificado') == []
+
+
+def test_search_clamps_the_page_size(client):
+    upload_texts(client, TEXTS)
+    run_pending_jobs()
+
+    for per_page in (0, -1):
+        data = client.get(f'/api/search?q=aluno&per_page={per_page}').get_json()
+        assert len(data['items']) == 1 and data['has_more']
+    assert client.get('/api/search?q=aluno&page=0').status_code == 400
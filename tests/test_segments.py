@@ -0,0 +1,35 @@
+from datetime import timedelta
+from types import SimpleNamespace
+
+from app.chirp import Chunk, ChirpRecognizer, Word
+from app.segments import build_segments, format_dialogue
+
+
+def test_build_segments_splits_on_speaker_change_and_long_pauses():
+    words = [Word('a', 0.0, 0.5, '1'), Word('b', 0.6, 1.0, '1'), Word('c', 4.0, 4.5, '1'), Word('d', 5.0, 5.5, '2')]
+    segments = build_segments(words, max_gap=2.0)
+
+    assert [(s['speaker'], s['text'], s['start'], s['end']) for s in segments] == [
+        ('1', 'a b', 0.0, 1.0), ('1', 'c', 4.0, 4.5), ('2', 'd', 5.0, 5.5)
+    ]
+    assert format_dialogue(segments) == "**Interveniente 1:** a b c\n\n**Interveniente 2:** d"
+
+
+def test_chirp_recognizer_ignores_a_final_result_that_repeats_the_others():
+    def word(text, second, speaker):
+        return SimpleNamespace(word=text, start_offset=timedelta(seconds=second),
+                               end_offset=timedelta(seconds=second + 0.4), speaker_label=speaker)
+
+    def result(*words):
+        return SimpleNamespace(alternatives=[SimpleNamespace(transcript=" ".join(w.word for w in words), words=list(words))])
+
+    first, second = [word('ola', 0, '1')], [word('bom', 1, '2'), word('dia', 2, '2')]
+    client = SimpleNamespace(recognize=lambda request: SimpleNamespace(results=[
+        result(*first), result(*second), result(*first, *second)
+    ]))
+    words = ChirpRecognizer('projeto', client=client).recognize(b'', Chunk(0, 0.0, 3.0, 0.0)).words
+    assert [(w.word, w.speaker) for w in words] == [('ola', '1'), ('bom', '2'), ('dia', '2')]
+
+    client.recognize = lambda request: SimpleNamespace(results=[result(*first), result(*second)])
+    words = ChirpRecognizer('projeto', client=client).recognize(b'', Chunk(0, 0.0, 3.0, 0.0)).words
+    assert [w.word for w in words] == ['ola', 'bom', 'dia']
@@ -0,0 +1,117 @@
+import hashlib
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from conftest import run_pending_jobs
+
+from app import services
+from app.jobs import expire_abandoned_uploads, recover_orphan_transcriptions
+from app.models import db, Job, Transcription, Upload
+from app.progress import STATUS_DONE
+from app.uploads import UploadOffsetMismatch
+
+CONTENT = "Operador: bom dia. Aluno: o certificado ainda não chegou.".encode('utf-8')
+
+
+def init_upload(client, content=CONTENT):
+    response = client.post('/api/uploads', json={
+        'batchName': 'Upload por blocos', 'modelId': 'whisper-large-v3',
+        'files': [{'name': 'chamada.txt', 'size': len(content)}]
+    })
+    assert response.status_code == 201, response.get_json()
+    return response.get_json()['uploads'][0]
+
+
+def test_chunked_upload_resumes_from_the_server_offset(client):
+    upload = init_upload(client)
+    url = f"/api/uploads/{upload['upload_id']}"
+
+    assert client.put(f"{url}?offset=0", data=CONTENT[:10]).get_json()['offset'] == 10
+    # Bloco repetido (a resposta anterior perdeu-se): o servidor indica onde retomar
+    response = client.put(f"{url}?offset=0", data=CONTENT[:10])
+    assert response.status_code == 409 and response.get_json()['offset'] == 10
+    assert client.get(url).get_json()['offset'] == 10
+
+    client.put(f"{url}?offset=10", data=CONTENT[10:])
+    assert client.post(f"{url}/finalize").status_code == 202
+    run_pending_jobs()
+
+    transcription = db.session.get(Transcription, upload['transcription_id'])
+    assert transcription.audio_hash == hashlib.sha256(CONTENT).hexdigest()
+    assert transcription.status == STATUS_DONE
+
+
+def test_orphan_recovery_skips_uploads_in_progress(client):
+    upload = init_upload(client)
+    client.put(f"/api/uploads/{upload['upload_id']}?offset=0", data=CONTENT[:10])
+
+    assert recover_orphan_transcriptions() == 0
+    assert db.session.get(Transcription, upload['transcription_id']).status.startswith("A carregar")
+
+    # Sem upload em curso nem job ativo, a linha é dada como interrompida
+    client.put(f"/api/uploads/{upload['upload_id']}?offset=10", data=CONTENT[10:])
+    client.post(f"/api/uploads/{upload['upload_id']}/finalize")
+    Job.query.update({Job.status: Job.FAILED})
+    db.session.commit()
+    assert recover_orphan_transcriptions() == 1
+
+
+class SlowStream:
+    """Corpo do pedido que chega aos poucos (um byte de cada vez)."""
+
+    def __init__(self, data):
+        self.data = data
+
+    def read(self, size):
+        time.sleep(0.005)
+        chunk, self.data = self.data[:1], self.data[1:]
+        return chunk
+
+
+def test_repeated_chunks_in_parallel_are_written_once(app, client):
+    upload = init_upload(client)
+    results = []
+
+    def put(data):
+        with app.app_context():
+            try:
+                results.append(services.write_upload_chunk(upload['upload_id'], 0, SlowStream(data))['offset'])
+            except UploadOffsetMismatch as e:
+                results.append(('409', e.offset))
+
+    # O cliente repete o primeiro bloco (mais curto) antes de a resposta ao original chegar
+    threads = [threading.Thread(target=put, args=(CONTENT[:20],)), threading.Thread(target=put, args=(CONTENT[:10],))]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.02)
+    for thread in threads:
+        thread.join()
+
+    assert sorted(results, key=str) == [('409', 20), 20]
+    received = db.session.get(Upload, upload['upload_id'])
+    with open(received.file_path, 'rb') as f:
+        assert f.read() == CONTENT[:20]
+
+
+def test_abandoned_uploads_expire(client):
+    upload = init_upload(client)
+    url = f"/api/uploads/{upload['upload_id']}"
+    hour_ago = datetime.utcnow() - timedelta(hours=1)
+    Upload.query.update({Upload.updated_at: hour_ago})
+    db.session.commit()
+
+    # Cada bloco conta como atividade
+    client.put(f"{url}?offset=0", data=CONTENT[:10])
+    assert expire_abandoned_uploads(ttl_hours=0.5) == 0
+
+    Upload.query.update({Upload.updated_at: hour_ago})
+    db.session.commit()
+    file_path = db.session.get(Upload, upload['upload_id']).file_path
+    assert expire_abandoned_uploads(ttl_hours=0.5) == 1
+
+    assert not os.path.exists(file_path)
+    assert db.session.get(Transcription, upload['transcription_id']).status.startswith("Erro no upload")
+    assert client.get(url).status_code == 404
+    assert client.put(f"{url}?offset=10", data=CONTENT[10:]).status_code == 404
@@ -0,0 +1,52 @@
+import signal
+import threading
+from wsgiref.simple_server import WSGIRequestHandler, make_server
+
+from app import create_app
+from app.jobs import start_worker_pool, stop_worker_pool
+from app.services import render_metrics
+from config import Config
+
+
+class WorkerConfig(Config):
+    # O pool é iniciado explicitamente abaixo
+    WORKER_AUTOSTART = False
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(app, port):
+    """Expõe /metrics deste processo (o Prometheus recolhe cada worker separadamente)."""
+    def metrics_app(environ, start_response):
+        if environ.get('PATH_INFO') != '/metrics':
+            start_response('404 Not Found', [('Content-Type', 'text/plain')])
+            return [b'Not Found']
+        with app.app_context():
+            body = render_metrics().encode('utf-8')
+        start_response('200 OK', [('Content-Type', 'text/plain; version=0.0.4; charset=utf-8'),
+                                  ('Content-Length', str(len(body)))])
+        return [body]
+
+    server = make_server('0.0.0.0', port, metrics_app, handler_class=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True, name='metrics').start()
+    print(f"Métricas do worker disponíveis em http://0.0.0.0:{port}/metrics")
+    return server
+
+
+if __name__ == '__main__':
+    # Processo dedicado aos jobs do pipeline. Use WORKER_AUTOSTART=false no servidor web
+    # e arranque quantas instâncias deste script forem necessárias.
+    app = create_app(WorkerConfig)
+    start_worker_pool(app)
+    metrics_server = start_metrics_server(app, Config.WORKER_METRICS_PORT) if Config.WORKER_METRICS_PORT else None
+
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
+    signal.signal(signal.SIGINT, lambda *_: stop_event.set())
+    stop_event.wait()
+    if metrics_server:
+        metrics_server.shutdown()
+    stop_worker_pool()